@@ -0,0 +1,60 @@
+'''
+Measures how long it takes to render a milestone certificate, and how long and how
+large each encoding is. Runs without any network access (the profile icon is a
+resized copy of the bundled fallback icon).
+'''
+import statistics
+import time
+from common import fmt_time
+from PIL import Image
+from img_gen import Certificate, Encoding
+from riot import UserInfo, Rank
+
+# Data Dragon profile icons are 128px, unlike the much larger fallback icon
+ICON = Image.open('assets/unknown.png').resize((128, 128))
+
+CASES = {
+    'short name': (UserInfo(summoner_name='Ahri', icon=1), Rank('GOLD', 'II', 42, 120, 130)),
+    'long name': (UserInfo(summoner_name='ThisIsAVeryLongName', icon=1), Rank('DIAMOND', 'IV', 3, 70, 30)),
+    'apex tier': (UserInfo(summoner_name='KAPPAMAC', icon=1), Rank('CHALLENGER', None, 999, 499, 1)),
+}
+
+ENCODINGS = {
+    'png 1': Encoding('png', compress_level=1),
+    'png 6': Encoding('png', compress_level=6),
+    'png 9': Encoding('png', compress_level=9),
+    'webp 80': Encoding('webp', quality=80),
+    'webp 90': Encoding('webp', quality=90),
+}
+
+
+def build(user: UserInfo, rank: Rank) -> tuple[Certificate, float]:
+    start = time.perf_counter()
+    cert = Certificate(user, rank, ICON)
+    cert.build_image()
+    return cert, time.perf_counter() - start
+
+
+def encode(cert: Certificate, encoding: Encoding) -> tuple[float, int]:
+    start = time.perf_counter()
+    data = cert.encode(encoding)
+    return time.perf_counter() - start, len(data)
+
+
+def main(repeat: int = 10):
+    print(f'{"case":>12} {"first":>10} {"build":>10}')
+    for name, (user, rank) in CASES.items():
+        first = build(user, rank)[1]
+        median = statistics.median(build(user, rank)[1] for _ in range(repeat))
+        print(f'{name:>12} {fmt_time(first):>10} {fmt_time(median):>10}')
+
+    cert = build(*CASES['short name'])[0]
+    print(f'\n{"encoding":>12} {"time":>10} {"size":>9}')
+    for name, encoding in ENCODINGS.items():
+        runs = [encode(cert, encoding) for _ in range(3)]
+        t = statistics.median(r[0] for r in runs)
+        print(f'{name:>12} {fmt_time(t):>10} {runs[0][1] / 1024:>7.0f}KB')
+
+
+if __name__ == '__main__':
+    main()
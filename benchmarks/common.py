@@ -0,0 +1,36 @@
+'''
+Shared setup for the benchmark scripts. Run them from the repository root,
+e.g. `python benchmarks/swaps.py`, so that relative asset paths resolve.
+'''
+import os
+import sys
+import tempfile
+import time
+from typing import Callable
+
+SRC_PATH = os.path.join(os.path.dirname(
+    os.path.dirname(os.path.abspath(__file__))), 'src')
+sys.path.insert(0, SRC_PATH)
+
+# Benchmarks never talk to Riot or Discord, but the bot's config needs these set
+os.environ.setdefault('RIOT_TOKEN', 'benchmark')
+os.environ.setdefault('DISCORD_TOKEN', 'benchmark')
+os.environ.setdefault('FILES_PATH', tempfile.mkdtemp(prefix='league-bot-'))
+
+
+def best_time(func: Callable[[], object], repeat: int = 5) -> float:
+    '''Returns the fastest of several runs of a function, in seconds'''
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def fmt_time(seconds: float) -> str:
+    if seconds < 1e-3:
+        return f'{seconds * 1e6:.1f}µs'
+    if seconds < 1:
+        return f'{seconds * 1e3:.2f}ms'
+    return f'{seconds:.2f}s'
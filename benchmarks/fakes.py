@@ -0,0 +1,181 @@
+'''
+Offline stand-ins for the Riot API, holding a seeded population of players whose
+games and ranks can be advanced between checks, and for Discord.
+'''
+import asyncio
+import io
+import random
+import time
+from collections import Counter
+from dataclasses import dataclass, replace
+from typing import List, Optional, Sequence
+from common import SRC_PATH  # noqa: F401 (adds src to the path)
+from discord import File
+from riot import RiotAPI, UserInfo, GameInfo, Rank
+from riot.structs import PlayerInfo, RANK_DIVISIONS, RANK_TIERS
+from riot.responses import APIResponse
+
+# Riot requests behind each RiotAPI method the event manager calls
+# (get_profile_info fetches the account, the summoner and the ranks)
+REQUEST_COST = {'get_profile_info': 3,
+                'get_matches_ids_by_puuid': 1,
+                'get_match_info_by_id': 1}
+
+HISTORY_LENGTH = 20
+GAME_DURATION = 30 * 60
+# When the population's existing histories end, in milliseconds like Riot's timestamps
+START_TIME = 1716000000000
+CHAMPIONS = [('Ahri', 103), ('Lux', 99), ('Jinx', 222), ('Garen', 86), ('Thresh', 412)]
+
+# Placement in the tiers below apex, from lowest to highest
+LADDER = [(division, tier) for division in RANK_DIVISIONS[1:8]
+          for tier in RANK_TIERS[1:]]
+
+
+def shift_lp(rank: Rank, lp: int, won: bool) -> Rank:
+    '''Adds (or removes) LP, promoting or demoting the player through tiers and divisions'''
+    wins, losses = rank.wins + won, rank.losses + (not won)
+    if rank.tier is None:
+        return Rank(rank.division, None, max(rank.lp + lp, 0), wins, losses)
+
+    step = LADDER.index((rank.division, rank.tier))
+    total = step * 100 + rank.lp + lp
+    if total >= len(LADDER) * 100:
+        return Rank('MASTER', None, total - len(LADDER) * 100, wins, losses)
+    step, new_lp = divmod(max(total, 0), 100)
+    division, tier = LADDER[step]
+    return Rank(division, tier, new_lp, wins, losses)
+
+
+class FakeRiotAPI(RiotAPI):
+    '''
+    Answers the event manager's requests from memory and counts them. Responses skip
+    the real client's cache and rate limiter, so every call is counted as a request
+    that would have been sent.
+    '''
+    calls: Counter[str]
+
+    def __init__(self, players: int, seed: int = 0) -> None:
+        self.rnd = random.Random(seed)
+        self.calls = Counter()
+        self.users: dict[str, UserInfo] = {}
+        self.games: dict[str, GameInfo] = {}
+        self.history: dict[str, List[str]] = {}
+        self.time = START_TIME
+
+        for i in range(players):
+            puuid = f'puuid-{i:074d}'
+            division, tier = self.rnd.choice(LADDER)
+            solo = Rank(division, tier, self.rnd.randint(0, 99),
+                        self.rnd.randint(10, 300), self.rnd.randint(10, 300))
+            flex = Rank.unranked() if self.rnd.random() < 0.6 else \
+                Rank(*self.rnd.choice(LADDER), self.rnd.randint(0, 99),
+                     self.rnd.randint(1, 50), self.rnd.randint(1, 50))
+            self.users[puuid] = UserInfo(
+                id=f'summoner-{i}', puuid=puuid, summoner_name=f'Player{i}',
+                summoner_tag='EUW', level=self.rnd.randint(30, 500), icon=1,
+                ranks={'Solo/Duo': solo, 'Flex': flex})
+            self.history[puuid] = []
+            for g in range(HISTORY_LENGTH, 0, -1):
+                start = START_TIME - g * 2 * GAME_DURATION * 1000 - \
+                    self.rnd.randint(0, GAME_DURATION * 1000)
+                self.add_match([puuid], self.rnd.random() < 0.5,
+                               start, GAME_DURATION)
+
+    @property
+    def requests(self) -> int:
+        return sum(REQUEST_COST[name] * count for name, count in self.calls.items())
+
+    def add_match(self, team: List[str], won: bool, start: int, duration: int) -> GameInfo:
+        '''Adds a game played by players on the same team to their histories, newest first'''
+        participants = []
+        for puuid in team:
+            user = self.users[puuid]
+            champion, champion_id = self.rnd.choice(CHAMPIONS)
+            participants.append(PlayerInfo(
+                user.id, user.summoner_name, self.rnd.randint(0, 15), self.rnd.randint(0, 12),
+                self.rnd.randint(0, 20), champion, champion_id, 12000, 20000,
+                180, 25, 'Blue', [1, 0, 0, 0], 'MIDDLE'))
+        game = GameInfo(f'EUW1_{len(self.games)}', start, duration,
+                        'Blue' if won else 'Red', participants, 'Solo/Duo')
+        self.games[game.id] = game
+        for puuid in team:
+            self.history[puuid].insert(0, game.id)
+            del self.history[puuid][HISTORY_LENGTH:]
+        return game
+
+    def record_result(self, puuid: str, won: bool) -> Rank:
+        '''Moves a player's solo rank after a game, like the ranked ladder would'''
+        user = self.users[puuid]
+        lp = self.rnd.randint(15, 25) * (1 if won else -1)
+        rank = shift_lp(user.ranks['Solo/Duo'], lp, won)
+        self.users[puuid] = replace(user, ranks=user.ranks | {'Solo/Duo': rank})
+        return rank
+
+    def play(self, fraction: float, max_games: int = 3) -> int:
+        '''Has a fraction of the players play some ranked games. Returns how many were played'''
+        played = 0
+        for puuid in self.rnd.sample(list(self.users), int(len(self.users) * fraction)):
+            for _ in range(self.rnd.randint(1, max_games)):
+                won = self.rnd.random() < 0.5
+                self.add_match([puuid], won, self.time, GAME_DURATION)
+                self.time += GAME_DURATION * 1000
+                self.record_result(puuid, won)
+                played += 1
+        return played
+
+    async def get_profile_info(self, puuid: str) -> APIResponse[UserInfo]:
+        self.calls['get_profile_info'] += 1
+        if puuid not in self.users:
+            return APIResponse(404)
+        return APIResponse(data=replace(self.users[puuid]))
+
+    async def get_matches_ids_by_puuid(self, puuid: str, count: int = 20, start: int = 0, type=None) -> APIResponse[List[str]]:
+        self.calls['get_matches_ids_by_puuid'] += 1
+        if puuid not in self.history:
+            return APIResponse(404)
+        return APIResponse(data=self.history[puuid][start:start + count])
+
+    async def get_match_info_by_id(self, match_id: str):
+        self.calls['get_match_info_by_id'] += 1
+        return self.games.get(match_id)
+
+
+@dataclass
+class SentMessage:
+    channel_id: int
+    sent: float
+    embeds: int
+    files: int
+    file_bytes: int
+
+
+class FakeChannel:
+    def __init__(self, channel_id: int, discord: 'FakeDiscord') -> None:
+        self.id = channel_id
+        self.discord = discord
+
+    async def send(self, content: Optional[str] = None, embeds: Sequence[object] = (),
+                   files: Sequence[File] = (), view: object = None) -> None:
+        await asyncio.sleep(self.discord.latency)
+        self.discord.sent.append(SentMessage(
+            self.id, time.perf_counter(), len(embeds), len(files),
+            sum(len(f.fp.getbuffer()) for f in files if isinstance(f.fp, io.BytesIO))))
+
+
+class FakeDiscord:
+    '''Takes the bot's place in Delivery, recording messages instead of sending them'''
+    sent: List[SentMessage]
+
+    def __init__(self, latency: float = 0.0) -> None:
+        self.latency = latency
+        self.sent = []
+        self.channels: dict[int, FakeChannel] = {}
+
+    def get_channel(self, channel_id: int) -> FakeChannel:
+        if channel_id not in self.channels:
+            self.channels[channel_id] = FakeChannel(channel_id, self)
+        return self.channels[channel_id]
+
+    async def fetch_channel(self, channel_id: int) -> FakeChannel:
+        return self.get_channel(channel_id)
@@ -0,0 +1,212 @@
+'''
+Renders milestone certificates for every division and for short, long, wide and
+non-Latin names, and checks them against the golden images in benchmarks/golden.
+Also reports how long each one takes to build and encode, and how large it is.
+Icons come from the bundled fallback icon, so nothing is downloaded.
+
+    python benchmarks/golden_images.py            # Compare against the golden images
+    python benchmarks/golden_images.py --update   # Accept the current renders as golden
+
+Exits with 1 if any render doesn't match its golden image, and writes the render
+and a diff highlighting what changed next to each other for inspection. Names that
+need a font missing from this machine are reported as known failures instead.
+'''
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from dataclasses import dataclass
+from typing import List, Optional
+from common import fmt_time
+from PIL import Image, ImageChops
+from img_gen import Certificate, Encoding, assets
+from riot import UserInfo, Rank
+from riot.structs import RankOption, TierOption
+
+GOLDEN_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'golden')
+
+# Golden images are kept at half size, which is plenty to catch a misplaced or
+# missing element while keeping the repository small and ignoring tiny differences
+# in anti-aliasing between FreeType versions
+GOLDEN_SCALE = 0.5
+# A pixel has changed if any channel moved by more than this
+PIXEL_TOLERANCE = 24
+# A render matches if at most this many pixels changed. It's a count rather than a share
+# of the image, since a single changed digit of the LP only changes about 60 pixels
+CHANGED_TOLERANCE = 16
+
+ENCODINGS = {'png': Encoding('png'), 'webp': Encoding('webp')}
+
+# Icons from Data Dragon are 128px
+ICON = Image.open('assets/unknown.png').resize((128, 128))
+
+
+@dataclass(frozen=True)
+class Variant:
+    name: str
+    summoner_name: str
+    division: RankOption
+    tier: Optional[TierOption] = 'II'
+    wins: int = 60
+    losses: int = 40
+
+    def known_failure(self) -> Optional[str]:
+        '''Why this render can't match its golden image on this machine, if it can't'''
+        if assets.is_cjk(self.summoner_name) and assets.cjk_font_file() is None:
+            return 'no CJK font installed'
+        return None
+
+    def certificate(self) -> Certificate:
+        return Certificate(UserInfo(summoner_name=self.summoner_name, icon=1),
+                           Rank(self.division, self.tier, 42, self.wins, self.losses), ICON)
+
+
+# Winrates alternate between the green, yellow and red bands
+DIVISIONS: List[tuple[RankOption, Optional[TierOption], int]] = [
+    ('IRON', 'IV', 30), ('BRONZE', 'III', 45), ('SILVER', 'II', 65),
+    ('GOLD', 'I', 30), ('PLATINUM', 'IV', 45), ('EMERALD', 'III', 65),
+    ('DIAMOND', 'II', 30), ('MASTER', None, 45), ('GRANDMASTER', None, 65),
+    ('CHALLENGER', None, 30)]
+
+# Korean and Japanese names are drawn with the CJK fallback font, see assets.CJK_FONT_FILES
+NAMES = {
+    'short': 'Ahri',
+    'typical': 'Doublelift',
+    'long': 'ThisIsAVeryLongN',
+    'wide': 'WWWWWWWWWWWWWWWW',
+    'accents': 'Zoë Ñandú',
+    'greek': 'Αθηνά',
+    'korean': '페이커',
+    'japanese': 'プレイヤー',
+}
+
+VARIANTS = [Variant(division.lower(), 'Doublelift', division, tier, wins, 100 - wins)
+            for division, tier, wins in DIVISIONS] + \
+    [Variant(f'name-{label}', name, 'GOLD') for label, name in NAMES.items()]
+
+
+@dataclass
+class Result:
+    variant: Variant
+    build: float
+    encode: dict[str, tuple[float, int]]
+    changed: Optional[int] = None
+    problem: Optional[str] = None
+    known: bool = False
+
+
+def golden_file(variant: Variant) -> str:
+    return os.path.join(GOLDEN_PATH, f'{variant.name}.png')
+
+
+def to_golden(im: Image.Image) -> Image.Image:
+    size = (round(im.width * GOLDEN_SCALE), round(im.height * GOLDEN_SCALE))
+    return im.convert('RGB').resize(size, Image.Resampling.LANCZOS)
+
+
+def difference(actual: Image.Image, golden: Image.Image) -> Image.Image:
+    '''The largest change of any channel at every pixel'''
+    r, g, b = ImageChops.difference(actual, golden).split()
+    return ImageChops.lighter(ImageChops.lighter(r, g), b)
+
+
+def changed_pixels(diff: Image.Image) -> int:
+    return sum(diff.histogram()[PIXEL_TOLERANCE + 1:])
+
+
+def render(variant: Variant, repeat: int) -> tuple[Certificate, Result]:
+    builds = []
+    for _ in range(repeat):
+        cert = variant.certificate()
+        start = time.perf_counter()
+        cert.build_image()
+        builds.append(time.perf_counter() - start)
+
+    encode = {}
+    for name, encoding in ENCODINGS.items():
+        runs = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            data = cert.encode(encoding)
+            runs.append(time.perf_counter() - start)
+        encode[name] = (statistics.median(runs), len(data))
+    return cert, Result(variant, statistics.median(builds), encode)
+
+
+def check(cert: Certificate, result: Result, failures: str) -> None:
+    actual = to_golden(cert.im)
+    file = golden_file(result.variant)
+    if not os.path.exists(file):
+        result.problem = 'no golden image'
+        return
+
+    golden = Image.open(file).convert('RGB')
+    if golden.size != actual.size:
+        result.problem = f'size {actual.size} != {golden.size}'
+        return
+
+    diff = difference(actual, golden)
+    result.changed = changed_pixels(diff)
+    if result.changed <= CHANGED_TOLERANCE:
+        return
+
+    result.problem = 'changed'
+    actual.save(os.path.join(failures, f'{result.variant.name}-actual.png'))
+    diff.point(lambda v: 255 if v > PIXEL_TOLERANCE else v * 4) \
+        .save(os.path.join(failures, f'{result.variant.name}-diff.png'))
+
+
+def print_result(r: Result) -> None:
+    status = 'known' if r.known else \
+        'updated' if r.problem is None and r.changed is None else \
+        'ok' if r.problem is None else 'FAIL'
+    changed = str(r.changed) if r.changed is not None else '-'
+    print(f'{r.variant.name:>16} {fmt_time(r.build):>10} '
+          + ' '.join(f'{fmt_time(t):>10} {size / 1024:>6.0f}KB' for t, size in r.encode.values())
+          + f' {changed:>8} {status:>8}' + (f' ({r.problem})' if r.problem else ''))
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0],
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--update', action='store_true',
+                        help='Write the current renders as the golden images')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='Runs to take the median time of')
+    parser.add_argument('--failures', help='Where to write renders that changed, and their diffs')
+    args = parser.parse_args(argv)
+
+    failures = args.failures or tempfile.mkdtemp(prefix='golden-failures-')
+    os.makedirs(failures, exist_ok=True)
+    os.makedirs(GOLDEN_PATH, exist_ok=True)
+
+    print(f'{"variant":>16} {"build":>10} '
+          + ' '.join(f'{name:>10} {"size":>8}' for name in ENCODINGS)
+          + f' {"changed":>8} {"result":>8}')
+    failed = known = 0
+    for variant in VARIANTS:
+        cert, result = render(variant, args.repeat)
+        if reason := variant.known_failure():
+            # Keep the golden image, it was rendered on a machine that has the font
+            result.problem, result.known = reason, True
+            known += 1
+        elif args.update:
+            to_golden(cert.im).save(golden_file(variant), optimize=True)
+        else:
+            check(cert, result, failures)
+            failed += result.problem is not None
+        print_result(result)
+
+    if known:
+        print(f'\n{known} certificates are known to fail on this machine and weren\'t checked')
+
+    if failed:
+        print(f'\n{failed} of {len(VARIANTS)} certificates differ from their golden image, '
+              f'renders and diffs are in {failures}')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
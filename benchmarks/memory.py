@@ -0,0 +1,97 @@
+'''
+Measures how much memory the event manager's player memory takes up for large
+numbers of tracked players, compared with the original layout: a dict per player
+holding its own copies of plain Rank dataclasses.
+'''
+import gc
+import random
+import sys
+import tracemalloc
+from dataclasses import dataclass, replace
+from typing import Callable, Optional
+from common import SRC_PATH  # noqa: F401 (adds src to the path)
+from riot import Rank
+from riot.structs import RANK_DIVISIONS, RankOption, TierOption
+from event_manager import Memory
+
+
+@dataclass
+class LegacyRank:
+    '''Rank as it was before player memory was slotted: a plain dataclass with a __dict__'''
+    division: RankOption
+    tier: Optional[TierOption]
+    lp: int
+    wins: int
+    losses: int
+
+
+def random_ranks(rnd: random.Random, rank: type = Rank):
+    division = rnd.choice(RANK_DIVISIONS[1:8])
+    return {
+        'Solo/Duo': rank(division, rnd.choice(['I', 'II', 'III', 'IV']),
+                         rnd.randint(0, 99), rnd.randint(0, 500), rnd.randint(0, 500)),
+        'Flex': rank('UNRANKED', None, 0, 0, 0)
+    }
+
+
+def slotted_memory(n: int):
+    rnd = random.Random(0)
+    memory = {}
+    for i in range(n):
+        puuid = sys.intern(f'puuid-{i:074d}')
+        memory[puuid] = Memory(
+            last_game=f'EUW1_{7000000000 + i}',
+            last_played=1716000000000 + i,
+            lose_streak=rnd.randint(0, 4),
+            ranks=random_ranks(rnd),
+            level=rnd.randint(30, 500),
+            name=sys.intern(f'Player{i}'),
+            tag=sys.intern('EUW'))
+    return memory
+
+
+def legacy_memory(n: int):
+    '''
+    The original layout: a dict per player, with the ranks copied out of the user
+    like remember_history did, and no interning
+    '''
+    rnd = random.Random(0)
+    memory = {}
+    for i in range(n):
+        ranks = random_ranks(rnd, LegacyRank)
+        memory[f'puuid-{i:074d}'] = {
+            'last_game': f'EUW1_{7000000000 + i}',
+            'last_played': 1716000000000 + i,
+            'lose_streak': rnd.randint(0, 4),
+            'ranks': {
+                'Solo/Duo': replace(ranks['Solo/Duo']),
+                'Flex': replace(ranks['Flex'])
+            },
+            'level': rnd.randint(30, 500),
+            'name': f'Player{i}',
+            'tag': 'EUW'.lower().upper()
+        }
+    return memory
+
+
+def measure(build: Callable[[int], object], n: int) -> int:
+    gc.collect()
+    tracemalloc.start()
+    kept = build(n)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del kept
+    return size
+
+
+def main():
+    print(f'{"players":>8} {"slotted":>12} {"legacy":>12} {"saving":>8}')
+    for n in [1_000, 10_000, 100_000]:
+        slotted = measure(slotted_memory, n)
+        legacy = measure(legacy_memory, n)
+        print(f'{n:>8} {slotted / 2**20:>10.1f}MB {legacy / 2**20:>10.1f}MB '
+              f'{1 - slotted / legacy:>7.0%}')
+
+
+if __name__ == '__main__':
+    main()
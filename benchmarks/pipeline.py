@@ -0,0 +1,239 @@
+'''
+Benchmarks the announcement pipeline end to end against a fake Riot API: the first
+check that remembers every player, a later check after some players have played,
+the leaderboard overtakes, rendering the leaderboards and writing the persistent memory.
+
+Every stage reports its wall time, the Riot requests it would have sent, its peak
+memory and the memory blocks it left allocated. Timings are the best of a few runs
+without tracemalloc, since tracing allocations slows everything down, and memory
+comes from one more, identical run with it.
+
+    python benchmarks/pipeline.py                      # 100, 1k and 10k players
+    python benchmarks/pipeline.py --players 1000 --output before.json
+    python benchmarks/pipeline.py --compare before.json after.json
+'''
+import argparse
+import asyncio
+import gc
+import json
+import math
+import platform
+import sys
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from typing import Awaitable, Callable, List, Optional
+from common import fmt_time
+from fakes import FakeRiotAPI
+from event_manager import CycleSnapshot, EventManager
+from storage import TrackPlayer
+from utils import flat
+import embed_generator
+import logs
+import storage
+
+GUILD_ID = 1
+CHANNEL_ID = 2
+# The share of players who play between the first and the second check
+ACTIVE_PLAYERS = 0.2
+PLAYER_COUNTS = [100, 1_000, 10_000]
+
+
+@dataclass
+class StageResult:
+    stage: str
+    seconds: float
+    requests: int = 0
+    peak_bytes: int = 0
+    retained_bytes: int = 0
+    retained_blocks: int = 0
+    items: int = 0
+
+
+type Stage = Callable[[], Awaitable[int]]
+
+
+class Pipeline:
+    '''One population of players going through the stages of the pipeline in order'''
+
+    def __init__(self, players: int) -> None:
+        self.riot = FakeRiotAPI(players)
+        self.events = EventManager(self.riot)
+        self.puuids = list(self.riot.users)
+        self.tracked: dict[int, List[TrackPlayer]] = {GUILD_ID: [
+            {'puuid': u.puuid, 'name': u.summoner_name, 'tag': u.summoner_tag,
+             'level': u.level, 'claimed_users': set()}
+            for u in self.riot.users.values()]}
+        self.snapshot = CycleSnapshot()
+
+    def stages(self) -> List[tuple[str, Stage]]:
+        return [('first_check', self.first_check),
+                ('check', self.check),
+                ('leaderboard_events', self.leaderboard_events),
+                ('leaderboard_embeds', self.leaderboard_embeds),
+                ('leaderboard_text', self.leaderboard_text),
+                ('storage_write', self.storage_write)]
+
+    async def first_check(self) -> int:
+        '''Remembers every player, which scans their histories'''
+        return len(await self.events.check(self.puuids, GUILD_ID, quiet=True))
+
+    async def check(self) -> int:
+        '''The players' part of EventManager.check, once some of them have played'''
+        self.riot.play(ACTIVE_PLAYERS)
+        self.snapshot = CycleSnapshot()
+        return len(flat(await asyncio.gather(*[self.events.check_user(p, self.snapshot)
+                                               for p in self.puuids])))
+
+    async def leaderboard_events(self) -> int:
+        '''The rest of EventManager.check, reusing what the players' checks fetched'''
+        return sum([len(await self.events.get_leaderboard_events(GUILD_ID, mode, self.snapshot))
+                    for mode in ('Solo/Duo', 'Flex')])
+
+    async def leaderboard_embeds(self) -> int:
+        '''Renders every page of the ranked leaderboard, as if paged through'''
+        size = embed_generator.LEADERBOARD_PAGE_SIZE
+        ladder = self.events.get_ladder(GUILD_ID, 'Solo/Duo')
+        pages = math.ceil(self.events.leaderboards.size(GUILD_ID, 'Solo/Duo') / size)
+        for page in range(pages):
+            embed_generator.leaderboard(
+                'Solo/Duo', self.events.get_ordered_rankings(GUILD_ID, 'Solo/Duo', size, page * size),
+                self.tracked[GUILD_ID], ladder, page, pages)
+        return pages
+
+    async def leaderboard_text(self) -> int:
+        '''Renders every page of the text leaderboards, by rank and by games played'''
+        size = embed_generator.TEXT_PAGE_SIZE
+        pages = math.ceil(self.events.leaderboards.size(GUILD_ID, 'Solo/Duo') / size)
+        for page in range(pages):
+            embed_generator.leaderboard_string(
+                'Solo/Duo', self.events.get_ordered_rankings(GUILD_ID, 'Solo/Duo', size, page * size),
+                self.tracked[GUILD_ID], page, pages)
+            embed_generator.total_games_string(
+                'Solo/Duo', self.events.get_ordered_total_games(GUILD_ID, 'Solo/Duo', size, page * size),
+                self.tracked[GUILD_ID], page, pages)
+        return pages * 2
+
+    async def storage_write(self) -> int:
+        storage.write(self.tracked, {GUILD_ID: CHANNEL_ID})
+        return len(self.tracked[GUILD_ID])
+
+
+async def run_stages(players: int, trace_memory: bool) -> List[StageResult]:
+    pipeline = Pipeline(players)
+    results = []
+    for name, stage in pipeline.stages():
+        gc.collect()
+        requests = pipeline.riot.requests
+        if trace_memory:
+            tracemalloc.start()
+            before = tracemalloc.get_traced_memory()[0]
+            blocks = sys.getallocatedblocks()
+
+        start = time.perf_counter()
+        items = await stage()
+        result = StageResult(name, time.perf_counter() - start,
+                             pipeline.riot.requests - requests, items=items)
+
+        if trace_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            result.peak_bytes = peak - before
+            result.retained_bytes = current - before
+            result.retained_blocks = sys.getallocatedblocks() - blocks
+        results.append(result)
+    return results
+
+
+def measure(players: int, repeat: int) -> List[StageResult]:
+    # Populations are seeded, so every run goes through exactly the same work
+    runs = [asyncio.run(run_stages(players, trace_memory=False))
+            for _ in range(repeat)]
+    traced = asyncio.run(run_stages(players, trace_memory=True))
+    for i, m in enumerate(traced):
+        m.seconds = min(run[i].seconds for run in runs)
+    return traced
+
+
+def fmt_bytes(n: float) -> str:
+    if abs(n) < 2**20:
+        return f'{n / 2**10:.1f}KB'
+    return f'{n / 2**20:.1f}MB'
+
+
+def print_results(players: int, results: List[StageResult]) -> None:
+    print(f'\n{num(players)} players')
+    print(f'{"stage":>20} {"time":>10} {"requests":>9} {"peak":>9} {"retained":>9} {"blocks":>9} {"items":>7}')
+    for r in results:
+        print(f'{r.stage:>20} {fmt_time(r.seconds):>10} {r.requests:>9} {fmt_bytes(r.peak_bytes):>9} '
+              f'{fmt_bytes(r.retained_bytes):>9} {r.retained_blocks:>9} {r.items:>7}')
+
+
+def num(n: int) -> str:
+    return f'{n // 1000}k' if n >= 1000 and n % 1000 == 0 else str(n)
+
+
+def load(path: str) -> dict[str, dict[str, dict]]:
+    '''Reads a results file as {players: {stage: result}}'''
+    with open(path) as f:
+        data = json.load(f)
+    return {players: {r['stage']: r for r in results}
+            for players, results in data['results'].items()}
+
+
+def change(old: float, new: float) -> str:
+    if old == new:
+        return '='
+    if old == 0:
+        return 'new'
+    return f'{(new - old) / old:+.0%}'
+
+
+def compare(baseline_path: str, current_path: str) -> None:
+    baseline, current = load(baseline_path), load(current_path)
+    print(f'{"players":>8} {"stage":>20} {"time":>21} {"requests":>15} {"peak":>21}')
+    for players, stages in current.items():
+        for stage, new in stages.items():
+            old = baseline.get(players, {}).get(stage)
+            if old is None:
+                continue
+            print(f'{num(int(players)):>8} {stage:>20} '
+                  f'{fmt_time(new['seconds']):>10} {change(old['seconds'], new['seconds']):>10} '
+                  f'{new['requests']:>8} {change(old['requests'], new['requests']):>6} '
+                  f'{fmt_bytes(new['peak_bytes']):>10} {change(old['peak_bytes'], new['peak_bytes']):>10}')
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0],
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--players', type=int, nargs='+', default=PLAYER_COUNTS)
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Runs to take the best time of')
+    parser.add_argument('--output', help='Where to write the results as JSON')
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'CURRENT'),
+                        help='Compares two results files instead of running the benchmark')
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    # Only the benchmark's own output should be printed
+    logs.configure('ERROR')
+    results = {}
+    for players in args.players:
+        results[players] = measure(players, args.repeat)
+        print_results(players, results[players])
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'created': datetime.now().isoformat(timespec='seconds'),
+                       'python': platform.python_version(),
+                       'results': {str(n): [asdict(r) for r in rs] for n, rs in results.items()}},
+                      f, indent=2)
+        print(f'\nWrote results to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,284 @@
+'''
+Load-tests the bot by simulating days of League activity in minutes. A population of
+players spread across guilds plays sessions of ranked games (sometimes as a duo with a
+guildmate), winning and losing LP, getting promoted and reaching milestones. Every
+simulated 5 minutes the automatic check runs the real event manager, announcement
+building and delivery against a fake Riot API and a fake Discord.
+
+Reports how fast the checks run, how much of the Riot API key's budget they need, and
+how long announcements take from the end of a game to the message being sent.
+
+    python benchmarks/simulate.py --players 1000 --days 1
+    python benchmarks/simulate.py --players 10000 --days 0.25 --guilds 20
+'''
+import argparse
+import asyncio
+import math
+import os
+import random
+import time
+from collections import Counter
+from dataclasses import dataclass
+from typing import List, Optional
+from common import fmt_time
+from fakes import FakeDiscord, FakeRiotAPI, START_TIME
+from PIL import Image
+from announcements import build_messages
+from delivery import Delivery
+from event_manager import EventManager
+from img_gen import icons
+from main import CHECK_INTERVAL
+from riot.rate_limiting import rate_limit_info
+from storage import DigestMode, TrackPlayer
+from tracing import percentile
+import logs
+import tracing
+
+DAY = 24 * 60 * 60 * 1000
+# Share of a guild's players who claimed their profile, and get mentioned
+CLAIMED_PLAYERS = 0.3
+
+
+@dataclass
+class Session:
+    team: List[str]
+    games_left: int
+    game_start: int
+    game_duration: int
+
+
+class Timeline:
+    '''Decides when players play, and plays their games out on the fake API as simulated time passes'''
+
+    def __init__(self, riot: FakeRiotAPI, guilds: List[List[str]], sessions_per_day: float,
+                 duo_chance: float, seed: int) -> None:
+        self.riot = riot
+        self.guilds = guilds
+        self.guild_of = {p: g for g, puuids in enumerate(guilds) for p in puuids}
+        self.sessions_per_day = sessions_per_day
+        self.duo_chance = duo_chance
+        self.rnd = random.Random(seed)
+        self.sessions: List[Session] = []
+        self.busy: set[str] = set()
+        self.games_played = 0
+        self.shared_games = 0
+
+    def activity(self, now: int) -> float:
+        '''More players are on in the evening than at night, averaging to 1 over a day'''
+        hour = now % DAY / (60 * 60 * 1000)
+        return 1 + 0.75 * math.cos(2 * math.pi * (hour - 21) / 24)
+
+    def game_duration(self) -> int:
+        return self.rnd.randint(20, 40) * 60
+
+    def start_sessions(self, now: int, step: int) -> None:
+        chance = self.sessions_per_day * step / DAY * self.activity(now)
+        for puuid in self.riot.users:
+            if puuid in self.busy or self.rnd.random() >= chance:
+                continue
+
+            team = [puuid]
+            if self.rnd.random() < self.duo_chance:
+                friend = self.rnd.choice(self.guilds[self.guild_of[puuid]])
+                if friend != puuid and friend not in self.busy:
+                    team.append(friend)
+            self.busy.update(team)
+            self.sessions.append(Session(team, self.rnd.randint(1, 5),
+                                         now - self.rnd.randint(0, step), self.game_duration()))
+
+    def finish_games(self, now: int) -> None:
+        for session in self.sessions:
+            while session.games_left and session.game_start + session.game_duration * 1000 <= now:
+                won = self.rnd.random() < 0.5
+                self.riot.add_match(session.team, won, session.game_start,
+                                    session.game_duration)
+                for puuid in session.team:
+                    self.riot.record_result(puuid, won)
+                self.games_played += 1
+                self.shared_games += len(session.team) > 1
+
+                session.games_left -= 1
+                session.game_start += (session.game_duration +
+                                       self.rnd.randint(2, 6) * 60) * 1000
+                session.game_duration = self.game_duration()
+
+        for session in self.sessions:
+            if not session.games_left:
+                self.busy.difference_update(session.team)
+        self.sessions = [s for s in self.sessions if s.games_left]
+
+    def advance(self, now: int, step: int) -> None:
+        self.start_sessions(now - step, step)
+        self.finish_games(now)
+
+
+@dataclass
+class CycleStats:
+    players: int
+    requests: int
+    events: int
+    check_seconds: float
+    delivery_seconds: float
+
+
+class Simulation:
+    def __init__(self, players: int, guilds: int, digest_mode: DigestMode, send_latency: float,
+                 sessions_per_day: float, duo_chance: float, seed: int) -> None:
+        rnd = random.Random(seed)
+        self.riot = FakeRiotAPI(players, seed)
+        self.events = EventManager(self.riot)
+        self.discord = FakeDiscord(send_latency)
+        self.delivery = Delivery(self.discord)  # type: ignore
+        self.digest_mode = digest_mode
+
+        puuids = list(self.riot.users)
+        self.guilds = [puuids[g::guilds] for g in range(guilds)]
+        self.tracked: dict[int, List[TrackPlayer]] = {}
+        self.channels: dict[int, int] = {}
+        for g, members in enumerate(self.guilds):
+            guild_id = g + 1
+            self.channels[guild_id] = 1000 + guild_id
+            self.tracked[guild_id] = [
+                {'puuid': p, 'name': self.riot.users[p].summoner_name, 'tag': 'EUW', 'level': 30,
+                 'claimed_users': {rnd.randint(1, 10**17)} if rnd.random() < CLAIMED_PLAYERS else set()}
+                for p in members]
+
+        self.timeline = Timeline(self.riot, self.guilds, sessions_per_day,
+                                 duo_chance, seed)
+        self.now = START_TIME
+        self.cycles: List[CycleStats] = []
+        self.event_types: Counter[str] = Counter()
+        self.latencies: List[float] = []
+        self.phases: Counter[str] = Counter()
+
+    async def check(self, name: str) -> tuple[CycleStats, List]:
+        '''One automatic check: every guild is checked and its announcements handed to delivery'''
+        requests = self.riot.requests
+        start = time.perf_counter()
+        found = []
+        with tracing.cycle(name) as trace:
+            for guild_id, channel_id in self.channels.items():
+                events = await self.events.check([p['puuid'] for p in self.tracked[guild_id]], guild_id)
+                found += events
+                if events:
+                    messages = await build_messages(events, self.tracked[guild_id], self.digest_mode)
+                    await self.delivery.enqueue(channel_id, messages)
+            checked = time.perf_counter()
+            await self.delivery.join()
+        done = time.perf_counter()
+
+        for s in trace.stats():
+            self.phases[s.phase] += s.total
+        return CycleStats(len(self.riot.users), self.riot.requests - requests, len(found),
+                          checked - start, done - checked), found
+
+    async def run(self, days: float) -> None:
+        # The first check only remembers everyone, like when the bot starts up
+        self.startup = (await self.check('startup'))[0]
+
+        step = CHECK_INTERVAL * 1000
+        for _ in range(int(days * DAY / step)):
+            self.now += step
+            self.timeline.advance(self.now, step)
+            stats, events = await self.check('automatic check')
+            self.cycles.append(stats)
+
+            for e in events:
+                self.event_types[type(e).__name__] += 1
+                # Rank changes found without a new game have no game to measure from
+                if e.game.start_time:
+                    ended = e.game.start_time + e.game.duration * 1000
+                    self.latencies.append((self.now - ended) / 1000 +
+                                          stats.check_seconds + stats.delivery_seconds)
+
+
+def seed_icons() -> None:
+    '''Puts the simulated players' profile icon in the icon cache, so nothing is downloaded'''
+    os.makedirs(icons.icons_path, exist_ok=True)
+    Image.open(icons.FALLBACK_ICON).resize((128, 128)).save(icons.cached_icon_path(1))
+
+
+def fmt_minutes(seconds: float) -> str:
+    return f'{seconds / 60:.1f}min' if seconds >= 60 else f'{seconds:.1f}s'
+
+
+def report(sim: Simulation, days: float, wall: float) -> None:
+    cycles = sim.cycles
+    timeline = sim.timeline
+    sent = sim.discord.sent
+    print(f'\nSimulated {days:g} days ({len(cycles)} checks) of {len(sim.riot.users)} players '
+          f'in {len(sim.guilds)} guilds in {fmt_minutes(wall)}, {days / (wall / 60):.2f} days per minute')
+    print(f'  {timeline.games_played} games played ({timeline.shared_games} by duos), '
+          f'{sum(c.events for c in cycles)} announcements in {len(sent)} messages '
+          f'({sum(m.embeds for m in sent)} embeds, {sum(m.files for m in sent)} images, '
+          f'{sum(m.file_bytes for m in sent) / 2**20:.1f}MB)')
+    for name, count in sim.event_types.most_common():
+        print(f'    {name}: {count}')
+
+    if not cycles:
+        return
+    check_times = sorted(c.check_seconds for c in cycles)
+    delivery_times = sorted(c.delivery_seconds for c in cycles)
+    checked = sum(c.players for c in cycles)
+    print('\nThroughput')
+    print(f'  startup check: {fmt_time(sim.startup.check_seconds)}, {sim.startup.requests} requests')
+    print(f'  check: p50 {fmt_time(percentile(check_times, 0.5))}, p95 {fmt_time(percentile(check_times, 0.95))}, '
+          f'max {fmt_time(check_times[-1])} of the {CHECK_INTERVAL}s interval')
+    print(f'  delivery: p50 {fmt_time(percentile(delivery_times, 0.5))}, max {fmt_time(delivery_times[-1])}')
+    print(f'  {checked / sum(check_times):.0f} player checks/s, '
+          f'{sum(c.events for c in cycles) / wall:.1f} announcements/s')
+    print('  time by phase: ' + ', '.join(
+        f'{phase} {fmt_time(total)}' for phase, total in sim.phases.most_common(6)))
+
+    # The fake API isn't rate limited, so the budget is worked out from the real limiter
+    limit = rate_limit_info['api']
+    budget = limit['max_calls'] * CHECK_INTERVAL / limit['time_window']
+    requests = sorted(c.requests for c in cycles)
+    mean = sum(requests) / len(requests)
+    over = sum(r > budget for r in requests)
+    print(f'\nRiot API budget ({limit["max_calls"]} requests per {limit["time_window"]}s, '
+          f'{budget:.0f} per check)')
+    print(f'  requests per check: mean {mean:.0f} ({mean / budget:.0%}), '
+          f'p95 {percentile(requests, 0.95)}, max {requests[-1]} ({requests[-1] / budget:.0%})')
+    print(f'  startup needs {sim.startup.requests / budget:.1f} checks worth of budget, '
+          f'{over} of {len(cycles)} checks went over budget')
+    print(f'  this key can keep up with about {len(sim.riot.users) * budget / max(mean, 1):.0f} players')
+
+    if sim.latencies:
+        latencies = sorted(sim.latencies)
+        print('\nAnnouncement latency (end of game to message sent, with enough API budget)')
+        print(f'  p50 {fmt_minutes(percentile(latencies, 0.5))}, p95 {fmt_minutes(percentile(latencies, 0.95))}, '
+              f'max {fmt_minutes(latencies[-1])}')
+
+
+async def simulate(args: argparse.Namespace) -> None:
+    sim = Simulation(args.players, args.guilds or max(args.players // 100, 1), args.digest,
+                     args.send_latency, args.sessions_per_day, args.duo_chance, args.seed)
+    start = time.perf_counter()
+    await sim.run(args.days)
+    report(sim, args.days, time.perf_counter() - start)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0],
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--players', type=int, default=1000)
+    parser.add_argument('--days', type=float, default=1)
+    parser.add_argument('--guilds', type=int, help='Defaults to one per 100 players')
+    parser.add_argument('--sessions-per-day', type=float, default=0.7,
+                        help='How often each player sits down to play, on average')
+    parser.add_argument('--duo-chance', type=float, default=0.3,
+                        help='Chance a session is played with a guildmate')
+    parser.add_argument('--digest', choices=['Off', 'Player', 'Type'], default='Off')
+    parser.add_argument('--send-latency', type=float, default=0.05,
+                        help="Seconds each message takes to reach Discord")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    logs.configure('ERROR')
+    seed_icons()
+    asyncio.run(simulate(args))
+
+
+if __name__ == '__main__':
+    main()
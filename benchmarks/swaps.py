@@ -0,0 +1,88 @@
+'''
+Benchmarks utils.find_all_swaps on large leaderboards, after checking it
+against a brute-force oracle on randomly shuffled boards.
+'''
+import random
+from typing import List
+from common import best_time, fmt_time
+from utils import find_all_swaps
+
+
+def oracle[T](old: List[T], new: List[T]) -> set[tuple[int, T, T]]:
+    '''Every pair that is in one order on the old board and the other on the new one'''
+    new_pos = {x: i for i, x in enumerate(new)}
+    shared = [x for x in old if x in new_pos]
+    old_pos = {x: i for i, x in enumerate(old)}
+    return {(old_pos[a], a, b)
+            for i, a in enumerate(shared) for b in shared[i + 1:]
+            if new_pos[b] < new_pos[a]}
+
+
+def legacy_find_all_swaps[T](old: List[T], new: List[T]) -> List[tuple[int, T, T]]:
+    '''The previous approximate, quadratic implementation, kept for comparison'''
+    swaps = []
+    for i, y in enumerate(new):
+        if i >= old.index(y):
+            continue
+        subswaps = []
+        for i2, x in zip(range(i, len(old)), old[i:]):
+            if x == y:
+                break
+            subswaps.append((i2, x, y))
+        swaps.extend(reversed(subswaps))
+    return swaps
+
+
+def jostle(board: List[str], movers: int, distance: int) -> List[str]:
+    '''Moves a number of random players up or down the board by up to some distance'''
+    new = board.copy()
+    for _ in range(movers):
+        i = random.randrange(len(new))
+        j = min(max(i + random.randint(-distance, distance), 0), len(new) - 1)
+        new.insert(j, new.pop(i))
+    return new
+
+
+def check_against_oracle(trials: int = 2000):
+    for _ in range(trials):
+        n = random.randint(0, 40)
+        old = [f'p{i}' for i in range(n)]
+        new = old.copy()
+        if random.random() < 0.5:
+            random.shuffle(new)
+        else:
+            new = jostle(new, random.randint(0, 5), 5) if n else new
+        # Players joining or leaving between the two boards are ignored
+        old = [p for p in old if random.random() > 0.1]
+        new = [p for p in new if random.random() > 0.1] + ['joined']
+
+        swaps = find_all_swaps(old, new)
+        assert len(swaps) == len(set(swaps)), 'duplicate overtakes'
+        assert set(swaps) == oracle(old, new), (old, new)
+        for pos, overtaken, _ in swaps:
+            assert old[pos] == overtaken
+    print(f'Matched brute-force oracle on {trials} random boards')
+
+
+def main():
+    random.seed(0)
+    check_against_oracle()
+
+    print(f'{"players":>8} {"scenario":>12} {"overtakes":>10} {"time":>10} {"legacy":>10}')
+    for n in [1_000, 10_000]:
+        board = [f'p{i}' for i in range(n)]
+        scenarios = {
+            'quiet': jostle(board, n // 100, 3),
+            'busy': jostle(board, n // 10, 20),
+            'reshuffle': jostle(board, n, 50),
+        }
+        for name, new in scenarios.items():
+            swaps = find_all_swaps(board, new)
+            t = best_time(lambda: find_all_swaps(board, new))
+            legacy = fmt_time(best_time(lambda: legacy_find_all_swaps(board, new), 1)) \
+                if n <= 1_000 else '-'
+            print(f'{n:>8} {name:>12} {len(swaps):>10} {fmt_time(t):>10} {legacy:>10}')
+
+
+if __name__ == '__main__':
+    main()
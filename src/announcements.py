@@ -0,0 +1,37 @@
+import asyncio
+from typing import List
+from events import BaseGameEvent
+from delivery import Message, pack, pack_files
+from digest import digest
+from storage import DigestMode, TrackPlayer
+from utils import flat
+import tracing
+
+
+def get_mentions(events: List[BaseGameEvent], tracked: List[TrackPlayer]) -> str:
+    '''Mentions every Discord user who claimed a player involved in the events'''
+    puuids = {e.user.puuid for e in events}
+    discord_ids = flat([t['claimed_users']
+                       for t in tracked if t['puuid'] in puuids])
+    return ' '.join(map(lambda id: f'<@{id}>', [*set(discord_ids)]))
+
+
+async def build_messages(events: List[BaseGameEvent], tracked: List[TrackPlayer], digest_mode: DigestMode = 'Off') -> List[Message]:
+    '''Renders a guild's announcements and packs them into as few messages as possible'''
+    image_events = [e for e in events if e.type == 'image']
+    with tracing.span('render'):
+        images = await asyncio.gather(*[e.image() for e in image_events])
+    files = [image for image in images if image]
+
+    if digest_mode != 'Off':
+        messages = digest(events, digest_mode, get_mentions(events, tracked))
+        return messages + pack_files(files)
+
+    rendered = [e for e, image in zip(image_events, images) if image]
+    messages = pack_files(files, get_mentions(rendered, tracked))
+
+    # Events whose image couldn't be rendered are announced with their embed instead
+    embed_events = [e for e in events if e.type == 'embed'] + \
+        [e for e, image in zip(image_events, images) if not image]
+    return messages + pack(embed_events, lambda e: e.embed(),
+                           lambda batch: get_mentions(batch, tracked))
@@ -0,0 +1,85 @@
+import asyncio
+import json
+from os import path, replace
+from typing import Optional
+import aiohttp
+from config import get_config, LEAGUE_PATCH
+from utils import repair_champ_name
+from logs import log
+
+CHAMPIONS_URL = f"https://ddragon.leagueoflegends.com/cdn/{
+    LEAGUE_PATCH}/data/en_US/champion.json"
+
+# Champion ids to names for a recent patch, used until the current patch is downloaded
+BUNDLED_CHAMPIONS = 'assets/champions.json'
+
+cache_path = path.join(get_config().FILES_PATH,
+                       f'champions-{LEAGUE_PATCH}.json')
+
+champion_names: Optional[dict[int, str]] = None
+refresh_task: Optional[asyncio.Task] = None
+
+
+def read_table(file: str) -> Optional[dict[int, str]]:
+    '''Reads a table of champion keys to Data Dragon ids ({"62": "MonkeyKing", ...})'''
+    try:
+        with open(file, 'r') as f:
+            return {int(key): repair_champ_name(champ) for key, champ in json.load(f).items()}
+    except (FileNotFoundError, json.JSONDecodeError, ValueError, AttributeError):
+        return None
+
+
+def load() -> dict[int, str]:
+    global champion_names
+    if champion_names is None:
+        champion_names = read_table(cache_path) or \
+            read_table(BUNDLED_CHAMPIONS) or {}
+    return champion_names
+
+
+def champion_name(champ_id: int) -> str:
+    return load().get(champ_id, f"ID: {champ_id}")
+
+
+def save_table(table: dict[str, str]) -> None:
+    temp_path = f'{cache_path}.tmp'
+    with open(temp_path, 'w') as f:
+        json.dump(table, f)
+    replace(temp_path, cache_path)
+
+
+async def refresh() -> None:
+    '''Downloads this patch's champions into the cache, unless they are already there'''
+    global champion_names
+    if path.exists(cache_path):
+        return
+
+    try:
+        timeout = aiohttp.ClientTimeout(total=30)
+        async with aiohttp.ClientSession(timeout=timeout) as session:
+            async with session.get(CHAMPIONS_URL) as response:
+                if response.status != 200:
+                    log(f"Couldn't download champion data ({
+                        response.status})", 'WARNING', 'main.champions')
+                    return
+                data = await response.json(content_type=None)
+
+        table = {champ['key']: champ_id
+                 for champ_id, champ in data['data'].items()}
+    except (aiohttp.ClientError, asyncio.TimeoutError, KeyError, TypeError, ValueError):
+        log("Couldn't download champion data", 'WARNING', 'main.champions')
+        return
+
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, save_table, table)
+    champion_names = {int(key): repair_champ_name(champ)
+                      for key, champ in table.items()}
+    log(f'Updated champion data for patch {LEAGUE_PATCH}',
+        source='main.champions')
+
+
+def start_refresh() -> None:
+    '''Refreshes the champion data in the background'''
+    global refresh_task
+    if refresh_task is None or refresh_task.done():
+        refresh_task = asyncio.create_task(refresh())
@@ -1,6 +1,6 @@
 import os
 from dataclasses import dataclass
-from typing import Optional
+from typing import Literal, Optional, cast
 from dotenv import load_dotenv
 load_dotenv()
 
@@ -16,6 +16,15 @@ class Config():
     FILES_PATH: str
     OWNER_DISCORD_ID: Optional[int]
     API_THREADS: int
+    CERTIFICATE_FORMAT: str
+    CERTIFICATE_PNG_COMPRESSION: int
+    CERTIFICATE_WEBP_QUALITY: int
+    LOG_LEVEL: str
+    LOG_FORMAT: Literal['text', 'json']
+    METRICS_PORT: Optional[int]
+    SHARD_WORKERS: int
+    SHARD_ADDRESS: tuple[str, int]
+    SHARD_AUTHKEY: Optional[str]
 
 
 def invalid_env(msg: str):
@@ -67,6 +76,57 @@ def get_config():
             invalid_env('API_THREADS must be a number')
             exit(1)
 
+    CERTIFICATE_FORMAT = (os.getenv('CERTIFICATE_FORMAT') or 'png').lower()
+    if CERTIFICATE_FORMAT not in ['png', 'webp']:
+        invalid_env('CERTIFICATE_FORMAT must be png or webp')
+        exit(1)
+
+    try:
+        CERTIFICATE_PNG_COMPRESSION = int(
+            os.getenv('CERTIFICATE_PNG_COMPRESSION') or '6')
+        CERTIFICATE_WEBP_QUALITY = int(
+            os.getenv('CERTIFICATE_WEBP_QUALITY') or '90')
+    except ValueError:
+        invalid_env('Certificate compression settings must be numbers')
+        exit(1)
+    if not 0 <= CERTIFICATE_PNG_COMPRESSION <= 9:
+        invalid_env('CERTIFICATE_PNG_COMPRESSION must be between 0 and 9')
+        exit(1)
+    if not 0 <= CERTIFICATE_WEBP_QUALITY <= 100:
+        invalid_env('CERTIFICATE_WEBP_QUALITY must be between 0 and 100')
+        exit(1)
+
+    LOG_LEVEL = (os.getenv('LOG_LEVEL') or 'INFO').upper()
+    if LOG_LEVEL not in ['DEBUG', 'INFO', 'WARNING', 'ERROR']:
+        invalid_env('LOG_LEVEL must be DEBUG, INFO, WARNING or ERROR')
+        exit(1)
+
+    LOG_FORMAT = (os.getenv('LOG_FORMAT') or 'text').lower()
+    if LOG_FORMAT not in ['text', 'json']:
+        invalid_env('LOG_FORMAT must be text or json')
+        exit(1)
+
+    METRICS_PORT = os.getenv('METRICS_PORT') or None
+    if METRICS_PORT is not None:
+        try:
+            METRICS_PORT = int(METRICS_PORT)
+        except ValueError:
+            invalid_env('METRICS_PORT must be a number')
+            exit(1)
+
+    try:
+        SHARD_WORKERS = int(os.getenv('SHARD_WORKERS') or '0')
+    except ValueError:
+        invalid_env('SHARD_WORKERS must be a number')
+        exit(1)
+
+    host, _, port = (os.getenv('SHARD_ADDRESS') or '127.0.0.1:6010').rpartition(':')
+    try:
+        SHARD_ADDRESS = (host or '127.0.0.1', int(port))
+    except ValueError:
+        invalid_env('SHARD_ADDRESS must be host:port')
+        exit(1)
+
     global_stored_config = Config(
         RIOT_TOKEN,
         DISCORD_TOKEN,
@@ -74,6 +134,15 @@ def get_config():
         os.getenv("REGION", "europe"),
         FILES_PATH,
         OWNER_DISCORD_ID,
-        API_THREADS
+        API_THREADS,
+        CERTIFICATE_FORMAT,
+        CERTIFICATE_PNG_COMPRESSION,
+        CERTIFICATE_WEBP_QUALITY,
+        LOG_LEVEL,
+        cast(Literal['text', 'json'], LOG_FORMAT),
+        METRICS_PORT,
+        SHARD_WORKERS,
+        SHARD_ADDRESS,
+        os.getenv('SHARD_AUTHKEY') or None
     )
     return global_stored_config
@@ -0,0 +1,157 @@
+import asyncio
+import contextvars
+import random
+import traceback
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional
+import aiohttp
+import discord
+from logs import log
+from tracing import CycleTrace, current, span
+
+# Discord's limits for a single message
+MAX_EMBEDS = 10
+MAX_EMBED_CHARS = 6000
+MAX_FILES = 10
+
+QUEUE_SIZE = 1000
+MAX_CONCURRENT_SENDS = 5
+MAX_ATTEMPTS = 5
+BACKOFF_BASE = 1
+BACKOFF_MAX = 30
+
+
+@dataclass
+class Message:
+    content: str = ''
+    embeds: List[discord.Embed] = field(default_factory=list)
+    files: List[discord.File] = field(default_factory=list)
+    view: Optional[discord.ui.View] = None
+
+
+def pack[T](items: List[T], embed: Callable[[T], discord.Embed], mentions: Callable[[List[T]], str]) -> List[Message]:
+    '''
+    Packs the items' embeds into as few messages as possible while keeping their order.
+    Each message holds up to 10 embeds and 6000 characters of embeds, and mentions the
+    users of the items it contains.
+    '''
+    messages: List[Message] = []
+    batch: List[T] = []
+    embeds: List[discord.Embed] = []
+    chars = 0
+
+    def flush():
+        if embeds:
+            messages.append(Message(mentions(batch), list(embeds)))
+        batch.clear()
+        embeds.clear()
+
+    for item in items:
+        e = embed(item)
+        size = len(e)
+        if len(embeds) == MAX_EMBEDS or chars + size > MAX_EMBED_CHARS:
+            flush()
+            chars = 0
+        batch.append(item)
+        embeds.append(e)
+        chars += size
+    flush()
+
+    return messages
+
+
+def pack_files(files: List[discord.File], content: str = '') -> List[Message]:
+    return [Message(content, files=files[i:i + MAX_FILES])
+            for i in range(0, len(files), MAX_FILES)]
+
+
+def is_retryable(error: Exception) -> bool:
+    if isinstance(error, discord.HTTPException):
+        return error.status >= 500 or error.status == 429
+    return isinstance(error, (aiohttp.ClientError, asyncio.TimeoutError))
+
+
+class Delivery:
+    '''
+    Sends messages to channels in the background. Every channel has its own bounded queue
+    and worker, so messages to a channel keep their order while different channels are
+    sent to concurrently (up to a limit). Failed sends are retried with exponential backoff.
+    '''
+    bot: discord.Client
+    queues: dict[int, asyncio.Queue[tuple[Message, Optional[CycleTrace]]]]
+    workers: dict[int, asyncio.Task]
+
+    def __init__(self, bot: discord.Client, queue_size: int = QUEUE_SIZE, max_concurrent: int = MAX_CONCURRENT_SENDS) -> None:
+        self.bot = bot
+        self.queue_size = queue_size
+        self.queues = {}
+        self.workers = {}
+        self.sending = asyncio.Semaphore(max_concurrent)
+
+    async def enqueue(self, channel_id: int, messages: List[Message]) -> None:
+        '''Queues messages for a channel. Only waits if the channel's queue is full.'''
+        queue = self.queues.get(channel_id)
+        if queue is None:
+            queue = self.queues[channel_id] = asyncio.Queue(self.queue_size)
+
+        worker = self.workers.get(channel_id)
+        if worker is None or worker.done():
+            # Workers outlive the cycle they were started in, so they don't inherit its context
+            self.workers[channel_id] = asyncio.create_task(
+                self.work(channel_id, queue), context=contextvars.Context())
+
+        # Sends are timed as part of the cycle that queued them, even if it has already ended
+        trace = current()
+        for message in messages:
+            await queue.put((message, trace))
+
+    def pending(self) -> int:
+        return sum(queue.qsize() for queue in self.queues.values())
+
+    async def join(self) -> None:
+        '''Waits until every queued message has been sent (or given up on)'''
+        await asyncio.gather(*[queue.join() for queue in self.queues.values()])
+
+    async def work(self, channel_id: int, queue: asyncio.Queue[tuple[Message, Optional[CycleTrace]]]) -> None:
+        while True:
+            message, trace = await queue.get()
+            try:
+                with span('discord_send', trace):
+                    await self.send(channel_id, message)
+            except Exception:
+                log(f"Couldn't deliver message to [{channel_id}]",
+                    'ERROR', 'main.delivery')
+                log(traceback.format_exc(), 'ERROR', 'main.delivery')
+            finally:
+                queue.task_done()
+
+    async def get_channel(self, channel_id: int) -> discord.abc.Messageable:
+        channel = self.bot.get_channel(channel_id)
+        if channel is None:
+            channel = await self.bot.fetch_channel(channel_id)
+        return channel  # type: ignore
+
+    async def send(self, channel_id: int, message: Message) -> None:
+        for attempt in range(MAX_ATTEMPTS):
+            try:
+                async with self.sending:
+                    channel = await self.get_channel(channel_id)
+                    await channel.send(message.content or None, embeds=message.embeds,
+                                       files=message.files, view=message.view)
+                return
+            except Exception as e:
+                if not is_retryable(e) or attempt == MAX_ATTEMPTS - 1:
+                    raise
+
+                delay = min(BACKOFF_BASE * 2 ** attempt, BACKOFF_MAX)
+                delay *= random.uniform(0.5, 1)
+                log(f'Sending to [{channel_id}] failed ({e}), retrying in {delay:.1f}s',
+                    'WARNING', 'main.delivery')
+                for file in message.files:
+                    file.reset()
+                await asyncio.sleep(delay)
+
+
+async def send_followup(interaction: discord.Interaction, message: Message) -> None:
+    await interaction.followup.send(message.content, embeds=message.embeds, files=message.files,
+                                    view=message.view or discord.utils.MISSING)
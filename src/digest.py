@@ -0,0 +1,70 @@
+from typing import List
+import discord
+from events import BaseGameEvent
+from delivery import Message, pack
+from storage import DigestMode
+
+DIGEST_COLOR = 0x7289DA
+MAX_DESCRIPTION = 4096
+
+# How long the details of a digest can be viewed for
+DETAILS_TIMEOUT = 24 * 60 * 60
+
+
+class DetailsView(discord.ui.View):
+    '''Shows the full announcements behind a digest to whoever asks for them'''
+
+    def __init__(self, events: List[BaseGameEvent]):
+        super().__init__(timeout=DETAILS_TIMEOUT)
+        self.events = events
+
+    @discord.ui.button(label='Details', style=discord.ButtonStyle.secondary)
+    async def details(self, interaction: discord.Interaction, button: discord.ui.Button):
+        messages = pack(self.events, lambda e: e.embed(), lambda batch: '')
+        await interaction.response.send_message(embeds=messages[0].embeds, ephemeral=True)
+        for message in messages[1:]:
+            await interaction.followup.send(embeds=message.embeds, ephemeral=True)
+
+
+def group_events(events: List[BaseGameEvent], mode: DigestMode) -> dict[str, List[str]]:
+    '''Groups the events' summaries by player or by type, in the order they first appear'''
+    groups: dict[str, List[str]] = {}
+    for e in events:
+        if mode == 'Player':
+            groups.setdefault(e.user.summoner_name, []).append(
+                f'**{e.category}**: {e.summary()}')
+        else:
+            groups.setdefault(e.category, []).append(e.summary())
+    return groups
+
+
+def digest_embeds(title: str, lines: List[str]) -> List[discord.Embed]:
+    '''Lists the lines in as few embeds as their description limit allows'''
+    embeds: List[discord.Embed] = []
+    description = ''
+    for line in lines:
+        line = f'- {line}\n'
+        if description and len(description) + len(line) > MAX_DESCRIPTION:
+            embeds.append(discord.Embed(title=title, description=description,
+                                        color=DIGEST_COLOR))
+            description = ''
+        description += line
+    embeds.append(discord.Embed(title=title, description=description,
+                                color=DIGEST_COLOR))
+    return embeds
+
+
+def digest(events: List[BaseGameEvent], mode: DigestMode, mentions: str) -> List[Message]:
+    '''
+    Condenses a cycle's events into a few summary messages. The first message carries one
+    combined mention line, and the last one has a button to view every full announcement.
+    '''
+    if not events:
+        return []
+
+    embeds = [embed for title, lines in group_events(events, mode).items()
+              for embed in digest_embeds(title, lines)]
+    messages = pack(embeds, lambda embed: embed, lambda batch: '')
+    messages[0].content = mentions
+    messages[-1].view = DetailsView(events)
+    return messages
@@ -1,25 +1,26 @@
 import discord
-import requests
 import random
-from typing import List, Literal
-from event_manager import OrderedUserRank
+from typing import List, Literal, Optional
+from leaderboard import OrderedUserRank
+from ladder import Ladder
 from storage import TrackPlayer
 from riot import UserInfo
-from utils import icon_url, r_pad, repair_champ_name, num_of, rank_assets
+from utils import icon_url, r_pad, num_of, rank_assets
+from champions import champion_name
 from logs import log
-from config import LEAGUE_PATCH
 
-champion_info = requests.get(
-    f"https://ddragon.leagueoflegends.com/cdn/{
-        LEAGUE_PATCH}/data/en_US/champion.json"
-).json()
-champion_name = {
-    int(champion_info['data'][champion]['key']): repair_champ_name(champion)
-    for champion in champion_info['data']
-}
+# Players shown per page, small enough for Discord's 25 fields per embed and 2000 characters per message
+LIST_PAGE_SIZE = 15
+LEADERBOARD_PAGE_SIZE = 24
+TEXT_PAGE_SIZE = 25
 
 
-def big_user(user: UserInfo):
+def page_label(page: int, pages: int) -> str:
+    return f'Page {page + 1}/{pages}' if pages > 1 else ''
+
+
+def big_user(user: UserInfo, ladders: Optional[dict[str, Ladder]] = None):
+    '''Shows a player's profile, and where their ranks place them in the guild's ladders if given'''
     embed = discord.Embed(
         title=f"Level {user.level}",
         description=f"",
@@ -30,7 +31,10 @@ def big_user(user: UserInfo):
     embed.set_thumbnail(url=rank_assets[user.max_division.upper()])
 
     for mode, rank in user.ranks.items():
-        embed.add_field(name=f"{mode} - {rank.full()}", value=rank.info())
+        info = rank.info()
+        if ladders and (ladder := ladders.get(mode)) and rank.division != 'UNRANKED':
+            info += f'\nAbove {ladder.percentile_of(rank.score) * 100:.0f}% of the server'
+        embed.add_field(name=f"{mode} - {rank.full()}", value=info)
 
     embed.add_field(
         name=f"Total Mastery: {user.total_mastery}",
@@ -39,7 +43,7 @@ def big_user(user: UserInfo):
     )
 
     for champion in user.top_champs[:3]:
-        name = champion_name.get(champion.id, f"ID: {champion.id}")
+        name = champion_name(champion.id)
         embed.add_field(
             name=f"{name} ({champion.level} lvl)", value=f"{champion.points:,} pts."
         )
@@ -64,16 +68,22 @@ def mini_user(user_info: UserInfo):
     return embed
 
 
+def tracked_by_puuid(tracked_players: List[TrackPlayer]) -> dict[str, TrackPlayer]:
+    '''Indexes the tracked players by puuid, keeping the first entry of any duplicates'''
+    return {tp['puuid']: tp for tp in reversed(tracked_players)}
+
+
 def tracked_list(users: List[TrackPlayer], offset: int):
+    start = offset * LIST_PAGE_SIZE
     embed = discord.Embed(
         title=f"Tracking {num_of('Player', len(users))}",
         description=f"Showing players {
-            offset * 15 + 1}-{min((offset + 1) * 15, len(users))}",
+            start + 1}-{min(start + LIST_PAGE_SIZE, len(users))}",
         color=random.randint(0, 16777215),
     )
 
-    for i, u in enumerate(users[offset * 15:(offset + 1) * 15]):
-        index = offset * 15 + i + 1
+    for i, u in enumerate(users[start:start + LIST_PAGE_SIZE]):
+        index = start + i + 1
         links = '🔗' * len(u['claimed_users'])
         user_line = f"{index}. {u['name']}#{
             u['tag']} (Lvl {u['level']})  {links}"
@@ -82,7 +92,10 @@ def tracked_list(users: List[TrackPlayer], offset: int):
     return embed
 
 
-def leaderboard(mode: Literal['Solo/Duo', 'Flex'], ranked_players: List[OrderedUserRank], tracked_players: List[TrackPlayer]):
+def leaderboard(mode: Literal['Solo/Duo', 'Flex'], ranked_players: List[OrderedUserRank], tracked_players: List[TrackPlayer], ladder: Optional[Ladder] = None,
+                page: int = 0, pages: int = 1):
+    '''Lists one page of the leaderboard, ranked_players being the players on that page'''
+    offset = page * LEADERBOARD_PAGE_SIZE
     embed = discord.Embed(
         title=f"Leaderboard - {mode}",
         description=f"",
@@ -90,15 +103,15 @@ def leaderboard(mode: Literal['Solo/Duo', 'Flex'], ranked_players: List[OrderedU
     )
 
     lines = []
+    tracked = tracked_by_puuid(tracked_players)
     for i, p in enumerate(ranked_players):
-        matches = [tp for tp in tracked_players if tp["puuid"] == p["puuid"]]
-        if len(matches) == 0:
+        tp = tracked.get(p['puuid'])
+        if tp is None:
             log(
                 f"Couldn't find event-memorised player in tracked_players (puuid={p['puuid']})", 'ERROR', 'main.embeds')
             continue
-        tp = matches[0]
 
-        part1 = f'{i + 1}. {tp['name']}#{tp['tag']}'
+        part1 = f'{offset + i + 1}. {tp['name']}#{tp['tag']}'
         part2 = f"{p['rank'].full()} ({p['rank'].lp} LP)"
 
         lines.append((part1, part2))
@@ -109,30 +122,42 @@ def leaderboard(mode: Literal['Solo/Duo', 'Flex'], ranked_players: List[OrderedU
         for i, (part1, part2) in enumerate(lines):
             line = r_pad(part1, max_len + 2) + part2
 
-            if i < 3:
+            if offset + i < 3:
                 line = f'**{line}**'
 
             embed.add_field(name='', value=line, inline=False)
 
+    footer = [page_label(page, pages)]
+    if ladder is not None and (median := ladder.median()):
+        footer.append(f"{num_of('ranked player', len(ladder))} • Median {
+            median.full()} • {ladder.winrate() * 100:.1f}% WR")
+        if len(ladder) >= 10 and (top := ladder.percentile(0.9)):
+            footer.append(f'Top 10% from {top.full()}')
+    if footer := ' • '.join(filter(None, footer)):
+        embed.set_footer(text=footer)
+
     return embed
 
 
-def leaderboard_string(mode: Literal['Solo/Duo', 'Flex'], ranked_players: List[OrderedUserRank], tracked_players: List[TrackPlayer]) -> str:
+def leaderboard_string(mode: Literal['Solo/Duo', 'Flex'], ranked_players: List[OrderedUserRank], tracked_players: List[TrackPlayer],
+                       page: int = 0, pages: int = 1) -> str:
+    offset = page * TEXT_PAGE_SIZE
     lines = []
+    tracked = tracked_by_puuid(tracked_players)
     for i, p in enumerate(ranked_players):
-        matches = [tp for tp in tracked_players if tp["puuid"] == p["puuid"]]
-        if len(matches) == 0:
+        tp = tracked.get(p['puuid'])
+        if tp is None:
             log(
                 f"Couldn't find event-memorised player in tracked_players (puuid={p['puuid']})", 'ERROR', 'main.embeds')
             continue
-        tp = matches[0]
 
-        part1 = f'{i + 1}. {tp['name']}#{tp['tag']}'
+        part1 = f'{offset + i + 1}. {tp['name']}#{tp['tag']}'
         part2 = f"{p['rank'].full()} ({p['rank'].lp} LP)"
 
         lines.append((part1, part2))
 
-    text = f'Leaderboard - {mode}:\n```md\n'
+    label = page_label(page, pages)
+    text = f'Leaderboard - {mode}{f' ({label})' if label else ''}:\n```md\n'
     if len(lines):
         max_len = max(len(l[0]) for l in lines)
         for i, (part1, part2) in enumerate(lines):
@@ -142,25 +167,28 @@ def leaderboard_string(mode: Literal['Solo/Duo', 'Flex'], ranked_players: List[O
     return text
 
 
-def total_games_string(mode: Literal['Solo/Duo', 'Flex'], ranked_players: List[OrderedUserRank], tracked_players: List[TrackPlayer]) -> str:
+def total_games_string(mode: Literal['Solo/Duo', 'Flex'], ranked_players: List[OrderedUserRank], tracked_players: List[TrackPlayer],
+                       page: int = 0, pages: int = 1) -> str:
     if len(ranked_players) == 0:
         return 'No Players to Rank.'
 
+    offset = page * TEXT_PAGE_SIZE
     lines = []
+    tracked = tracked_by_puuid(tracked_players)
     for i, p in enumerate(ranked_players):
-        matches = [tp for tp in tracked_players if tp["puuid"] == p["puuid"]]
-        if len(matches) == 0:
+        tp = tracked.get(p['puuid'])
+        if tp is None:
             log(
                 f"Couldn't find event-memorised player in tracked_players (puuid={p['puuid']})", 'ERROR', 'main.embeds')
             continue
-        tp = matches[0]
 
-        part1 = f'{i + 1}. {tp['name']}#{tp['tag']}'
+        part1 = f'{offset + i + 1}. {tp['name']}#{tp['tag']}'
         part2 = f"{p['rank'].games()} Games"
 
         lines.append((part1, part2))
 
-    text = f'Most Games - {mode}:\n```md\n'
+    label = page_label(page, pages)
+    text = f'Most Games - {mode}{f' ({label})' if label else ''}:\n```md\n'
     if len(lines):
         max_len = max(len(l[0]) for l in lines)
         for i, (part1, part2) in enumerate(lines):
@@ -1,13 +1,19 @@
 import asyncio
-import dataclasses
-from typing import List, Literal, Optional, TypedDict, cast
+import sys
+from dataclasses import dataclass, field, replace
+from typing import Iterable, List, Literal, Optional
 from events import BaseGameEvent, LowKDAEvent, LoseStreakEvent, RankChangeEvent, LeaderboardChangeEvent, TotalGamesEvent
-from riot import RiotAPI, UserInfo, GameInfo, RanksDict, Rank
+from riot import RiotAPI, UserInfo, GameInfo, RanksDict
 from logs import log
 from utils import flat, num_of, find_all_swaps
+from leaderboard import GuildLeaderboards, OrderedUserRank
+from ladder import Ladder
+from tracing import span, player
+import metrics
 
 
-class Memory(TypedDict):
+@dataclass(slots=True)
+class Memory:
     last_game: str
     last_played: int
     lose_streak: int
@@ -17,89 +23,147 @@ class Memory(TypedDict):
     tag: str
 
 
-class OrderedUserRank(TypedDict):
-    puuid: str
-    rank: Rank
+@dataclass
+class CycleSnapshot:
+    '''
+    Profiles and games that have already been fetched during a check, so that later
+    steps of the same check can reuse them instead of requesting them again.
+    '''
+    profiles: dict[str, UserInfo] = field(default_factory=dict)
+    games: dict[str, GameInfo] = field(default_factory=dict)
 
 
 class EventManager():
     BAD_KDA = 1
     HISTORY_COUNT = 20
+    HISTORY_WINDOW = 4
+    # Checks that a new game which couldn't be fetched holds back the player's memory for
+    GAME_RETRIES = 3
 
     riot: RiotAPI
     player_memory: dict[str, Memory]
     leaderboard_memory: dict[int, dict[Literal['Solo/Duo', 'Flex'], List[str]]]
+    leaderboards: GuildLeaderboards
 
     def __init__(self, riot: RiotAPI) -> None:
         self.riot = riot
         self.player_memory = {}
         self.leaderboard_memory = {}
+        self.leaderboards = GuildLeaderboards()
+        self.failed_games: dict[str, int] = {}
+
+    def set_guild_players(self, guild_id: int, puuids: List[str]) -> None:
+        self.leaderboards.set_members(guild_id, puuids)
 
     async def check(self, puuids: List[str], guild_id: Optional[int] = None, quiet=False):
         if not quiet:
             log('Running event checks...', source='main.events')
-        tasks = [self.check_user(puuid) for puuid in puuids]
+        if guild_id:
+            self.set_guild_players(guild_id, puuids)
+        snapshot = CycleSnapshot()
+        tasks = [self.check_user(puuid, snapshot) for puuid in puuids]
         events = flat(await asyncio.gather(*tasks))
 
         if guild_id:
-            events.extend(await self.get_leaderboard_events(guild_id, 'Solo/Duo'))
-            events.extend(await self.get_leaderboard_events(guild_id, 'Flex'))
+            events.extend(await self.get_leaderboard_events(
+                guild_id, 'Solo/Duo', snapshot))
+            events.extend(await self.get_leaderboard_events(
+                guild_id, 'Flex', snapshot))
 
+        metrics.count_events(events)
         if not quiet:
             log(f'Completed event checks ({
                 num_of('new announcement', len(events))})', source='main.events')
         return events
 
-    async def check_user(self, puuid: str) -> List[BaseGameEvent]:
-        response = await self.riot.get_profile_info(puuid)
+    async def check_user(self, puuid: str, snapshot: Optional[CycleSnapshot] = None) -> List[BaseGameEvent]:
+        with player(puuid):
+            return await self._check_user(puuid, snapshot or CycleSnapshot())
+
+    async def _check_user(self, puuid: str, snapshot: CycleSnapshot) -> List[BaseGameEvent]:
+        with span('profile'):
+            response = await self.riot.get_profile_info(puuid)
         if response.error():
             response.log_error(
-                2, 'Couldn\'t get profile from puuid', 'main.events')
+                2, f'Couldn\'t get profile from puuid [{puuid}]', 'main.events')
             return []
         user: UserInfo = response.data
+        snapshot.profiles[puuid] = user
 
-        game_ids_res = await self.riot.get_matches_ids_by_puuid(puuid, self.HISTORY_COUNT)
+        with span('match_ids'):
+            game_ids_res = await self.riot.get_matches_ids_by_puuid(puuid, self.HISTORY_COUNT)
         if game_ids_res.data is None:
             game_ids_res.log_error(
-                9, "Couldn't get game ids for puuid", 'main.events')
+                9, f"Couldn't get game ids for puuid [{puuid}]", 'main.events')
             return []
         game_ids = game_ids_res.data
         memory = self.player_memory.get(puuid)
 
-        if memory is None or memory['last_game'] not in game_ids:
+        if memory is None or memory.last_game not in game_ids:
             log(f'Resetting player memory for [{
-                user.summoner_name}]', source='main.events')
-            await self.remember_history(user, game_ids)
+                user.summoner_name}]', 'DEBUG', 'main.events')
+            await self.remember_history(user, game_ids, snapshot)
             return []
 
-        new_game_ids = game_ids[:game_ids.index(memory['last_game'])]
-
-        new_games = await asyncio.gather(*[self.riot.get_match_info_by_id(gid)
-                                           for gid in new_game_ids])
-
-        new_games = [g for g in new_games if g is not None]
+        new_game_ids = game_ids[:game_ids.index(memory.last_game)]
+
+        with span('matches'):
+            fetched = await asyncio.gather(*[self.riot.get_match_info_by_id(gid)
+                                             for gid in new_game_ids])
+
+        # Games newer than one that couldn't be fetched wait for it to be retried next
+        # check, so the lose streak and ranks are never brought up to date without it
+        blocked = [i for i, (gid, game) in enumerate(zip(new_game_ids, fetched))
+                   if game is None and self.retry_game(gid, user)]
+        held_back = blocked[-1] + 1 if blocked else 0
+        game_ids = game_ids[held_back:]
+        new_games = [g for g in fetched[held_back:] if g is not None]
+        for game in new_games:
+            self.failed_games.pop(game.id, None)
+        snapshot.games.update((g.id, g) for g in new_games)
+        if blocked:
+            # Ranks already count the games that were held back, so they wait for them too
+            user = replace(user, ranks=memory.ranks)
 
         if new_games:
             log(f'Scanning {num_of('new game', len(new_games))
-                            } from [{user.summoner_name}]', source='main.events')
+                            } from [{user.summoner_name}]', 'DEBUG', 'main.events')
 
-        events = self.find_events_from_games(user, new_games, memory)
+        with span('detect'):
+            events = self.find_events_from_games(user, new_games, memory)
 
         for mode, rank in user.ranks.items():
-            if not rank.is_same_as(memory['ranks'][mode]):
+            if not rank.is_same_as(memory.ranks[mode]):
                 events.append(RankChangeEvent(
                     user, new_games[0] if len(new_games) else None,
-                    old_rank=memory['ranks'][mode],
+                    old_rank=memory.ranks[mode],
                     mode=mode
                 ))
 
-            if self.is_milestone_game(rank.games()) and rank.games() > memory['ranks'][mode].games():
+            if self.is_milestone_game(rank.games()) and rank.games() > memory.ranks[mode].games():
                 events.append(TotalGamesEvent(user, new_games[0], mode))
 
-        await self.remember_history(user, game_ids)
+        # The streak has already been brought up to date by the new games, so only
+        # the history needs scanning when the player is first remembered
+        latest_game = snapshot.games.get(game_ids[0])
+        await self.remember_history(
+            user, game_ids, snapshot,
+            last_played=latest_game.start_time if latest_game else memory.last_played,
+            lose_streak=memory.lose_streak)
 
         return events
 
+    def retry_game(self, game_id: str, user: UserInfo) -> bool:
+        '''Whether to wait for a game that couldn't be fetched, rather than skip it for good'''
+        attempts = self.failed_games.get(game_id, 0) + 1
+        if attempts <= self.GAME_RETRIES:
+            self.failed_games[game_id] = attempts
+            return True
+        del self.failed_games[game_id]
+        log(f"Skipping game [{game_id}] of [{user.summoner_name}] after {attempts} failed fetches",
+            'WARNING', 'main.events')
+        return False
+
     def find_events_from_games(self, user: UserInfo, games: List[GameInfo], memory: Memory):
         events = []
         for game in reversed(games):
@@ -116,18 +180,17 @@ class EventManager():
                 continue
 
             if not participant.team == game.winner:
-                memory['lose_streak'] += 1
-                if memory['lose_streak'] >= 3:
+                memory.lose_streak += 1
+                if memory.lose_streak >= 3:
                     events.append(LoseStreakEvent(
-                        user, game, memory['lose_streak']))
+                        user, game, memory.lose_streak))
             else:
-                memory['lose_streak'] = 0
+                memory.lose_streak = 0
 
         return events
 
-    async def get_leaderboard_events(self, guild_id: int, mode: Literal['Solo/Duo', 'Flex']) -> List[LeaderboardChangeEvent]:
-        ranks = self.get_ordered_rankings(mode)
-        new_order = [r['puuid'] for r in ranks]
+    async def get_leaderboard_events(self, guild_id: int, mode: Literal['Solo/Duo', 'Flex'], snapshot: Optional[CycleSnapshot] = None) -> List[LeaderboardChangeEvent]:
+        new_order = self.leaderboards.order(guild_id, mode)
         if guild_id not in self.leaderboard_memory:
             self.leaderboard_memory[guild_id] = {mode: new_order}
             return []
@@ -142,37 +205,64 @@ class EventManager():
         new_order = [p for p in new_order if p in union_puuids]
         old_order = [p for p in old_order if p in union_puuids]
 
+        with span('leaderboard_swaps'):
+            swaps = find_all_swaps(old_order, new_order)
+        # Only the more recent of the two players' last games is announced, and memory
+        # already knows which one that is, so the other game is never fetched
+        latest_games = [self.player_memory[old if self.player_memory[old].last_played >
+                                           self.player_memory[new].last_played else new].last_game
+                        for _, old, new in swaps]
+        snapshot = snapshot or CycleSnapshot()
+        with span('fill_snapshot'):
+            await self.fill_snapshot(
+                snapshot, {p for _, old, new in swaps for p in (old, new)}, set(latest_games))
+
         events: List[LeaderboardChangeEvent] = []
-        for pos, old, new in find_all_swaps(old_order, new_order):
-            user1 = await self.riot.get_profile_info(old)
-            user2 = await self.riot.get_profile_info(new)
-            game1 = await self.riot.get_match_info_by_id(self.player_memory[old]['last_game'])
-            game2 = await self.riot.get_match_info_by_id(self.player_memory[new]['last_game'])
-
-            if user1.error():
-                user1.log_error(
-                    10, f"Couldn't get profile for puuid [{old}]", 'main.events')
-            elif user2.error():
-                user2.log_error(
-                    11, f"Couldn't get profile for puuid [{new}]", 'main.events')
-            elif game1 is None:
-                log(f"Couldn't get first user's last match [{
-                    self.player_memory[old]['last_game']}]", 'ERROR', 'main.events')
-            elif game2 is None:
-                log(f"Couldn't get second user's last match [{
-                    self.player_memory[new]['last_game']}]", 'ERROR', 'main.events')
-            else:
+        for (pos, old, new), game_id in zip(swaps, latest_games):
+            user1 = snapshot.profiles.get(old)
+            user2 = snapshot.profiles.get(new)
+            game = snapshot.games.get(game_id)
+
+            # Anything still missing has already been logged by fill_snapshot
+            if user1 and user2 and game:
                 events.append(LeaderboardChangeEvent(
                     pos + 1,
-                    user1.data,
-                    user2.data,
-                    game1 if game1.start_time > game2.start_time else game2,
+                    user1,
+                    user2,
+                    game,
                     mode
                 ))
 
-        self.leaderboard_memory[guild_id][mode] = [r['puuid'] for r in ranks]
+        self.leaderboard_memory[guild_id][mode] = self.leaderboards.order(
+            guild_id, mode)
         return events
 
+    async def fill_snapshot(self, snapshot: CycleSnapshot, puuids: Iterable[str], game_ids: Iterable[str] = ()) -> None:
+        '''Fetches the profiles and games that aren't in the snapshot yet, all at once'''
+        missing_users = [p for p in puuids if p not in snapshot.profiles]
+        missing_games = [g for g in game_ids if g not in snapshot.games]
+        if not missing_users and not missing_games:
+            return
+
+        users, games = await asyncio.gather(
+            asyncio.gather(*[self.riot.get_profile_info(p)
+                             for p in missing_users]),
+            asyncio.gather(*[self.riot.get_match_info_by_id(g)
+                             for g in missing_games]))
+
+        for puuid, user in zip(missing_users, users):
+            if user.error():
+                user.log_error(
+                    10, f"Couldn't get profile for puuid [{puuid}]", 'main.events')
+            else:
+                snapshot.profiles[puuid] = user.data
+
+        for game_id, game in zip(missing_games, games):
+            if game is None:
+                log(f"Couldn't get last match [{game_id}]", 'ERROR', 'main.events')
+            else:
+                snapshot.games[game_id] = game
+
     def match_participant(self, user_id: str, game: GameInfo):
         p = [p for p in game.participants if p.id == user_id]
         return p[0] if p else None
@@ -183,54 +273,75 @@ class EventManager():
         p = [p for p in game.participants if p.id == user_id]
         return (p[0].team == game.winner) if p else True
 
-    async def remember_history(self, user: UserInfo, history: List[str]) -> None:
-        lose_streak = 0
+    async def remember_history(self, user: UserInfo, history: List[str], snapshot: Optional[CycleSnapshot] = None,
+                               last_played: Optional[int] = None, lose_streak: Optional[int] = None) -> None:
+        if last_played is None or lose_streak is None:
+            with span('scan_history'):
+                last_played, lose_streak = await self.scan_history(user, history, snapshot)
+
+        # Ranks are immutable and the dict is never modified in place, so it
+        # can be shared with the user object instead of being copied
+        memory = Memory(
+            last_game=history[0],
+            last_played=last_played,
+            lose_streak=lose_streak,
+            ranks=user.ranks,
+            level=user.level,
+            name=sys.intern(user.summoner_name),
+            tag=sys.intern(user.summoner_tag)
+        )
+        puuid = sys.intern(user.puuid)
+        self.player_memory[puuid] = memory
+        self.leaderboards.update(puuid, memory.ranks)
+
+    async def scan_history(self, user: UserInfo, history: List[str], snapshot: Optional[CycleSnapshot] = None) -> tuple[int, int]:
+        '''
+        Finds when the player's latest game started and how many games in a row they have lost.
+        Games are fetched newest first in concurrent windows that double in size, stopping as
+        soon as the player's last win is found, so a player who won their latest game costs a
+        single fetch.
+
+        Returns: (last_played, lose_streak)
+        '''
         last_played = 0
+        lose_streak = 0
+        start, window = 0, 1
 
-        for i, game_id in enumerate(history):
-            game = await self.riot.get_match_info_by_id(game_id)
-            if game is None:
-                log(f"Couldn't get game for id [{
-                    game_id}] in history of [{user.summoner_name}]")
-                continue
+        while start < len(history):
+            game_ids = history[start:start + window]
+            games = await asyncio.gather(*[self.riot.get_match_info_by_id(gid)
+                                           for gid in game_ids])
 
-            if i == 0:
-                last_played = game.start_time
+            for i, (game_id, game) in enumerate(zip(game_ids, games), start):
+                if game is None:
+                    log(f"Couldn't get game for id [{
+                        game_id}] in history of [{user.summoner_name}]")
+                    continue
 
-            if game.winner == 'Remake':
-                continue
-            if self.did_user_win(user.id, game):
-                break
-            lose_streak += 1
-
-        self.player_memory[user.puuid] = {
-            'last_game': history[0],
-            'last_played': last_played,
-            'lose_streak': lose_streak,
-            'ranks': {
-                'Solo/Duo': dataclasses.replace(user.ranks['Solo/Duo']),
-                'Flex': dataclasses.replace(user.ranks['Flex'])
-            },
-            'level': user.level,
-            'name': user.summoner_name,
-            'tag': user.summoner_tag
-        }
-
-    def get_ordered_rankings(self, mode: Literal['Solo/Duo', 'Flex']) -> List[OrderedUserRank]:
-        ranked_players = [{'puuid': puuid, 'rank': m['ranks'][mode]}
-                          for puuid, m in self.player_memory.items()
-                          if m['ranks'][mode].division != 'UNRANKED']
-        ranked_players = cast(List[OrderedUserRank], ranked_players)
-        ranked_players.sort(key=lambda x: x['rank'].id(), reverse=True)
-        return ranked_players
-
-    def get_ordered_total_games(self, mode: Literal['Solo/Duo', 'Flex']) -> List[OrderedUserRank]:
-        players = [{'puuid': puuid, 'rank': m['ranks'][mode]}
-                   for puuid, m in self.player_memory.items()
-                   if m['ranks'][mode].games() > 0]
-        players = cast(List[OrderedUserRank], players)
-        players.sort(key=lambda x: x['rank'].games(), reverse=True)
-        return players
+                if i == 0:
+                    last_played = game.start_time
+                    if snapshot is not None:
+                        snapshot.games[game_id] = game
+
+                if game.winner == 'Remake':
+                    continue
+                if self.did_user_win(user.id, game):
+                    return last_played, lose_streak
+                lose_streak += 1
+
+            start += window
+            window = min(window * 2, self.HISTORY_WINDOW)
+
+        return last_played, lose_streak
+
+    def get_ordered_rankings(self, guild_id: int, mode: Literal['Solo/Duo', 'Flex'], limit: Optional[int] = None, offset: int = 0) -> List[OrderedUserRank]:
+        return self.leaderboards.top(guild_id, mode, 'Rank', limit, offset)
+
+    def get_ordered_total_games(self, guild_id: int, mode: Literal['Solo/Duo', 'Flex'], limit: Optional[int] = None, offset: int = 0) -> List[OrderedUserRank]:
+        return self.leaderboards.top(guild_id, mode, 'Games', limit, offset)
+
+    def get_ladder(self, guild_id: int, mode: Literal['Solo/Duo', 'Flex']) -> Ladder:
+        return self.leaderboards.ladder(guild_id, mode)
 
     def is_milestone_game(self, game_num: int) -> bool:
         if game_num % 50 == 0 and game_num <= 250:
@@ -241,7 +352,7 @@ class EventManager():
         response = await self.riot.get_profile_info(puuid)
         if response.error():
             response.log_error(
-                3, 'Couldn\'t get profile from puuid', 'main.events')
+                3, f'Couldn\'t get profile from puuid [{puuid}]', 'main.events')
             return False
 
         # Copy the user object so that it can be modified without
@@ -249,12 +360,13 @@ class EventManager():
         user = response.data.copy()
 
         # This is not accurate, but it accomplishes the thing I need to test for right now
-        user.ranks['Solo/Duo'].wins -= offset
+        solo_rank = user.ranks['Solo/Duo']
+        user.ranks['Solo/Duo'] = replace(solo_rank, wins=solo_rank.wins - offset)
 
         matches_res = await self.riot.get_matches_ids_by_puuid(puuid, 20)
         if matches_res.error():
             response.log_error(
-                4, 'Couldn\'t get game ids for puuid', 'main.events')
+                4, f'Couldn\'t get game ids for puuid [{puuid}]', 'main.events')
             return False
 
         await self.remember_history(user, matches_res.data[offset:])
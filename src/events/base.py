@@ -1,7 +1,7 @@
 import random
 from datetime import datetime
 from dataclasses import dataclass
-from typing import Optional, Literal
+from typing import ClassVar, Optional, Literal
 import discord
 from riot import GameInfo, UserInfo
 from utils import icon_url, random_celebration
@@ -12,6 +12,7 @@ class BaseGameEvent:
     user: UserInfo
     game: GameInfo
     type: Literal['embed', 'image'] = 'embed'
+    category: ClassVar[str] = 'Announcements'
 
     def embed(self, color: Optional[int] = None):
         embed = discord.Embed(
@@ -28,5 +29,9 @@ class BaseGameEvent:
 
         return embed
 
-    def image(self) -> str:
-        return ''
+    async def image(self) -> Optional[discord.File]:
+        return None
+
+    def summary(self) -> str:
+        '''A single line describing the event, used when announcements are grouped into a digest'''
+        return f"{self.user.summoner_name} has a new announcement"
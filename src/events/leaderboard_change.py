@@ -9,6 +9,7 @@ from .base import BaseGameEvent
 
 class LeaderboardChangeEvent(BaseGameEvent):
     mode: Literal['Solo/Duo', 'Flex']
+    category = 'Leaderboard'
 
     def __init__(self, position: int, old_user: UserInfo, new_user: UserInfo, last_game: GameInfo, mode: Literal['Solo/Duo', 'Flex']):
         super().__init__(new_user, last_game)
@@ -45,3 +46,8 @@ class LeaderboardChangeEvent(BaseGameEvent):
             text=f'Game that likely led to this, played at {time}')
 
         return embed
+
+    @override
+    def summary(self):
+        return f"{self.new_user.summoner_name} overtook {self.old_user.summoner_name} for {
+            ordinal(self.position)} place ({self.mode})"
@@ -5,6 +5,8 @@ from .base import BaseGameEvent
 
 
 class LoseStreakEvent(BaseGameEvent):
+    category = 'Lose Streaks'
+
     def __init__(self, user: UserInfo, game: GameInfo, streak: int):
         super().__init__(user, game)
         self.streak = streak
@@ -22,3 +24,7 @@ class LoseStreakEvent(BaseGameEvent):
             inline=False)
 
         return embed
+
+    @override
+    def summary(self):
+        return f"{self.user.summoner_name} lost {self.streak} games in a row"
@@ -4,6 +4,8 @@ from .base import BaseGameEvent
 
 
 class LowKDAEvent(BaseGameEvent):
+    category = 'Low KDA'
+
     @override
     def embed(self):
         embed = super().embed(0xEE4B2B)
@@ -21,3 +23,10 @@ class LowKDAEvent(BaseGameEvent):
             inline=False)
 
         return embed
+
+    @override
+    def summary(self):
+        player = self.game.get_player(self.user.id)
+        if player is None:
+            return f"{self.user.summoner_name} had a rough game"
+        return f"{self.user.summoner_name} went {player.kda()} as {player.champion_name}"
@@ -6,6 +6,7 @@ from .base import BaseGameEvent
 
 class RankChangeEvent(BaseGameEvent):
     game: Optional[GameInfo]
+    category = 'Rank Changes'
 
     def __init__(self, user: UserInfo, game: Optional[GameInfo], old_rank: Rank, mode: Literal['Flex', 'Solo/Duo']):
         super().__init__(user, game if game else GameInfo.empty())
@@ -27,6 +28,11 @@ class RankChangeEvent(BaseGameEvent):
 
         return embed
 
+    @override
+    def summary(self):
+        return f"{self.user.summoner_name} was {self.rank_dir()} from {
+            self.old_rank.full()} to {self.new_rank.full()} ({self.mode})"
+
     def rank_dir(self):
         if self.old_rank.id() < self.new_rank.id():
             return 'promoted'
@@ -1,24 +1,29 @@
-from typing import Literal, override
+import io
+from typing import Literal, Optional, override
 from riot import GameInfo, UserInfo, Rank
 import discord
 from utils import random_superlative, rank_assets
 from .base import BaseGameEvent
-from img_gen import generate_certificate
-from storage import allot_file
+from img_gen import render_certificate, certificate_encoding
+
+RANK_CUTOFF = Rank('GOLD', 'IV', 0, 0, 0)
 
 
 class TotalGamesEvent(BaseGameEvent):
+    category = 'Milestones'
+
     def __init__(self, user: UserInfo, game: GameInfo, mode: Literal['Solo/Duo', 'Flex']):
         super().__init__(user, game)
         self.mode = mode
         self.type = 'image'
 
     @override
-    def image(self) -> str:
-        file = allot_file('png')
-        generate_certificate(file['path'], self.user,
-                             self.user.ranks[self.mode])
-        return file['path']
+    async def image(self) -> Optional[discord.File]:
+        encoding = certificate_encoding()
+        data = await render_certificate(self.user, self.user.ranks[self.mode], encoding)
+        if data is None:
+            return None
+        return discord.File(io.BytesIO(data), filename=f'certificate.{encoding.format}')
 
     @override
     def embed(self):
@@ -41,8 +46,7 @@ class TotalGamesEvent(BaseGameEvent):
 
         embed.add_field(name=line1, value=line2, inline=False)
 
-        rank_cutoff = Rank('GOLD', 'IV', 0, 0, 0)
-        if rank.id() < rank_cutoff.id():
+        if rank.id() < RANK_CUTOFF.id():
             line1 = f"Through this dedication, {
                 self.user.summoner_name} has achieved a rank of {rank.full()}."
 
@@ -50,3 +54,8 @@ class TotalGamesEvent(BaseGameEvent):
             embed.add_field(name=line1, value=line2, inline=False)
 
         return embed
+
+    @override
+    def summary(self):
+        return f"{self.user.summoner_name} completed their {
+            self.user.ranks[self.mode].games()}th {self.mode} game"
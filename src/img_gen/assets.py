@@ -0,0 +1,103 @@
+import os
+from functools import lru_cache
+from typing import Callable, List, Literal, Optional
+from PIL import Image, ImageFont
+from riot import RankOption
+
+type FontName = Literal['title', 'name', 'body', 'italic']
+
+FONT_FILES: dict[FontName, str] = {
+    'title': 'assets/fonts/Beaufort/BeaufortforLOL-Bold.ttf',
+    'name': 'assets/fonts/Beaufort/BeaufortforLOL-Regular.ttf',
+    'body': 'assets/fonts/Spiegel/Spiegel_TT_SemiBold.ttf',
+    'italic': 'assets/fonts/Spiegel/Spiegel_TT_SemiBold_Italic.ttf'
+}
+FALLBACK_ICON = 'assets/unknown.png'
+
+# The name font only covers Latin, Greek and Cyrillic, so names with Korean, Japanese or
+# Chinese characters are drawn with the first of these that is installed. The Docker
+# image installs Noto Sans CJK (font-noto-cjk on Alpine, fonts-noto-cjk on Debian)
+CJK_FONT_FILES = [
+    '/usr/share/fonts/noto/NotoSansCJK-Regular.ttc',
+    '/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc',
+]
+CJK_RANGES = [
+    (0x1100, 0x11FF),    # Hangul Jamo
+    (0x2E80, 0x9FFF),    # CJK symbols, kana, Hangul compatibility Jamo and ideographs
+    (0xAC00, 0xD7AF),    # Hangul syllables
+    (0xF900, 0xFAFF),    # CJK compatibility ideographs
+    (0xFF00, 0xFFEF),    # Halfwidth and fullwidth forms
+    (0x20000, 0x3FFFF),  # Rare ideographs
+]
+
+# Everything here is loaded once per process and shared between renders, so
+# images must be copied before they are drawn on
+
+
+@lru_cache(maxsize=None)
+def font(name: FontName, size: int) -> ImageFont.FreeTypeFont:
+    return ImageFont.truetype(FONT_FILES[name], size)
+
+
+def is_cjk(text: str) -> bool:
+    return any(lo <= ord(c) <= hi for c in text for lo, hi in CJK_RANGES)
+
+
+@lru_cache(maxsize=1)
+def cjk_font_file() -> Optional[str]:
+    return next((file for file in CJK_FONT_FILES if os.path.exists(file)), None)
+
+
+@lru_cache(maxsize=None)
+def cjk_font(size: int) -> Optional[ImageFont.FreeTypeFont]:
+    file = cjk_font_file()
+    return ImageFont.truetype(file, size) if file else None
+
+
+def name_font(text: str, size: int) -> ImageFont.FreeTypeFont:
+    '''The name font, or the CJK font for names it has no glyphs for'''
+    if is_cjk(text) and (fallback := cjk_font(size)):
+        return fallback
+    return font('name', size)
+
+
+@lru_cache(maxsize=1)
+def template() -> Image.Image:
+    im = Image.open('assets/certificate-template.png')
+    im.load()
+    return im
+
+
+@lru_cache(maxsize=None)
+def logo(height: int) -> Image.Image:
+    im = Image.open('assets/logo.png')
+    return im.resize((int(height / im.height * im.width), height))
+
+
+@lru_cache(maxsize=256)
+def icon(file: str) -> Image.Image:
+    '''Decodes a profile icon, keeping the most recently used ones'''
+    im = Image.open(file)
+    im.load()
+    return im
+
+
+@lru_cache(maxsize=None)
+def rank_image(division: RankOption, width: int) -> Image.Image:
+    im = Image.open(f'assets/ranks/{division.lower()}.png')
+    return im.resize((width, int(width / im.width * im.height)))
+
+
+def largest_fitting(sizes: List[int], fits: Callable[[int], bool]) -> int:
+    '''
+    Binary searches a list of increasing sizes for the largest that fits, given that every
+    size below one that fits also fits. Falls back to the smallest size if none do.
+    '''
+    lo, hi = 0, len(sizes)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if fits(sizes[mid]):
+            lo = mid + 1
+        else:
+            hi = mid
+    return sizes[max(lo - 1, 0)]
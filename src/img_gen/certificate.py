@@ -1,8 +1,10 @@
 from PIL import Image, ImageFont, ImageDraw
-import requests
-from utils import icon_url
 import io
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Literal, Optional
 from riot import UserInfo, Rank, RankOption
+from . import assets
 
 division_colors: dict[RankOption, str] = {
     'IRON': 'darkred',
@@ -17,51 +19,49 @@ division_colors: dict[RankOption, str] = {
 }
 
 
+NAME_FONT_SIZES = list(range(5, 125, 5))
+
+
+@dataclass(frozen=True)
+class Encoding:
+    format: Literal['png', 'webp'] = 'png'
+    compress_level: int = 6
+    quality: int = 90
+
+    def options(self) -> dict:
+        if self.format == 'webp':
+            return {'quality': self.quality}
+        return {'compress_level': self.compress_level}
+
+
 class Certificate:
     user: UserInfo
     rank: Rank
+    icon: Optional[Image.Image]
 
     im: Image.Image
     draw: ImageDraw.ImageDraw
     w: int
     h: int
 
-    def __init__(self, user: UserInfo, rank: Rank) -> None:
+    def __init__(self, user: UserInfo, rank: Rank, icon: Optional[Image.Image] = None) -> None:
+        '''If the user's profile icon isn't given, the fallback icon is drawn instead'''
         self.user = user
         self.rank = rank
+        self.icon = icon
 
     def build_image(self) -> None:
-        self.im = Image.open('assets/certificate-template.png')
-        self.w, self.h = self.im.width, self.im.height
-        self.draw = ImageDraw.Draw(self.im)
-
-        self.draw_logo()
-
-        self.center_text(
-            'Congratulations!'.upper(),
-            (self.w * 0.5, self.h * 0.24),
-            ImageFont.truetype(
-                "assets/fonts/Beaufort/BeaufortforLOL-Bold.ttf", 110)
-        )
-
-        self.center_text(
-            'for',
-            (self.w * 0.5, 570),
-            ImageFont.truetype(
-                "assets/fonts/Spiegel/Spiegel_TT_SemiBold_Italic.ttf", 30)
-        )
+        # Everything that is the same for the whole division is drawn once and reused
+        self.start(base_layer(self.rank.division).copy())
 
         self.draw_user()
 
         self.center_text(
             f"Playing {self.rank.games()} Games!",
             (self.w * 0.5, 660),
-            ImageFont.truetype(
-                "assets/fonts/Spiegel/Spiegel_TT_SemiBold.ttf", 100)
+            assets.font('body', 100)
         )
 
-        self.draw_division()
-
         wr = self.rank.wins / self.rank.games()
         if wr >= 0.6:
             winrate_color = 'forestgreen'
@@ -73,64 +73,80 @@ class Certificate:
         self.center_text(
             f'WR {self.rank.winrate()}',
             (472, 820),
-            ImageFont.truetype(
-                "assets/fonts/Beaufort/BeaufortforLOL-Bold.ttf", 60),
+            assets.font('title', 60),
             winrate_color
         )
 
         self.center_text(
             self.rank.full(),
             (1091, 805),
-            ImageFont.truetype(
-                "assets/fonts/Beaufort/BeaufortforLOL-Bold.ttf", 45),
+            assets.font('title', 45),
             division_colors.get(self.rank.division, 'black')
         )
 
         self.center_text(
             f'({self.rank.lp} LP)',
             (1091, 840),
-            ImageFont.truetype(
-                "assets/fonts/Beaufort/BeaufortforLOL-Bold.ttf", 30),
+            assets.font('title', 30),
             division_colors.get(self.rank.division, 'black')
         )
 
+    def start(self, im: Image.Image) -> None:
+        self.im = im
+        self.w, self.h = self.im.width, self.im.height
+        self.draw = ImageDraw.Draw(self.im)
+
+    def draw_base(self) -> None:
+        '''Draws the parts of the certificate that don't depend on the player'''
+        self.draw_logo()
+
+        self.center_text(
+            'Congratulations!'.upper(),
+            (self.w * 0.5, self.h * 0.24),
+            assets.font('title', 110)
+        )
+
+        self.center_text(
+            'for',
+            (self.w * 0.5, 570),
+            assets.font('italic', 30)
+        )
+
+        self.draw_division()
+
         self.center_text(
             'At Completion Time',
             (1091, 885),
-            ImageFont.truetype(
-                "assets/fonts/Spiegel/Spiegel_TT_SemiBold_Italic.ttf", 30),
+            assets.font('italic', 30),
             'black'
         )
 
-    def save(self, filename: str) -> None:
-        self.im.save(filename, 'png')
+    def save(self, filename: str, encoding: Encoding = Encoding()) -> None:
+        self.im.save(filename, encoding.format, **encoding.options())
+
+    def encode(self, encoding: Encoding = Encoding()) -> bytes:
+        buffer = io.BytesIO()
+        self.im.save(buffer, encoding.format, **encoding.options())
+        return buffer.getvalue()
 
     def center_text(self, text: str, pos: tuple[float, float], font: ImageFont.FreeTypeFont, color=(0, 0, 0)):
         text_pos = (int(pos[0]), int(pos[1]))
         self.draw.text(text_pos, text, color, anchor='mm', font=font)
 
-    def get_img_from_url(self, url: str):
-        res = requests.get(url)
-        if not res.ok:
-            print(res)
-            # raise Exception(res.text)
-            return Image.open('assets/unknown.png')
-
-        return Image.open(io.BytesIO(res.content))
-
     def draw_user(self, padding=30, max_width=954):
         y_pos = 540
 
-        fontsize, total_w = 125, max_width + 1
-        while total_w > max_width:
-            fontsize -= 5
-            font = ImageFont.truetype(
-                "assets/fonts/Beaufort/BeaufortforLOL-Regular.ttf", fontsize)
-            total_w = fontsize + padding + \
-                font.getlength(self.user.summoner_name)
+        def name_width(size: int) -> float:
+            return size + padding + \
+                assets.name_font(self.user.summoner_name, size).getlength(self.user.summoner_name)
+
+        fontsize = assets.largest_fitting(
+            NAME_FONT_SIZES, lambda size: name_width(size) <= max_width)
+        font = assets.name_font(self.user.summoner_name, fontsize)
+        total_w = name_width(fontsize)
 
-        icon_im = self.get_img_from_url(
-            icon_url(self.user.icon)).resize((fontsize, fontsize))
+        icon_im = self.icon or assets.icon(assets.FALLBACK_ICON)
+        icon_im = icon_im.resize((fontsize, fontsize))
 
         icon_pos = (
             int((self.w - total_w) / 2),
@@ -147,20 +163,20 @@ class Certificate:
                        (0, 0, 0), anchor='rm', font=font)
 
     def draw_division(self, size=280):
-        im = Image.open(f'assets/ranks/{self.rank.division.lower()}.png')
-        im = im.resize((size, int(size / im.width * im.height)))
+        im = assets.rank_image(self.rank.division, size)
         img_pos = (int((self.w - im.width) / 2), int(700))
         self.im.paste(im, img_pos, im)
 
     def draw_logo(self, height=50):
-        im = Image.open('assets/logo.png')
-        im = im.resize((int(height / im.height * im.width), height))
+        im = assets.logo(height)
         img_pos = (int((self.w - im.width) / 2), 50)
         self.im.paste(im, img_pos)
 
 
-if __name__ == '__main__':
-    cert = Certificate(UserInfo(summoner_name='KAPPAMAC',
-                       icon=12), rank=Rank('CHALLENGER', None, 999, 499, 1))
-    cert.build_image()
-    cert.save('temp/output.png')
+@lru_cache(maxsize=None)
+def base_layer(division: RankOption) -> Image.Image:
+    '''Returns the template with the division's static parts already drawn on. Copy before drawing.'''
+    cert = Certificate(UserInfo(), Rank(division, None, 0, 0, 0))
+    cert.start(assets.template().copy())
+    cert.draw_base()
+    return cert.im
@@ -0,0 +1,83 @@
+import asyncio
+from datetime import datetime, timedelta
+from os import makedirs, path, replace
+from typing import Optional
+import aiohttp
+from config import get_config, LEAGUE_PATCH
+from utils import icon_url
+from logs import log
+from .assets import FALLBACK_ICON
+
+ICON_TIMEOUT = 5
+
+# Icons that couldn't be downloaded aren't retried until this long has passed
+FAILED_ICON_TTL = timedelta(hours=1)
+
+# Icons never change within a patch, so they are kept on disk for good
+icons_path = path.join(get_config().FILES_PATH, 'icons', LEAGUE_PATCH)
+
+failed_icons: dict[int, datetime] = {}
+pending_icons: dict[int, asyncio.Future[str]] = {}
+
+
+def cached_icon_path(icon_id: int) -> str:
+    return path.join(icons_path, f'{icon_id}.png')
+
+
+async def fetch_icon(icon_id: int) -> Optional[bytes]:
+    '''Downloads a profile icon, returning None if it couldn't be fetched in time'''
+    try:
+        timeout = aiohttp.ClientTimeout(total=ICON_TIMEOUT)
+        async with aiohttp.ClientSession(timeout=timeout) as session:
+            async with session.get(icon_url(icon_id)) as response:
+                if response.status != 200:
+                    log(f"Couldn't fetch profile icon [{icon_id}] ({
+                        response.status})", 'WARNING', 'main.img_gen')
+                    return None
+                return await response.read()
+    except (aiohttp.ClientError, asyncio.TimeoutError):
+        log(f"Couldn't fetch profile icon [{icon_id}]",
+            'WARNING', 'main.img_gen')
+        return None
+
+
+def save_icon(icon_id: int, data: bytes) -> str:
+    '''Writes an icon to the cache, via a temporary file so a partial icon is never read'''
+    makedirs(icons_path, exist_ok=True)
+    file = cached_icon_path(icon_id)
+    temp_file = f'{file}.tmp'
+    with open(temp_file, 'wb') as f:
+        f.write(data)
+    replace(temp_file, file)
+    return file
+
+
+async def download_icon(icon_id: int) -> str:
+    data = await fetch_icon(icon_id)
+    if data is None or not data.startswith(b'\x89PNG'):
+        failed_icons[icon_id] = datetime.now()
+        return FALLBACK_ICON
+
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, save_icon, icon_id, data)
+
+
+async def get_icon_path(icon_id: int) -> str:
+    '''
+    Returns the path of a profile icon on disk, downloading it the first time it is needed.
+    Falls back to the unknown icon if it can't be downloaded.
+    '''
+    file = cached_icon_path(icon_id)
+    if path.exists(file):
+        return file
+
+    failed_at = failed_icons.get(icon_id)
+    if failed_at and datetime.now() - failed_at < FAILED_ICON_TTL:
+        return FALLBACK_ICON
+
+    # Certificates for the same player rendered together share one download
+    if icon_id not in pending_icons:
+        pending_icons[icon_id] = asyncio.ensure_future(download_icon(icon_id))
+        pending_icons[icon_id].add_done_callback(
+            lambda _: pending_icons.pop(icon_id, None))
+    return await asyncio.shield(pending_icons[icon_id])
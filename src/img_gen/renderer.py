@@ -0,0 +1,83 @@
+import asyncio
+import multiprocessing
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+from riot import UserInfo, Rank
+from logs import log
+from config import get_config
+from .certificate import Certificate, Encoding
+from .icons import get_icon_path
+from . import assets
+
+RENDER_WORKERS = 2
+RENDER_TIMEOUT = 30
+
+pool: Optional[ProcessPoolExecutor] = None
+
+
+def get_pool() -> ProcessPoolExecutor:
+    global pool
+    if pool is None:
+        # The bot already runs threads that may hold locks, which forked workers would inherit
+        pool = ProcessPoolExecutor(max_workers=RENDER_WORKERS,
+                                   mp_context=multiprocessing.get_context('spawn'))
+    return pool
+
+
+def recycle_pool(executor: ProcessPoolExecutor) -> None:
+    '''Replaces the pool and kills its workers, which may still be stuck on a render'''
+    global pool
+    if pool is executor:
+        pool = None
+    # Shutting down doesn't stop a busy worker, and there is no public way to reach them
+    processes = list((executor._processes or {}).values())
+    executor.shutdown(wait=False, cancel_futures=True)
+    for process in processes:
+        process.kill()
+
+
+def certificate_encoding() -> Encoding:
+    config = get_config()
+    return Encoding(
+        'webp' if config.CERTIFICATE_FORMAT == 'webp' else 'png',
+        config.CERTIFICATE_PNG_COMPRESSION,
+        config.CERTIFICATE_WEBP_QUALITY)
+
+
+def render_to_bytes(user: UserInfo, rank: Rank, icon_file: str, encoding: Encoding) -> bytes:
+    '''Builds and encodes a certificate. This runs inside one of the pool's worker processes.'''
+    cert = Certificate(user, rank, assets.icon(icon_file))
+    cert.build_image()
+    return cert.encode(encoding)
+
+
+async def render_certificate(user: UserInfo, rank: Rank, encoding: Optional[Encoding] = None) -> Optional[bytes]:
+    '''
+    Renders a certificate in a worker process so the event loop is never blocked by
+    drawing or encoding. Returns the encoded image, or None if it failed or timed out.
+    '''
+    icon_file = await get_icon_path(user.icon)
+    loop = asyncio.get_running_loop()
+    executor = get_pool()
+
+    try:
+        job = loop.run_in_executor(
+            executor, render_to_bytes, user, rank, icon_file,
+            encoding or certificate_encoding())
+        return await asyncio.wait_for(job, RENDER_TIMEOUT)
+    except asyncio.TimeoutError:
+        log(f'Rendering certificate for [{user.summoner_name}] timed out, restarting the pool',
+            'ERROR', 'main.img_gen')
+        recycle_pool(executor)
+    except BrokenProcessPool:
+        if pool is executor:
+            log('Certificate rendering pool broke, it will be restarted',
+                'ERROR', 'main.img_gen')
+            recycle_pool(executor)
+    except Exception:
+        log(f"Couldn't render certificate for [{user.summoner_name}]",
+            'ERROR', 'main.img_gen')
+        log(traceback.format_exc(), 'ERROR', 'main.img_gen')
+    return None
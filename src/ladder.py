@@ -0,0 +1,69 @@
+from array import array
+from bisect import bisect_right
+from typing import Iterable, List, Optional
+from riot import Rank
+
+
+class Ladder:
+    '''
+    Column-oriented view of a guild's ranked players in one queue, from highest to lowest
+    score like the guild's rank board. Scores, games and wins are kept in typed arrays,
+    and the leaderboards insert and delete rows as players move, so guild-wide statistics
+    work on plain integers without walking the Rank objects or rebuilding anything.
+    '''
+    ranks: List[Rank]
+    scores: array
+    games: array
+    wins: array
+
+    def __init__(self, ranks: Iterable[Rank] = ()) -> None:
+        '''Ranks must already be ordered from highest to lowest score'''
+        self.ranks = []
+        self.scores = array('q')
+        self.games = array('q')
+        self.wins = array('q')
+        self.games_total = 0
+        self.wins_total = 0
+        for rank in ranks:
+            self.insert(len(self), rank)
+
+    def __len__(self) -> int:
+        return len(self.ranks)
+
+    def insert(self, i: int, rank: Rank) -> None:
+        self.ranks.insert(i, rank)
+        self.scores.insert(i, rank.score)
+        self.games.insert(i, rank.games())
+        self.wins.insert(i, rank.wins)
+        self.games_total += rank.games()
+        self.wins_total += rank.wins
+
+    def delete(self, i: int) -> None:
+        self.games_total -= self.games[i]
+        self.wins_total -= self.wins[i]
+        del self.ranks[i], self.scores[i], self.games[i], self.wins[i]
+
+    def median(self) -> Optional[Rank]:
+        '''Returns the rank of the player holding the median score'''
+        return self.ranks[len(self) // 2] if len(self) else None
+
+    def percentile(self, q: float) -> Optional[Rank]:
+        '''Returns the rank that a fraction q of the players are at or below (nearest rank)'''
+        if not len(self):
+            return None
+        ascending = min(max(int(q * len(self) + 0.5) - 1, 0), len(self) - 1)
+        return self.ranks[len(self) - 1 - ascending]
+
+    def percentile_of(self, score: int) -> float:
+        '''Returns the fraction of players with a lower score'''
+        if not len(self):
+            return 0
+        at_or_above = bisect_right(self.scores, -score, key=lambda s: -s)
+        return (len(self) - at_or_above) / len(self)
+
+    def total_games(self) -> int:
+        return self.games_total
+
+    def winrate(self) -> float:
+        '''Returns the combined winrate of every game played by the players'''
+        return self.wins_total / self.games_total if self.games_total else 0
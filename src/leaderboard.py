@@ -0,0 +1,156 @@
+from bisect import bisect_left
+from typing import Callable, Iterable, List, Literal, Optional, TypedDict
+from riot import Rank, RanksDict
+from ladder import Ladder
+
+type Mode = Literal['Solo/Duo', 'Flex']
+type Board = Literal['Rank', 'Games']
+type BoardKey = tuple[int, str]
+
+MODES: List[Mode] = ['Solo/Duo', 'Flex']
+
+# Each board orders players by a score and only includes those that pass its filter
+BOARDS: dict[Board, tuple[Callable[[Rank], int], Callable[[Rank], bool]]] = {
+    'Rank': (lambda rank: rank.score, lambda rank: rank.division != 'UNRANKED'),
+    'Games': (lambda rank: rank.games(), lambda rank: rank.games() > 0)
+}
+
+
+class OrderedUserRank(TypedDict):
+    puuid: str
+    rank: Rank
+
+
+def board_key(board: Board, puuid: str, rank: Rank) -> Optional[BoardKey]:
+    '''
+    Returns the sort key of a player on a board, or None if they don't belong on it.
+    Scores are negated so that an ascending list has the best player first, and the
+    puuid breaks ties so that every key is unique.
+    '''
+    score, include = BOARDS[board]
+    if not include(rank):
+        return None
+    return (-score(rank), puuid)
+
+
+class GuildLeaderboards:
+    '''
+    Keeps a sorted index of every guild's players for each queue and board. The index is
+    updated whenever a player's ranks are remembered, so reading the top k players of a
+    board never has to rebuild or re-sort it.
+    Every guild also has a version, which increases whenever its players or their ranks
+    change, so anything derived from a guild's boards can tell when it is out of date.
+    Each rank board has a ladder whose rows are inserted and deleted along with it.
+    '''
+    ranks: dict[str, RanksDict]
+    keys: dict[str, dict[tuple[Mode, Board], Optional[BoardKey]]]
+    members: dict[int, set[str]]
+    guilds: dict[str, set[int]]
+    boards: dict[tuple[int, Mode, Board], List[BoardKey]]
+    versions: dict[int, int]
+    ladders: dict[tuple[int, Mode], Ladder]
+
+    def __init__(self) -> None:
+        self.ranks = {}
+        self.keys = {}
+        self.members = {}
+        self.guilds = {}
+        self.boards = {}
+        self.versions = {}
+        self.ladders = {}
+
+    def set_members(self, guild_id: int, puuids: Iterable[str]) -> None:
+        '''Syncs the players on a guild's boards with the guild's tracked players'''
+        new_members = set(puuids)
+        old_members = self.members.get(guild_id, set())
+        if new_members != old_members:
+            self.bump(guild_id)
+
+        for puuid in old_members - new_members:
+            self.guilds[puuid].discard(guild_id)
+            for (mode, board), key in self.keys.get(puuid, {}).items():
+                if key is not None:
+                    self._remove(guild_id, mode, board, key)
+
+        for puuid in new_members - old_members:
+            self.guilds.setdefault(puuid, set()).add(guild_id)
+            for (mode, board), key in self.keys.get(puuid, {}).items():
+                if key is not None:
+                    self._insert(guild_id, mode, board, key)
+
+        if new_members:
+            self.members[guild_id] = new_members
+        else:
+            self.members.pop(guild_id, None)
+            for mode in MODES:
+                self.ladders.pop((guild_id, mode), None)
+                for board in BOARDS:
+                    self.boards.pop((guild_id, mode, board), None)
+
+    def update(self, puuid: str, ranks: RanksDict) -> None:
+        '''Moves a player to their new position on the boards of every guild tracking them'''
+        if self.ranks.get(puuid) != ranks:
+            for guild_id in self.guilds.get(puuid, ()):
+                self.bump(guild_id)
+        old_ranks = self.ranks.get(puuid)
+        self.ranks[puuid] = ranks
+        old_keys = self.keys.get(puuid, {})
+        new_keys = {(mode, board): board_key(board, puuid, ranks[mode])
+                    for mode in MODES for board in BOARDS}
+        self.keys[puuid] = new_keys
+
+        for (mode, board), key in new_keys.items():
+            old_key = old_keys.get((mode, board))
+            # The ladder also keeps games and wins, which can change without moving the player
+            moved = key != old_key or \
+                (board == 'Rank' and old_ranks is not None and old_ranks[mode] != ranks[mode])
+            if not moved:
+                continue
+
+            for guild_id in self.guilds.get(puuid, ()):
+                if old_key is not None:
+                    self._remove(guild_id, mode, board, old_key)
+                if key is not None:
+                    self._insert(guild_id, mode, board, key)
+
+    def version(self, guild_id: int) -> int:
+        return self.versions.get(guild_id, 0)
+
+    def bump(self, guild_id: int) -> None:
+        self.versions[guild_id] = self.version(guild_id) + 1
+
+    def board(self, guild_id: int, mode: Mode, board: Board) -> List[BoardKey]:
+        return self.boards.setdefault((guild_id, mode, board), [])
+
+    def order(self, guild_id: int, mode: Mode, board: Board = 'Rank') -> List[str]:
+        '''Returns the puuids on a guild's board from first to last place'''
+        return [puuid for _, puuid in self.boards.get((guild_id, mode, board), [])]
+
+    def size(self, guild_id: int, mode: Mode, board: Board = 'Rank') -> int:
+        return len(self.boards.get((guild_id, mode, board), []))
+
+    def top(self, guild_id: int, mode: Mode, board: Board = 'Rank', k: Optional[int] = None, offset: int = 0) -> List[OrderedUserRank]:
+        '''Returns the first k players (or all of them) on a guild's board, after skipping offset players'''
+        entries = self.boards.get((guild_id, mode, board), [])
+        if k is not None or offset:
+            entries = entries[offset:None if k is None else offset + k]
+        return [{'puuid': puuid, 'rank': self.ranks[puuid][mode]} for _, puuid in entries]
+
+    def ladder(self, guild_id: int, mode: Mode) -> Ladder:
+        '''Returns the columns of a guild's rank board, kept up to date with it'''
+        return self.ladders.setdefault((guild_id, mode), Ladder())
+
+    def _insert(self, guild_id: int, mode: Mode, board: Board, key: BoardKey) -> None:
+        entries = self.board(guild_id, mode, board)
+        i = bisect_left(entries, key)
+        entries.insert(i, key)
+        if board == 'Rank':
+            self.ladder(guild_id, mode).insert(i, self.ranks[key[1]][mode])
+
+    def _remove(self, guild_id: int, mode: Mode, board: Board, key: BoardKey) -> None:
+        entries = self.board(guild_id, mode, board)
+        i = bisect_left(entries, key)
+        if i < len(entries) and entries[i] == key:
+            del entries[i]
+            if board == 'Rank':
+                self.ladder(guild_id, mode).delete(i)
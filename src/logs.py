@@ -1,5 +1,12 @@
+import atexit
+import json
+import os
+import queue
 import sys
+import threading
+import time
 from datetime import datetime
+from typing import Literal, Optional
 import discord
 from colorist import Color, Effect
 from utils import r_pad
@@ -10,20 +17,153 @@ def style(text: str, color: str = Color.DEFAULT, bold=False):
 
 
 level_colors = {
+    'DEBUG': Color.BLACK,
     'INFO': Color.BLUE,
     'WARNING': Color.YELLOW,
     'ERROR': Color.RED,
     'COMMAND': Color.CYAN
 }
 
+levels = {
+    'DEBUG': 10,
+    'INFO': 20,
+    'COMMAND': 20,
+    'WARNING': 30,
+    'ERROR': 40
+}
+
+type LogFormat = Literal['text', 'json']
+
+# Repeats of the same warning or error within this many seconds are only counted
+SUPPRESS_WINDOW = 60
+SUPPRESS_LEVEL = levels['WARNING']
+MAX_TRACKED_REPEATS = 1000
+
+# (time, level, source, message), or None to stop the writer
+type Record = Optional[tuple[float, str, str, str]]
+
+min_level = levels['INFO']
+log_format: LogFormat = 'text'
+
+records: queue.SimpleQueue[Record] = queue.SimpleQueue()
+writer: Optional[threading.Thread] = None
+writer_lock = threading.Lock()
+
+repeats: dict[tuple[str, str, str], list] = {}
+repeats_lock = threading.Lock()
+
+
+def configure(level: str = 'INFO', format: LogFormat = 'text') -> None:
+    global min_level, log_format
+    min_level = levels.get(level.upper(), levels['INFO'])
+    log_format = format
+
+
+def format_record(timestamp: float, level: str, source: str, message: str) -> str:
+    if log_format == 'json':
+        return json.dumps({
+            'time': datetime.fromtimestamp(timestamp).isoformat(timespec='milliseconds'),
+            'level': level,
+            'source': source,
+            'message': message
+        })
 
-def log(message, level="INFO", source='main'):
     timestamp_str = style(
-        datetime.now().strftime("%Y-%m-%d %H:%M:%S"), Color.BLACK, True)
+        datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M:%S"), Color.BLACK, True)
     level_s = style(r_pad(level), level_colors.get(level, Color.GREEN), True)
     log_origin = style(source, Color.MAGENTA)
-    out = sys.stdout if level != 'ERROR' else sys.stderr
-    print(f"{timestamp_str} {level_s} {log_origin} {message}", file=out)
+    return f"{timestamp_str} {level_s} {log_origin} {message}"
+
+
+def write_records() -> None:
+    '''Formats and prints queued records, run by the writer thread'''
+    while (record := records.get()) is not None:
+        try:
+            out = sys.stdout if record[1] != 'ERROR' else sys.stderr
+            print(format_record(*record), file=out, flush=records.empty())
+        except Exception:
+            pass
+
+
+def start_writer() -> None:
+    global writer
+    with writer_lock:
+        if writer is None or not writer.is_alive():
+            writer = threading.Thread(
+                target=write_records, name='log-writer', daemon=True)
+            writer.start()
+
+
+@atexit.register
+def flush() -> None:
+    '''Stops the writer once everything logged so far has been printed'''
+    global writer
+    with writer_lock:
+        if writer is None:
+            return
+        records.put(None)
+        writer.join(timeout=5)
+        writer = None
+
+
+def reset_writer() -> None:
+    '''
+    Forked processes don't inherit the writer thread, so they start their own. Locks are
+    replaced too, since a thread of the parent may have been holding one during the fork.
+    '''
+    global writer, records, writer_lock, repeats, repeats_lock
+    writer = None
+    records = queue.SimpleQueue()
+    writer_lock = threading.Lock()
+    repeats = {}
+    repeats_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=reset_writer)
+
+
+def suppress(timestamp: float, level: str, source: str, message: str) -> Optional[str]:
+    '''
+    Returns None if the same message was already logged recently, otherwise the message to
+    log, noting how many repeats of it were skipped since it was last logged
+    '''
+    key = (level, source, message)
+    with repeats_lock:
+        seen = repeats.get(key)
+        if seen is not None and timestamp - seen[0] < SUPPRESS_WINDOW:
+            seen[1] += 1
+            return None
+
+        if len(repeats) >= MAX_TRACKED_REPEATS:
+            for old_key in [k for k, (last, _) in repeats.items()
+                            if timestamp - last >= SUPPRESS_WINDOW]:
+                del repeats[old_key]
+        repeats[key] = [timestamp, 0]
+
+    if seen is not None and seen[1]:
+        return f'{message} (repeated {seen[1]} more times in the last {
+            round(timestamp - seen[0])}s)'
+    return message
+
+
+def log(message, level="INFO", source='main'):
+    '''
+    Queues a message to be printed by the log writer thread. Messages below the configured
+    level are dropped before any formatting happens.
+    '''
+    if levels.get(level, levels['INFO']) < min_level:
+        return
+
+    timestamp = time.time()
+    message = str(message)
+    if levels.get(level, levels['INFO']) >= SUPPRESS_LEVEL:
+        message = suppress(timestamp, level, source, message)
+        if message is None:
+            return
+
+    if writer is None:
+        start_writer()
+    records.put((timestamp, level, source, message))
 
 
 def log_command(i: discord.Interaction) -> None:
@@ -1,38 +1,53 @@
-from math import ceil
+import sys
+import math
 import traceback
 import discord
 from discord.ext import commands as discord_commands, tasks
-from typing import List, Literal, Optional, cast
+from typing import List, Literal, Optional
 import embed_generator
 from events import BaseGameEvent
 from riot import RiotAPI
-from logs import log, log_command
+from logs import log, log_command, configure as configure_logs
 from event_manager import EventManager
-from utils import num_of, flat, print_header
+from utils import num_of, print_header
 from config import get_config
+from delivery import Delivery, send_followup
+from announcements import build_messages
+from render_cache import RenderCache
+from pagination import PageView, page_count
+import champions
+import tracing
+import metrics
+import profiler
+from watchdog import LoopWatchdog
+from sharding import ShardGateway
 import storage
 
 ROLAND_USER_ID = 698818240184451103
+CHECK_INTERVAL = 300  # Check for announcements every 5 mins
 
 
 def main():
     print_header()
     CONFIG = get_config()
+    configure_logs(CONFIG.LOG_LEVEL, CONFIG.LOG_FORMAT)
 
     tracked_players, output_channels = storage.read()
 
     bot = discord_commands.Bot(
-        command_prefix="!", intents=discord.Intents.default())
+        command_prefix="!", intents=discord.Intents.default(),
+        tree_cls=profiler.CommandTree)
     riot_client = RiotAPI(CONFIG.RIOT_TOKEN, CONFIG.SERVER,
                           CONFIG.REGION, CONFIG.API_THREADS)
     events = EventManager(riot_client)
-
-    def get_mentions_from_events(events: List[BaseGameEvent], guild_id: int) -> str:
-        puuids = [e.user.puuid for e in events]
-        tracked = tracked_players[guild_id]
-        discord_ids = flat([t['claimed_users']
-                           for t in tracked if t['puuid'] in puuids])
-        return ' '.join(map(lambda id: f'<@{id}>', [*set(discord_ids)]))
+    # With workers, they poll the Riot API and this process only announces what they find
+    shards = ShardGateway(events, CONFIG.SHARD_ADDRESS,
+                          CONFIG.SHARD_AUTHKEY.encode() if CONFIG.SHARD_AUTHKEY else None) \
+        if CONFIG.SHARD_WORKERS else None
+    delivery = Delivery(bot)
+    render_cache = RenderCache()
+    checker_heartbeat = metrics.Heartbeat(interval=CHECK_INTERVAL)
+    watchdog = LoopWatchdog()
 
     async def get_user_from_name(interaction: discord.Interaction, name: str, tag: str):
         puuid_res = await riot_client.get_riot_account_puuid(name, tag)
@@ -53,6 +68,10 @@ def main():
 
     @bot.event
     async def on_ready():
+        watchdog.start()
+        if CONFIG.METRICS_PORT is not None:
+            await metrics.start_server(CONFIG.METRICS_PORT, liveness, readiness)
+        champions.start_refresh()
         await bot.tree.sync()
         log(f"Logged in as {bot.user} (ID: {bot.user.id if bot.user else ''})")
         await bot.change_presence(
@@ -60,8 +79,18 @@ def main():
                 "League of Legends")
         )
 
-        for tracked in tracked_players.values():
-            await events.check([p['puuid'] for p in tracked], quiet=True)
+        if shards is not None:
+            await shards.start(CONFIG.SHARD_WORKERS)
+
+        with tracing.cycle('startup', player_name):
+            if shards is not None:
+                await shards.check({guild_id: [p['puuid'] for p in tracked]
+                                    for guild_id, tracked in tracked_players.items()}, quiet=True)
+            for guild_id, tracked in tracked_players.items():
+                puuids = [p['puuid'] for p in tracked]
+                events.set_guild_players(guild_id, puuids)
+                if shards is None:
+                    await events.check(puuids, quiet=True)
 
         log('Starting automatic announcement checker')
         if not automatic_announcement_check.is_running():
@@ -89,7 +118,7 @@ def main():
             tracked_players[g_id] = []
 
         tracked_players[g_id].append({
-            'puuid': user.puuid,
+            'puuid': sys.intern(user.puuid),
             'name': user.summoner_name,
             'tag': user.summoner_tag.upper(),
             'level': user.level,
@@ -100,6 +129,9 @@ def main():
             f'Began tracking {user.summoner_name}#{user.summoner_tag}.',
             embed=embed_generator.mini_user(user)
         )
+        render_cache.invalidate(g_id)
+        events.set_guild_players(
+            g_id, [p['puuid'] for p in tracked_players[g_id]])
         await events.check([user.puuid], quiet=True)
         storage.write(tracked_players, output_channels)
 
@@ -139,7 +171,7 @@ def main():
                 continue
 
             tracked_players[g_id].append({
-                'puuid': user.puuid,
+                'puuid': sys.intern(user.puuid),
                 'name': user.summoner_name,
                 'tag': tag.upper(),
                 'level': user.level,
@@ -154,6 +186,9 @@ def main():
         else:
             await interaction.response.send_message(message)
 
+        render_cache.invalidate(g_id)
+        events.set_guild_players(
+            g_id, [p['puuid'] for p in tracked_players[g_id]])
         await events.check(added_puuids, quiet=True)
         storage.write(tracked_players, output_channels)
 
@@ -180,6 +215,8 @@ def main():
             return
 
         deleted_player = tracked.pop(index - 1)
+        render_cache.invalidate(g_id)
+        events.set_guild_players(g_id, [p['puuid'] for p in tracked])
 
         if len(tracked) == 0:
             del tracked_players[g_id]
@@ -203,14 +240,23 @@ def main():
             return
         tracked = tracked_players[g_id]
 
-        embed = embed_generator.tracked_list(tracked, offset)
-        await interaction.response.send_message(embed=embed)
+        def render(page: int):
+            return render_cache.get(
+                g_id, ('list', page), render_cache.version(g_id),
+                lambda: embed_generator.tracked_list(tracked, page))
+
+        def count():
+            return page_count(len(tracked), embed_generator.LIST_PAGE_SIZE)
+
+        await PageView(render, count, offset).send(interaction)
 
     @bot.tree.command(name="profile", description="Shows profile of a player")
     async def profile(interaction: discord.Interaction, name: str, tag: str):
         log_command(interaction)
         if user := await get_user_from_name(interaction, name, tag):
-            await interaction.response.send_message(embed=embed_generator.big_user(user))
+            ladders = {mode: events.get_ladder(interaction.guild_id, mode)
+                       for mode in ('Solo/Duo', 'Flex')} if interaction.guild_id else None
+            await interaction.response.send_message(embed=embed_generator.big_user(user, ladders))
 
     @bot.tree.command(name="run_checks", description="Manually check for new announcements")
     async def run_checks(interaction: discord.Interaction):
@@ -225,8 +271,13 @@ def main():
 
         await interaction.response.defer()
 
-        announcments = await events.check([p['puuid'] for p in tracked], g_id)
-        await broadcast_events(announcments, g_id, interaction.channel_id, interaction)
+        with tracing.cycle('manual check', player_name):
+            puuids = [p['puuid'] for p in tracked]
+            if shards is not None:
+                announcments = (await shards.check({g_id: puuids})).get(g_id, [])
+            else:
+                announcments = await events.check(puuids, g_id)
+            await broadcast_events(announcments, g_id, interaction.channel_id, interaction)
 
     @bot.tree.command(name="rollback_memory", description="Resets tracking to before a certain number of games for a user")
     async def rollback_memory(interaction: discord.Interaction, username: Optional[str] = None, games: int = 1):
@@ -253,7 +304,10 @@ def main():
         result = f'Result (Matched {num_of("User", len(puuids))}){
             ":" if puuids else ""}'
         for name, puuid in puuids:
-            success = await events.set_memory_to_game(puuid, offset=games)
+            if shards is not None:
+                success = await shards.rollback(puuid, games)
+            else:
+                success = await events.set_memory_to_game(puuid, offset=games)
             result += f'\n- {name}: {"Success" if success else 'Failed'}'
 
         await interaction.followup.send(result)
@@ -287,6 +341,22 @@ def main():
             await channel.send('I will now send announcements here')
         storage.write(tracked_players, output_channels)
 
+    @bot.tree.command(name="digest", description="Group each check's announcements into a summary")
+    async def set_digest(interaction: discord.Interaction, mode: Literal['Off', 'Player', 'Type']):
+        log_command(interaction)
+        if interaction.guild_id is None:
+            await interaction.response.send_message(f'Could not get guild id')
+            return
+
+        if mode == 'Off':
+            storage.digest_modes.pop(interaction.guild_id, None)
+            await interaction.response.send_message('Announcements will be sent separately')
+        else:
+            storage.digest_modes[interaction.guild_id] = mode
+            await interaction.response.send_message(
+                f'Announcements will be grouped by {mode.lower()}')
+        storage.write(tracked_players, output_channels)
+
     @bot.tree.command(name="autochecker", description="Inspect and modify the automatic checker")
     async def autochecker(interaction: discord.Interaction, command: Literal['status', 'pause', 'unpause', 'start']):
         log_command(interaction)
@@ -360,6 +430,7 @@ def main():
         index -= 1
 
         tracked[index]['claimed_users'].add(interaction.user.id)
+        render_cache.invalidate(g_id)
         await interaction.response.send_message(f"You have claimed {tracked[index]['name']}#{tracked[index]['tag']}")
         storage.write(tracked_players, output_channels)
 
@@ -385,6 +456,7 @@ def main():
         claimed = tracked[index]['claimed_users']
         if interaction.user.id in claimed:
             claimed.remove(interaction.user.id)
+            render_cache.invalidate(g_id)
             await interaction.response.send_message(f"You have unclaimed {tracked[index]['name']}#{tracked[index]['tag']}")
             storage.write(tracked_players, output_channels)
         else:
@@ -428,25 +500,33 @@ def main():
             return
         tracked = tracked_players[g_id]
 
-        if board == 'Rank':
-            ranked_players = events.get_ordered_rankings(mode)
-        else:
-            ranked_players = events.get_ordered_total_games(mode)
-
         if board == 'Games':
-            text = embed_generator.total_games_string(
-                mode, ranked_players, tracked)
-            await interaction.response.send_message(text)
-            return
-
-        if view == 'Embed':
-            embed = embed_generator.leaderboard(
-                mode, ranked_players[:24], tracked)
-            await interaction.response.send_message(embed=embed)
-        else:
-            text = embed_generator.leaderboard_string(
-                mode, ranked_players, tracked)
-            await interaction.response.send_message(text)
+            view = 'Text'
+        page_size = embed_generator.LEADERBOARD_PAGE_SIZE if view == 'Embed' \
+            else embed_generator.TEXT_PAGE_SIZE
+
+        def count():
+            return page_count(events.leaderboards.size(g_id, mode, board), page_size)
+
+        def build(page: int):
+            pages = count()
+            if board == 'Games':
+                return embed_generator.total_games_string(
+                    mode, events.get_ordered_total_games(g_id, mode, page_size, page * page_size), tracked, page, pages)
+            if view == 'Embed':
+                return embed_generator.leaderboard(
+                    mode, events.get_ordered_rankings(g_id, mode, page_size, page * page_size), tracked,
+                    events.get_ladder(g_id, mode), page, pages)
+            return embed_generator.leaderboard_string(
+                mode, events.get_ordered_rankings(g_id, mode, page_size, page * page_size), tracked, page, pages)
+
+        # Pages are served from the cache until the guild's ranks or tracked players change
+        def render(page: int):
+            version = (events.leaderboards.version(g_id),
+                       render_cache.version(g_id))
+            return render_cache.get(g_id, (mode, view, board, page), version, lambda: build(page))
+
+        await PageView(render, count).send(interaction)
 
     @bot.tree.command(name="export_memory", description="Exports all of the persistent memory of the bot")
     async def export_memory(interaction: discord.Interaction):
@@ -458,6 +538,49 @@ def main():
         file = storage.memory_file_name()
         await interaction.response.send_message(file=discord.File(file))
 
+    @bot.tree.command(name="profiler", description="Profiles the next automatic checks or commands and sends the samples")
+    async def profiler_command(interaction: discord.Interaction, command: Literal['cycles', 'commands', 'status', 'stop'], count: int = 1):
+        log_command(interaction)
+        if interaction.user.id != CONFIG.OWNER_DISCORD_ID:
+            await interaction.response.send_message('You do not have the permissions to use this command')
+            return
+
+        session = profiler.session
+        if command == 'status':
+            if session is None:
+                await interaction.response.send_message('The profiler is not running')
+            else:
+                await interaction.response.send_message(
+                    f'Profiling {session.target}: {session.completed}/{session.count} done, {session.profiler.samples} samples so far')
+
+        elif command == 'stop':
+            if (stopped := profiler.stop()) is None:
+                await interaction.response.send_message('The profiler is not running')
+                return
+            log('Profiler - stopped')
+            report = profiler.report(stopped)
+            await interaction.response.send_message(report.content, files=report.files)
+
+        elif session is not None:
+            await interaction.response.send_message(
+                f'The profiler is already profiling {session.target}, stop it first')
+
+        else:
+            session = profiler.start(command, count, interaction.channel_id, send_profile)
+            log(f'Profiler - {session.count} {command}')
+            await interaction.response.send_message(
+                f'Profiling the next {num_of(command[:-1], session.count)}, the samples will be sent here')
+
+    @bot.event
+    async def on_app_command_completion(interaction: discord.Interaction, command):
+        if command.name != 'profiler':
+            await send_profile(profiler.finished(interaction.extras.get('profiling')))
+
+    async def send_profile(done: Optional[profiler.ProfilingSession]):
+        if done is not None:
+            log(f'Profiler - finished {num_of(done.target[:-1], done.completed)}')
+            await delivery.enqueue(done.channel_id, [profiler.report(done)])
+
     # @bot.tree.command(name="sync", description="Refresh bot commands")
     # async def sync(interaction: discord.Interaction):
     #     log_command(interaction)
@@ -468,15 +591,24 @@ def main():
     #     await bot.tree.sync(guild=discord.Object(interaction.guild_id))
     #     await interaction.followup.send('Commands Synced')
 
+    def player_name(puuid: str) -> str:
+        memory = events.player_memory.get(puuid)
+        return f'{memory.name}#{memory.tag}' if memory else puuid
+
     def update_remembered_levels():
-        for puuid, memory in events.player_memory.items():
-            for tracked in tracked_players.values():
-                for player in tracked:
-                    if player['puuid'] == puuid:
-                        player['level'] = memory['level']
-                        player['name'] = memory['name']
-                        player['tag'] = memory['tag']
-                        break
+        for guild_id, tracked in tracked_players.items():
+            changed = False
+            for player in tracked:
+                memory = events.player_memory.get(player['puuid'])
+                if memory is None:
+                    continue
+                if (player['level'], player['name'], player['tag']) != (memory.level, memory.name, memory.tag):
+                    player['level'] = memory.level
+                    player['name'] = memory.name
+                    player['tag'] = memory.tag
+                    changed = True
+            if changed:
+                render_cache.invalidate(guild_id)
         storage.write(tracked_players, output_channels)
 
     async def broadcast_events(events: List[BaseGameEvent], guild_id: int, channel_id: int, interaction: discord.Interaction):
@@ -485,51 +617,86 @@ def main():
                 await interaction.followup.send('No new announcements')
             return
 
-        image_events = [e for e in events if e.type == 'image']
-        if len(image_events) > 0:
-            get_mentions_from_events(image_events, guild_id)
-            files = [discord.File(e.image()) for e in image_events]
-            channel = cast(discord.TextChannel,
-                           bot.get_channel(channel_id))
-            await channel.send(files=files)
-
-        embed_events = [e for e in events if e.type == 'embed']
-        if len(embed_events) == 0 and interaction is not None:
-            await interaction.followup.send('No embed announcements...')
-            return
+        messages = await build_messages(events, tracked_players[guild_id],
+                                        storage.digest_modes.get(guild_id, 'Off'))
 
+        # The command is answered with the first message, and the rest are sent to the channel
         if interaction is not None:
-            embeds = [e.embed() for e in embed_events[:10]]
-            mentions = get_mentions_from_events(embed_events[:10], guild_id)
-
-            if len(embeds) > 10:
-                mentions += f' (And {num_of('other announcement',
-                                            len(embeds) - 10)}...)'
-            await interaction.followup.send(mentions, embeds=embeds[:10])
+            with tracing.span('discord_send'):
+                await send_followup(interaction, messages.pop(0))
+        with tracing.span('delivery_enqueue'):
+            await delivery.enqueue(channel_id, messages)
 
-        else:
-            embeds = [e.embed() for e in embed_events]
-            channel = cast(discord.TextChannel, bot.get_channel(channel_id))
-            for i in range(0, ceil(len(embeds) / 10), 10):
-                mentions = get_mentions_from_events(
-                    embed_events[i:i + 10], guild_id)
-                await channel.send(mentions, embeds=embeds[i:i + 10])
-
-    @tasks.loop(seconds=300)  # Repeat every 5 mins
+    @tasks.loop(seconds=CHECK_INTERVAL)
     async def automatic_announcement_check():
-        for guild_id, channel_id in output_channels.items():
-            if guild_id not in tracked_players:
-                continue
-
-            try:
-                announcments = await events.check([p['puuid'] for p in tracked_players[guild_id]], guild_id)
-            except Exception:
-                log(f'Couldn\'t check announcements for [{guild_id}]', 'ERROR')
-                log(traceback.format_exc(), 'ERROR')
-                continue
-
-            await broadcast_events(announcments, guild_id, channel_id, None)
-            update_remembered_levels()
+        interval = automatic_announcement_check.seconds
+        next_time = automatic_announcement_check.next_iteration
+        checker_heartbeat.start(
+            next_time.timestamp() - interval if next_time else None)
+        # A cycle that was already running when the profiler started isn't profiled
+        profiling = profiler.begin('cycles')
+        try:
+            with tracing.cycle('automatic check', player_name):
+                guilds = {guild_id: [p['puuid'] for p in tracked_players[guild_id]]
+                          for guild_id in output_channels if guild_id in tracked_players}
+                found = {}
+                if shards is not None:
+                    # The workers check every guild at once, and each player only once
+                    try:
+                        found = await shards.check(guilds)
+                    except Exception:
+                        log('Couldn\'t check announcements with the workers', 'ERROR')
+                        log(traceback.format_exc(), 'ERROR')
+
+                for guild_id, channel_id in output_channels.items():
+                    if guild_id not in tracked_players:
+                        continue
+
+                    try:
+                        if shards is not None:
+                            announcments = found.get(guild_id, [])
+                        else:
+                            announcments = await events.check(guilds[guild_id], guild_id)
+                    except Exception:
+                        log(f'Couldn\'t check announcements for [{guild_id}]', 'ERROR')
+                        log(traceback.format_exc(), 'ERROR')
+                        continue
+
+                    await broadcast_events(announcments, guild_id, channel_id, None)
+                    update_remembered_levels()
+        except BaseException:
+            profiler.cancel(profiling)
+            raise
+        checker_heartbeat.finish()
+        await send_profile(profiler.finished(profiling))
+
+    def liveness() -> Optional[str]:
+        '''Fails if the automatic checker crashed or stopped running while it wasn't paused'''
+        if automatic_announcement_check.failed():
+            return 'The automatic checker crashed'
+        if automatic_announcement_check.is_running() and automatic_announcement_check.next_iteration:
+            return checker_heartbeat.stalled()
+        return None
+
+    def readiness() -> Optional[str]:
+        if not bot.is_ready():
+            return 'Not connected to Discord'
+        if checker_heartbeat.started is None:
+            return 'The automatic checker has not started yet'
+        return liveness()
+
+    def bot_metrics():
+        yield from checker_heartbeat.metrics('automatic_check')
+        yield metrics.Metric('tracked_players', 'Distinct players tracked across all guilds').add(
+            len({p['puuid'] for tracked in tracked_players.values() for p in tracked}))
+        yield metrics.Metric('tracking_guilds', 'Guilds tracking at least one player').add(len(tracked_players))
+        yield metrics.Metric('remembered_players', 'Players remembered by the event manager').add(len(events.player_memory))
+        yield metrics.Metric('delivery_queue_depth', 'Messages waiting to be sent to Discord').add(delivery.pending())
+        yield metrics.Metric('delivery_channels', 'Channels with a delivery queue').add(len(delivery.queues))
+        if not math.isnan(bot.latency):
+            yield metrics.Metric('discord_latency_seconds', 'Discord websocket heartbeat latency').add(bot.latency)
+
+    metrics.add_collector(bot_metrics)
 
     bot.run(CONFIG.DISCORD_TOKEN)
 
@@ -0,0 +1,222 @@
+import os
+import resource
+import traceback
+from collections import Counter
+from dataclasses import dataclass, field
+from time import time
+from typing import Callable, Iterable, List, Literal, Optional
+from aiohttp import web
+from riot.rate_limiting import rate_limit_info
+from utils import cache_info
+from logs import log
+import logs
+import tracing
+
+PREFIX = 'league_bot'
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# A periodic task is stalled if it hasn't started an iteration for this many intervals
+STALL_FACTOR = 3
+
+type MetricType = Literal['gauge', 'counter']
+type Labels = dict[str, str]
+
+# Returns why the bot isn't healthy, or None if it is
+type HealthCheck = Callable[[], Optional[str]]
+
+
+@dataclass
+class Metric:
+    name: str
+    help: str
+    type: MetricType = 'gauge'
+    samples: List[tuple[Labels, float]] = field(default_factory=list)
+
+    def add(self, value: float, **labels: str) -> 'Metric':
+        self.samples.append((labels, value))
+        return self
+
+
+@dataclass
+class Heartbeat:
+    '''Follows the iterations of a periodic task, so that a stalled task can be detected'''
+    interval: float
+    started: Optional[float] = None
+    finished: Optional[float] = None
+    duration: Optional[float] = None
+    lag: float = 0
+    iterations: int = 0
+
+    def start(self, scheduled: Optional[float] = None) -> None:
+        '''Marks the start of an iteration, and how late it is compared to its scheduled time'''
+        self.started = time()
+        if scheduled is not None:
+            self.lag = max(self.started - scheduled, 0)
+
+    def finish(self) -> None:
+        self.finished = time()
+        self.duration = self.finished - (self.started or self.finished)
+        self.iterations += 1
+
+    def stalled(self) -> Optional[str]:
+        if self.started is None:
+            return None
+        since = time() - self.started
+        if since > self.interval * STALL_FACTOR:
+            return f'No iteration has started for {since:.0f}s'
+        return None
+
+    def metrics(self, task: str) -> Iterable[Metric]:
+        yield Metric('task_lag_seconds', 'How late the last iteration started compared to its schedule').add(self.lag, task=task)
+        yield Metric('task_iterations_total', 'Iterations completed', 'counter').add(self.iterations, task=task)
+        if self.duration is not None:
+            yield Metric('task_duration_seconds', 'How long the last completed iteration took').add(self.duration, task=task)
+        if self.started is not None:
+            yield Metric('task_last_start_timestamp_seconds', 'When the last iteration started').add(self.started, task=task)
+
+
+event_counts: Counter[str] = Counter()
+collectors: List[Callable[[], Iterable[Metric]]] = []
+
+runner: Optional[web.AppRunner] = None
+
+
+def count_events(events: Iterable[object]) -> None:
+    event_counts.update(type(e).__name__ for e in events)
+
+
+def add_collector(collector: Callable[[], Iterable[Metric]]) -> None:
+    '''Registers a function that reports metrics owned by another part of the bot'''
+    collectors.append(collector)
+
+
+def escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def fmt_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def render(metrics: Iterable[Metric]) -> str:
+    '''Formats metrics in the Prometheus text exposition format'''
+    lines = []
+    for m in metrics:
+        name = f'{PREFIX}_{m.name}'
+        lines.append(f'# HELP {name} {m.help}')
+        lines.append(f'# TYPE {name} {m.type}')
+        for labels, value in m.samples:
+            label_s = ','.join(f'{k}="{escape(v)}"' for k, v in labels.items())
+            lines.append(f'{name}{{{label_s}}} {fmt_value(value)}' if label_s
+                         else f'{name} {fmt_value(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+def rss_bytes() -> int:
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        # Peak rather than current usage, but better than nothing off Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def process_metrics() -> Iterable[Metric]:
+    yield Metric('resident_memory_bytes', 'Resident set size of the bot process').add(rss_bytes())
+    yield Metric('log_queue_depth', 'Log records waiting to be written').add(logs.records.qsize())
+
+
+def rate_limit_metrics() -> Iterable[Metric]:
+    used = Metric('rate_limit_used_calls',
+                  'Calls made or in flight in the current rate-limit window')
+    headroom = Metric('rate_limit_headroom_calls',
+                      'Calls left in the current rate-limit window')
+    waiting = Metric('rate_limit_waiting_calls',
+                     'Calls waiting for the next rate-limit window')
+    limited = Metric('rate_limit_exceeded_total',
+                     'Responses rejected by the Riot API with a 429', 'counter')
+    for name, info in rate_limit_info.items():
+        calls = info['completed_calls'] + info['active_calls']
+        used.add(calls, limiter=name)
+        headroom.add(max(info['max_calls'] - calls, 0), limiter=name)
+        waiting.add(info['waiting_calls'], limiter=name)
+        limited.add(info['rate_limited'], limiter=name)
+    return [used, headroom, waiting, limited]
+
+
+def cache_metrics() -> Iterable[Metric]:
+    hits = Metric('cache_hits_total', 'Cached API responses that were reused', 'counter')
+    misses = Metric('cache_misses_total', 'API calls that missed the cache', 'counter')
+    ratio = Metric('cache_hit_ratio', 'Fraction of API calls served from the cache')
+    for name, info in cache_info.items():
+        hits.add(info['hits'], cache=name)
+        misses.add(info['misses'], cache=name)
+        total = info['hits'] + info['misses']
+        ratio.add(info['hits'] / total if total else 0, cache=name)
+    return [hits, misses, ratio]
+
+
+def cycle_metrics() -> Iterable[Metric]:
+    events = Metric('events_total', 'Announcements found, by type', 'counter')
+    for name, count in sorted(event_counts.items()):
+        events.add(count, type=name)
+    yield events
+
+    cycles = tracing.recent()
+    if not cycles:
+        return
+    last = cycles[-1]
+    yield Metric('cycle_duration_seconds', 'How long the last cycle took').add(last.duration or 0, cycle=last.name)
+    yield Metric('cycle_timestamp_seconds', 'When the last cycle started').add(last.started, cycle=last.name)
+    phases = Metric('cycle_phase_seconds',
+                    'Time spent in each phase of the last cycle, summed across concurrent tasks')
+    for s in last.stats():
+        phases.add(s.total, phase=s.phase)
+    yield phases
+
+
+def collect() -> List[Metric]:
+    metrics: List[Metric] = []
+    for collector in [process_metrics, rate_limit_metrics, cache_metrics, cycle_metrics, *collectors]:
+        try:
+            metrics.extend(collector())
+        except Exception:
+            log("Couldn't collect metrics", 'ERROR', 'main.metrics')
+            log(traceback.format_exc(), 'ERROR', 'main.metrics')
+    return metrics
+
+
+def health_response(check: HealthCheck) -> web.Response:
+    problem = check()
+    if problem is not None:
+        return web.Response(status=503, text=f'{problem}\n')
+    return web.Response(text='ok\n')
+
+
+async def start_server(port: int, live: HealthCheck, ready: HealthCheck, host: str = '0.0.0.0') -> None:
+    '''
+    Serves /metrics, plus /healthz (liveness) and /readyz (readiness), which answer 503 with
+    the reason when their check fails
+    '''
+    global runner
+    if runner is not None:
+        return
+
+    async def metrics_handler(request: web.Request) -> web.Response:
+        return web.Response(body=render(collect()).encode(),
+                            headers={'Content-Type': CONTENT_TYPE})
+
+    async def live_handler(request: web.Request) -> web.Response:
+        return health_response(live)
+
+    async def ready_handler(request: web.Request) -> web.Response:
+        return health_response(ready)
+
+    app = web.Application()
+    app.add_routes([web.get('/metrics', metrics_handler),
+                    web.get('/healthz', live_handler),
+                    web.get('/readyz', ready_handler)])
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    log(f'Serving metrics and health checks on port {port}', source='main.metrics')
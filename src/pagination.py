@@ -0,0 +1,87 @@
+from typing import Callable, Optional
+import discord
+
+# How long the buttons keep working after the last time they were used
+PAGES_TIMEOUT = 10 * 60
+
+type Page = discord.Embed | str
+
+
+def page_count(items: int, page_size: int) -> int:
+    return max((items + page_size - 1) // page_size, 1)
+
+
+class PageView(discord.ui.View):
+    '''
+    Buttons for browsing pages of a command's output. Pages are rendered on demand by the
+    given function (which is expected to cache them), and the number of pages is checked on
+    every click since the underlying list can change while it's being browsed.
+    '''
+    message: Optional[discord.InteractionMessage]
+
+    def __init__(self, render: Callable[[int], Page], count: Callable[[], int], page: int = 0):
+        super().__init__(timeout=PAGES_TIMEOUT)
+        self.render = render
+        self.count = count
+        self.page = min(max(page, 0), count() - 1)
+        self.message = None
+        self.update_buttons()
+
+    async def send(self, interaction: discord.Interaction) -> None:
+        '''Responds to the interaction with the current page and its buttons'''
+        page = self.render(self.page)
+        if self.count() <= 1:
+            self.stop()
+            await self.respond(interaction, page, None)
+            return
+
+        await self.respond(interaction, page, self)
+        self.message = await interaction.original_response()
+
+    @staticmethod
+    async def respond(interaction: discord.Interaction, page: Page, view: Optional[discord.ui.View]):
+        if isinstance(page, str):
+            await interaction.response.send_message(page, view=view or discord.utils.MISSING)
+        else:
+            await interaction.response.send_message(embed=page, view=view or discord.utils.MISSING)
+
+    def update_buttons(self) -> None:
+        last = self.count() - 1
+        self.first.disabled = self.previous.disabled = self.page <= 0
+        self.next.disabled = self.last.disabled = self.page >= last
+
+    async def show(self, interaction: discord.Interaction, page: int) -> None:
+        self.page = min(max(page, 0), self.count() - 1)
+        self.update_buttons()
+        content = self.render(self.page)
+        if isinstance(content, str):
+            await interaction.response.edit_message(content=content, embed=None, view=self)
+        else:
+            await interaction.response.edit_message(content=None, embed=content, view=self)
+
+    @discord.ui.button(label='⏮', style=discord.ButtonStyle.secondary)
+    async def first(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self.show(interaction, 0)
+
+    @discord.ui.button(label='◀', style=discord.ButtonStyle.primary)
+    async def previous(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self.show(interaction, self.page - 1)
+
+    @discord.ui.button(label='▶', style=discord.ButtonStyle.primary)
+    async def next(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self.show(interaction, self.page + 1)
+
+    @discord.ui.button(label='⏭', style=discord.ButtonStyle.secondary)
+    async def last(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self.show(interaction, self.count() - 1)
+
+    async def on_timeout(self) -> None:
+        if self.message is None:
+            return
+        for item in self.children:
+            if isinstance(item, discord.ui.Button):
+                item.disabled = True
+        try:
+            await self.message.edit(view=self)
+        except discord.HTTPException:
+            pass
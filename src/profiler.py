@@ -0,0 +1,228 @@
+import asyncio
+import io
+import os
+import sys
+import threading
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime
+from time import monotonic
+from types import FrameType
+from typing import Awaitable, Callable, List, Literal, Optional
+import discord
+from discord import app_commands
+from delivery import Message
+from utils import num_of
+
+type ProfileTarget = Literal['cycles', 'commands']
+
+# 100 samples a second is enough to find hot spots while costing very little
+SAMPLE_INTERVAL = 0.01
+# A session ends on its own after this long, even if not enough cycles or commands ran
+MAX_DURATION = 60 * 60
+MAX_COUNT = 20
+HOTTEST = 10
+
+
+def frame_name(frame: FrameType) -> str:
+    code = frame.f_code
+    return f'{code.co_qualname} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'
+
+
+def is_idle(frame: FrameType) -> bool:
+    '''Whether the thread is only waiting for the event loop's next event'''
+    return frame.f_code.co_filename.endswith('selectors.py') and frame.f_code.co_name == 'select'
+
+
+class SamplingProfiler:
+    '''
+    Periodically samples what a thread is running from another thread and counts each
+    distinct stack, but only while something being profiled is running (between resume
+    and pause). Samples where the event loop is idle are left out, so the counts show
+    where the bot spends its busy time. Stacks are kept in collapsed form (root;...;leaf),
+    which flame graph tools read directly.
+    '''
+    stacks: Counter[str]
+
+    def __init__(self, thread_id: int, interval: float = SAMPLE_INTERVAL,
+                 on_timeout: Optional[Callable[[], None]] = None) -> None:
+        self.thread_id = thread_id
+        self.interval = interval
+        # Called from the sampling thread when it stops after MAX_DURATION
+        self.on_timeout = on_timeout
+        self.stacks = Counter()
+        self.samples = 0
+        self.idle = 0
+        self.started = monotonic()
+        # Time spent sampling, and how many profiled cycles or commands are running
+        self.duration = 0.0
+        self.active = 0
+        self.resumed = 0.0
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name='profiler',
+                                       daemon=True)
+
+    def start(self) -> None:
+        self.started = monotonic()
+        self.thread.start()
+
+    def stop(self) -> None:
+        self.stopped.set()
+        if self.thread.is_alive():
+            self.thread.join()
+        if self.active:
+            self.duration += monotonic() - self.resumed
+            self.active = 0
+
+    def resume(self) -> None:
+        if self.active == 0:
+            self.resumed = monotonic()
+        self.active += 1
+
+    def pause(self) -> None:
+        self.active -= 1
+        if self.active == 0:
+            self.duration += monotonic() - self.resumed
+
+    def run(self) -> None:
+        while not self.stopped.wait(self.interval):
+            if monotonic() - self.started > MAX_DURATION:
+                if self.on_timeout is not None:
+                    self.on_timeout()
+                return
+            if not self.active:
+                continue
+
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            self.samples += 1
+            if is_idle(frame):
+                self.idle += 1
+                continue
+
+            names = []
+            while frame is not None:
+                names.append(frame_name(frame))
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(names))] += 1
+
+    def collapsed(self) -> str:
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+    def hottest(self, k: int = HOTTEST) -> List[tuple[str, int]]:
+        '''Returns the functions that were running (not just waiting on a call) most often'''
+        leaves: Counter[str] = Counter()
+        for stack, count in self.stacks.items():
+            leaves[stack.rsplit(';', 1)[-1]] += count
+        return leaves.most_common(k)
+
+
+@dataclass
+class ProfilingSession:
+    target: ProfileTarget
+    count: int
+    channel_id: int
+    profiler: SamplingProfiler
+    started: datetime = field(default_factory=datetime.now)
+    # Cycles or commands that started being profiled, and those that finished
+    begun: int = 0
+    completed: int = 0
+
+
+session: Optional[ProfilingSession] = None
+
+
+def start(target: ProfileTarget, count: int, channel_id: int,
+          on_expired: Callable[[ProfilingSession], Awaitable[None]]) -> Optional[ProfilingSession]:
+    '''
+    Starts a session profiling the thread running the event loop, unless one is already
+    running. Only the next cycles or commands to begin are sampled, see begin and finished.
+    If not enough of them run within MAX_DURATION, the session ends and is handed to
+    on_expired to report.
+    '''
+    global session
+    if session is not None:
+        return None
+    loop = asyncio.get_running_loop()
+
+    def expire() -> None:
+        if session is started:
+            loop.create_task(on_expired(started))
+            stop()
+
+    profiler = SamplingProfiler(threading.get_ident(),
+                                on_timeout=lambda: loop.call_soon_threadsafe(expire))
+    started = session = ProfilingSession(target, min(max(count, 1), MAX_COUNT),
+                                         channel_id, profiler)
+    profiler.start()
+    return session
+
+
+def stop() -> Optional[ProfilingSession]:
+    global session
+    stopped, session = session, None
+    if stopped is not None:
+        stopped.profiler.stop()
+    return stopped
+
+
+def begin(target: ProfileTarget) -> Optional[ProfilingSession]:
+    '''
+    Samples while a cycle or command runs, if the session is profiling those and still
+    needs more. Returns the session to pass to finished or cancel once it's done.
+    '''
+    if session is None or session.target != target or session.begun >= session.count:
+        return None
+    session.begun += 1
+    session.profiler.resume()
+    return session
+
+
+def finished(began: Optional[ProfilingSession]) -> Optional[ProfilingSession]:
+    '''Counts a profiled cycle or command, returning the session if it was the last one'''
+    if began is None or began is not session:
+        return None
+    session.profiler.pause()
+    session.completed += 1
+    if session.completed < session.count:
+        return None
+    return stop()
+
+
+def cancel(began: Optional[ProfilingSession]) -> None:
+    '''Stops sampling a cycle or command that failed, leaving its place to the next one'''
+    if began is None or began is not session:
+        return
+    session.profiler.pause()
+    session.begun -= 1
+
+
+class CommandTree(app_commands.CommandTree):
+    '''Profiles commands as they run, while a session is profiling commands'''
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        command = interaction.command
+        if interaction.type == discord.InteractionType.application_command \
+                and command is not None and command.name != 'profiler':
+            interaction.extras['profiling'] = begin('commands')
+        return True
+
+    async def on_error(self, interaction: discord.Interaction, error: app_commands.AppCommandError) -> None:
+        cancel(interaction.extras.pop('profiling', None))
+        await super().on_error(interaction, error)
+
+
+def report(done: ProfilingSession) -> Message:
+    profiler = done.profiler
+    busy = profiler.samples - profiler.idle
+    lines = [f'Profiled {num_of(done.target[:-1], done.completed)} for {profiler.duration:.1f}s: '
+             f'{num_of('sample', profiler.samples)}, {busy} while busy']
+    if hottest := profiler.hottest():
+        lines.append('```')
+        lines += [f'{count * 100 / max(busy, 1):5.1f}%  {name}' for name, count in hottest]
+        lines.append('```')
+
+    filename = f'profile-{done.started.strftime("%Y%m%d-%H%M%S")}.folded'
+    file = discord.File(io.BytesIO(profiler.collapsed().encode()), filename=filename)
+    return Message('\n'.join(lines)[:2000], files=[file])
@@ -0,0 +1,43 @@
+from typing import Any, Callable, Hashable
+
+# Rendered outputs kept per guild, the least recently used are dropped first
+MAX_ENTRIES = 128
+
+
+class RenderCache:
+    '''
+    Keeps the rendered output of commands per guild, along with the state version it was
+    rendered from. Entries are reused until the guild's version moves on, so a command
+    repeated while nothing has changed never renders again.
+    '''
+    versions: dict[int, int]
+    entries: dict[int, dict[Hashable, tuple[Hashable, Any]]]
+
+    def __init__(self) -> None:
+        self.versions = {}
+        self.entries = {}
+
+    def version(self, guild_id: int) -> int:
+        return self.versions.get(guild_id, 0)
+
+    def invalidate(self, guild_id: int) -> None:
+        '''Marks a guild's tracked players as changed'''
+        self.versions[guild_id] = self.version(guild_id) + 1
+        self.entries.pop(guild_id, None)
+
+    def get[T](self, guild_id: int, key: Hashable, version: Hashable, render: Callable[[], T]) -> T:
+        '''
+        Returns the cached output for the key if it was rendered at this version, otherwise
+        renders it again. The version should include every state the output depends on.
+        '''
+        entries = self.entries.setdefault(guild_id, {})
+        cached = entries.pop(key, None)
+        if cached is not None and cached[0] == version:
+            entries[key] = cached
+            return cached[1]
+
+        value = render()
+        entries[key] = (version, value)
+        if len(entries) > MAX_ENTRIES:
+            del entries[next(iter(entries))]
+        return value
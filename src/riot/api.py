@@ -123,7 +123,7 @@ class RiotAPI:
     async def get_match_info_by_id(self, match_id: str):
         data_res = await self.get_raw_match_info_by_id(match_id)
         if data_res.error() is not None:
-            data_res.log_error(7, 'Couldn\'t get match info')
+            data_res.log_error(7, f'Couldn\'t get match info for [{match_id}]')
             return None
 
         raw_data = data_res.data
@@ -173,12 +173,12 @@ class RiotAPI:
         summoner_name = await self.get_summoner_name_from_puuid(puuid)
         if summoner_name.error() is not None:
             summoner_name.log_error(
-                15, 'Couldn\'t get summoner name info from puuid')
+                15, f'Couldn\'t get summoner name info from puuid [{puuid}]')
             return cast(APIResponse[UserInfo], summoner_name)
 
         summoner = await self.get_summoner_by_puuid(puuid)
         if summoner.error() is not None:
-            summoner.log_error(8, 'Couldn\'t get summoner from puuid')
+            summoner.log_error(8, f'Couldn\'t get summoner from puuid [{puuid}]')
             return cast(APIResponse[UserInfo], summoner)
 
         try:
@@ -1,19 +1,50 @@
-from typing import Callable, Awaitable
+from typing import Callable, Awaitable, Optional, TypedDict
 from datetime import timedelta, datetime
 from asyncio import sleep
+from logs import log
+from tracing import span
 from .responses import APIResponse
 
 
+class RateLimitInfo(TypedDict):
+    # This process's share of the key's limit, which is all of it unless it's shared
+    max_calls: int
+    key_max_calls: int
+    time_window: int
+    timeout_start: Optional[datetime]
+    active_calls: int
+    completed_calls: int
+    waiting_calls: int
+    rate_limited: int
+
+
+rate_limit_info: dict[str, RateLimitInfo] = {}
+
+
+def set_budget_share(share: float) -> None:
+    '''
+    Limits this process to a share of every rate limit, for when several processes use
+    the same key. Their shares should add up to at most 1.
+    '''
+    for info in rate_limit_info.values():
+        info['max_calls'] = max(int(info['key_max_calls'] * share), 1)
+
+
 def handle_rate_limit(max_calls: int, time_window: int, header_order: int, verbose: bool = False):
     '''
     Uses a make-shift token bucket algorithm to prevent function from running more than a certain
     number of times in a given window of time.
     '''
     def decorator(func: Callable[..., Awaitable[APIResponse]]) -> Callable[..., Awaitable[APIResponse]]:
-        info = {'timeout_start': None,
-                'active_calls': 0,
-                'completed_calls': 0,
-                'waiting_calls': 0}
+        info: RateLimitInfo = {'max_calls': max_calls,
+                               'key_max_calls': max_calls,
+                               'time_window': time_window,
+                               'timeout_start': None,
+                               'active_calls': 0,
+                               'completed_calls': 0,
+                               'waiting_calls': 0,
+                               'rate_limited': 0}
+        rate_limit_info[func.__name__] = info
 
         async def wrapper(*args, **kwargs):
             while True:
@@ -22,41 +53,47 @@ def handle_rate_limit(max_calls: int, time_window: int, header_order: int, verbo
                     info['active_calls'] = 0
                     info['completed_calls'] = 0
 
-                if info['completed_calls'] + info['active_calls'] < max_calls:
+                if info['completed_calls'] + info['active_calls'] < info['max_calls']:
                     info['active_calls'] += 1
                     break
                 else:
                     info['waiting_calls'] += 1
-                    await sleep((info['timeout_start'] + timedelta(seconds=time_window) - datetime.now()).total_seconds())
+                    with span('rate_limit_wait'):
+                        await sleep((info['timeout_start'] + timedelta(seconds=time_window) - datetime.now()).total_seconds())
                     info['waiting_calls'] -= 1
 
-            resobj = await func(*args, **kwargs)
+            with span('riot_api'):
+                resobj = await func(*args, **kwargs)
 
             current = resobj.rate_limit_count(header_order)
             info['active_calls'] -= 1
             info['completed_calls'] += 1
 
-            # Accounts for when the rate limit didn't start from 0 (When restarting bot)
-            if current and current > info['completed_calls'] + info['active_calls']:
+            # Accounts for when the rate limit didn't start from 0 (When restarting bot).
+            # The count is for the whole key, so it can't be used while the key is shared
+            shared = info['max_calls'] < info['key_max_calls']
+            if current and not shared and current > info['completed_calls'] + info['active_calls']:
                 info['completed_calls'] = current
 
             # Only prints once when the final call of the window completes
             elif current == max_calls:
                 when = (info['timeout_start'] +
                         timedelta(seconds=time_window)).strftime('%H:%M:%S')
-                print(f"Hit rate-limit ceiling: {info['waiting_calls']}",
-                      f"calls will restart at {when}...")
+                log(f"Hit rate-limit ceiling: {info['waiting_calls']} calls will restart at {
+                    when}...", 'WARNING', 'main.riot_api')
 
             if resobj.error() == 'rate-limit':
+                info['rate_limited'] += 1
                 info['completed_calls'] = max(
-                    info['completed_calls'], max_calls)
-                print('ERROR: Surpassed rate limit - retrying after 5 seconds')
+                    info['completed_calls'], info['max_calls'])
+                log('Surpassed rate limit - retrying after 5 seconds',
+                    'ERROR', 'main.riot_api')
                 await sleep(5)
                 return await wrapper(*args, **kwargs)
 
             if verbose:
-                print(f"Rate-limit update: <{current}T,",
-                      f"{info['active_calls']}A, {info['completed_calls']}C>")
+                log(f"Rate-limit update: <{current}T, {info['active_calls']}A, {
+                    info['completed_calls']}C>", 'DEBUG', 'main.riot_api')
             return resobj
 
         return wrapper
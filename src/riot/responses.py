@@ -74,15 +74,16 @@ class APIResponse[T]:
         return True
 
     def log_error(self, place_id: int, msg: str = '', source: str = 'main.riot_api') -> None:
+        '''
+        Logs what failed along with why. Repeats of an error are suppressed, so msg should
+        name what was requested, or failures for different players would be counted as one.
+        '''
         source = f'{source}[{str(place_id).zfill(3)}]'
-        log('Error: ' + msg, 'ERROR', source)
-
         if self.error() == 'unknown':
-            log(f'Error: An unknown error ({
-                self.status}) occured - {self.data}', 'ERROR', source)
+            reason = f'An unknown error ({self.status}) occured - {self.data}'
         else:
-            log('Error: ' + self.ERROR_MSG.get(self.status,
-                f'Unknown error ({self.status})'), 'ERROR', source)
+            reason = self.ERROR_MSG.get(self.status, f'Unknown error ({self.status})')
+        log(f'Error: {msg} - {reason}' if msg else f'Error: {reason}', 'ERROR', source)
 
 
 class APISummonerName(TypedDict):
@@ -85,7 +85,7 @@ class GameInfo:
         return output
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class UserChamp:
     id: int
     level: int
@@ -99,14 +99,26 @@ RANK_DIVISIONS: List[RankOption] = ['UNRANKED', 'IRON', 'BRONZE', 'SILVER',
 
 RANK_TIERS: List[Optional[TierOption]] = [None, 'IV', 'III', 'II', 'I']
 
+DIVISION_SCORES: dict[RankOption, int] = {
+    division: i * 1000 for i, division in enumerate(RANK_DIVISIONS)}
 
-@dataclass
+TIER_SCORES: dict[Optional[TierOption], int] = {
+    tier: i * 150 for i, tier in enumerate(RANK_TIERS)}
+
+
+@dataclass(slots=True, frozen=True)
 class Rank:
     division: RankOption
     tier: Optional[TierOption]
     lp: int
     wins: int
     losses: int
+    score: int = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        # Ranks are immutable, so the score only ever has to be set once
+        object.__setattr__(self, 'score', DIVISION_SCORES[self.division] +
+                           TIER_SCORES[self.tier] + self.lp)
 
     def full(self):
         name = self.division
@@ -117,12 +129,10 @@ class Rank:
     def id(self) -> int:
         '''
         Returns a unique score to distinguish different divisions, tiers, and lp.
-        A higher id means that the rank is higher quality.
+        A higher id means that the rank is higher quality. The score is worked out once
+        when the rank is created.
         '''
-        total = RANK_DIVISIONS.index(self.division) * 1000
-        total += RANK_TIERS.index(self.tier) * 150
-        total += self.lp
-        return total
+        return self.score
 
     def is_same_as(self, other: Self):
         return self.division == other.division and self.tier == other.tier
@@ -182,10 +192,9 @@ class UserInfo:
         return self.ranks['Solo/Duo'].division
 
     def copy(self):
-        '''Returns a deep copy of the user object'''
-        champs = [replace(c) for c in self.top_champs]
-        ranks = {
-            mode: replace(rank)
-            for mode, rank in self.ranks.items()
-        }
-        return replace(self, ranks=ranks, top_champs=champs)
+        '''
+        Returns a copy of the user object that can be modified without changing the original.
+        Ranks and champions are immutable, so they are shared rather than copied and are
+        changed by replacing them.
+        '''
+        return replace(self, ranks=dict(self.ranks), top_champs=list(self.top_champs))
@@ -0,0 +1,550 @@
+import asyncio
+import hashlib
+import itertools
+import multiprocessing
+import secrets
+import sys
+import threading
+import traceback
+from bisect import bisect
+from dataclasses import dataclass, field
+from multiprocessing.connection import Client, Connection, Listener
+from time import perf_counter
+from typing import Any, Iterable, List, Optional
+from events import BaseGameEvent
+from event_manager import CycleSnapshot, EventManager, Memory
+from riot import RiotAPI, UserInfo, GameInfo
+from riot.rate_limiting import set_budget_share
+from config import get_config
+from logs import log, configure as configure_logs
+from utils import flat, num_of
+import metrics
+import tracing
+
+# Points each worker gets on the ring, so players are spread evenly between them
+VIRTUAL_NODES = 64
+# The gateway keeps this share of the API key's budget for commands, the workers split the rest
+GATEWAY_SHARE = 0.1
+CHECK_TIMEOUT = 240
+REQUEST_TIMEOUT = 60
+CONNECT_TIMEOUT = 30
+
+
+def hash_key(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest())
+
+
+class HashRing:
+    '''
+    Consistent hashing of players onto workers. Every worker is placed at many points on
+    a ring, and a player belongs to the first worker point after the player's hash, so
+    adding or removing a worker only moves the players next to that worker's points.
+    '''
+
+    def __init__(self, nodes: Iterable[str] = (), replicas: int = VIRTUAL_NODES) -> None:
+        self.replicas = replicas
+        self.points: List[tuple[int, str]] = []
+        for node in nodes:
+            self.add(node)
+
+    @property
+    def nodes(self) -> set[str]:
+        return {node for _, node in self.points}
+
+    def add(self, node: str) -> None:
+        self.points += [(hash_key(f'{node}#{i}'), node) for i in range(self.replicas)]
+        self.points.sort()
+
+    def remove(self, node: str) -> None:
+        self.points = [p for p in self.points if p[1] != node]
+
+    def node_for(self, key: str) -> Optional[str]:
+        if not self.points:
+            return None
+        i = bisect(self.points, (hash_key(key), ''))
+        return self.points[i % len(self.points)][1]
+
+    def assign(self, keys: Iterable[str]) -> dict[str, List[str]]:
+        assignment: dict[str, List[str]] = {node: [] for node in self.nodes}
+        for key in keys:
+            if (node := self.node_for(key)) is not None:
+                assignment[node].append(key)
+        return assignment
+
+
+@dataclass(slots=True)
+class PlayerUpdate:
+    '''What the gateway needs to know about a player after a worker has checked them'''
+    puuid: str
+    memory: Memory
+    profile: Optional[UserInfo]
+    last_game: Optional[GameInfo]
+
+
+@dataclass(slots=True)
+class CheckResult:
+    events: List[BaseGameEvent]
+    updates: List[PlayerUpdate]
+    seconds: float
+
+
+class ShardError(Exception):
+    pass
+
+
+class Channel:
+    '''
+    A connection to the other side, used from asyncio. Connections block, so sends run in
+    threads one at a time, and messages are received by a daemon thread of the channel's
+    own, which doesn't keep the event loop from shutting down while it waits.
+    '''
+
+    def __init__(self, conn: Connection) -> None:
+        self.conn = conn
+        self.lock = asyncio.Lock()
+        self.received: Optional[asyncio.Queue] = None
+
+    async def send(self, message: Any) -> None:
+        async with self.lock:
+            await asyncio.to_thread(self.conn.send, message)
+
+    async def recv(self) -> Any:
+        if self.received is None:
+            self.received = asyncio.Queue()
+            threading.Thread(target=self.read, args=(asyncio.get_running_loop(), self.received),
+                             name='shard-channel', daemon=True).start()
+        message = await self.received.get()
+        if isinstance(message, BaseException):
+            raise message
+        return message
+
+    def read(self, loop: asyncio.AbstractEventLoop, received: asyncio.Queue) -> None:
+        message: Any = None
+        while not isinstance(message, BaseException):
+            try:
+                message = self.conn.recv()
+            except (EOFError, OSError) as e:
+                message = e
+            try:
+                loop.call_soon_threadsafe(received.put_nowait, message)
+            except RuntimeError:
+                # The event loop has closed, so nobody is waiting for messages anymore
+                return
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+class PollerWorker:
+    '''
+    Checks the players the gateway assigned to this worker. Their memory lives here, and
+    only what changed is sent back to the gateway after each check. Updates count as sent
+    once the gateway acknowledges them, so a reply that gets lost is sent again next time.
+    '''
+
+    def __init__(self, channel: Channel, riot: RiotAPI) -> None:
+        self.channel = channel
+        self.events = EventManager(riot)
+        self.assigned: set[str] = set()
+        self.sent_memory: dict[str, Memory] = {}
+        self.sent_profiles: dict[str, UserInfo] = {}
+        self.unacknowledged: dict[int, List[PlayerUpdate]] = {}
+        # Checks run one at a time, so a check never finds the same games as one still running
+        self.checking = asyncio.Lock()
+
+    async def run(self) -> None:
+        while True:
+            try:
+                message = await self.channel.recv()
+            except (EOFError, OSError):
+                log('Lost the connection to the gateway', 'WARNING', 'main.shard')
+                return
+
+            if message[0] == 'assign':
+                self.assign(*message[1:])
+            elif message[0] == 'request':
+                asyncio.create_task(self.answer(*message[1:]))
+            elif message[0] == 'ack':
+                self.acknowledge(message[1])
+
+    def assign(self, players: dict[str, Optional[Memory]], share: float) -> None:
+        '''
+        Takes over the given players, starting from the gateway's copy of their memory if
+        they were checked by another worker before, and forgets everyone else
+        '''
+        self.assigned = set(players)
+        self.unacknowledged.clear()
+        for memory in (self.events.player_memory, self.sent_memory, self.sent_profiles):
+            for puuid in [p for p in memory if p not in self.assigned]:
+                del memory[puuid]
+        for puuid, memory in players.items():
+            if memory is not None and puuid not in self.events.player_memory:
+                self.events.player_memory[puuid] = memory
+                self.sent_memory[puuid] = memory
+        set_budget_share(share)
+        log(f'Assigned {len(players)} players with {share:.0%} of the API budget',
+            source='main.shard')
+
+    async def answer(self, request_id: int, method: str, args: tuple) -> None:
+        try:
+            if method == 'check':
+                result = await self.check(request_id, *args)
+            elif method == 'rollback':
+                result = await self.events.set_memory_to_game(*args)
+            else:
+                raise ShardError(f'Unknown request {method}')
+            await self.channel.send(('reply', request_id, result))
+        except Exception:
+            log(traceback.format_exc(), 'ERROR', 'main.shard')
+            await self.channel.send(('error', request_id, traceback.format_exc()))
+
+    async def check(self, request_id: int, puuids: List[str]) -> CheckResult:
+        async with self.checking:
+            start = perf_counter()
+            puuids = [p for p in puuids if p in self.assigned]
+            snapshot = CycleSnapshot()
+            events = flat(await asyncio.gather(*[self.events.check_user(p, snapshot)
+                                                 for p in puuids]))
+
+        updates = []
+        for puuid in puuids:
+            memory = self.events.player_memory.get(puuid)
+            if memory is None:
+                continue
+            profile = snapshot.profiles.get(puuid)
+            if profile == self.sent_profiles.get(puuid):
+                profile = None
+            if memory == self.sent_memory.get(puuid) and profile is None:
+                continue
+
+            updates.append(PlayerUpdate(puuid, memory, profile,
+                                        snapshot.games.get(memory.last_game)))
+        self.unacknowledged[request_id] = updates
+        return CheckResult(events, updates, perf_counter() - start)
+
+    def acknowledge(self, request_id: int) -> None:
+        for update in self.unacknowledged.pop(request_id, []):
+            self.sent_memory[update.puuid] = update.memory
+            if update.profile is not None:
+                self.sent_profiles[update.puuid] = update.profile
+
+
+def run_worker(address: tuple[str, int], authkey: bytes, name: str) -> None:
+    '''Runs a poller worker until its connection to the gateway closes'''
+    config = get_config()
+    configure_logs(config.LOG_LEVEL, config.LOG_FORMAT)
+    conn = Client(address, authkey=authkey)
+    conn.send(('hello', name))
+    log(f'Worker [{name}] connected to the gateway at {address[0]}:{address[1]}',
+        source='main.shard')
+
+    async def run():
+        riot = RiotAPI(config.RIOT_TOKEN, config.SERVER,
+                       config.REGION, config.API_THREADS)
+        await PollerWorker(Channel(conn), riot).run()
+    asyncio.run(run())
+
+
+@dataclass
+class WorkerConnection:
+    name: str
+    channel: Channel
+    pending: dict[int, asyncio.Future] = field(default_factory=dict)
+    players: int = 0
+    check_seconds: Optional[float] = None
+    # The check the worker is running, which may outlive the gateway waiting for it
+    checking: Optional[int] = None
+
+
+class ShardGateway:
+    '''
+    Splits the tracked players between poller workers with consistent hashing and gathers
+    what they find. Workers check their players and send back the events and changed
+    memory, and the gateway keeps every guild's leaderboards, finds overtakes across all
+    workers and leaves delivery to the bot. Each worker gets an even share of the API key.
+    '''
+    events: EventManager
+    workers: dict[str, WorkerConnection]
+
+    def __init__(self, events: EventManager, address: tuple[str, int], authkey: Optional[bytes] = None) -> None:
+        self.events = events
+        self.address = address
+        # Without a shared key, only the workers started here can connect
+        self.authkey = authkey or secrets.token_bytes(32)
+        self.ring = HashRing()
+        self.workers = {}
+        self.processes: dict[str, multiprocessing.process.BaseProcess] = {}
+        # Every player ever checked, and whether they need spreading over the workers again
+        self.players: set[str] = set()
+        self.balanced = False
+        self.request_ids = itertools.count()
+        self.profiles: dict[str, UserInfo] = {}
+        self.last_games: dict[str, GameInfo] = {}
+        # Announcements from checks that finished after they timed out, sent with the next check
+        self.late_events: List[BaseGameEvent] = []
+        self.connected = asyncio.Event()
+        self.started = False
+
+    async def start(self, local_workers: int) -> None:
+        '''
+        Listens for workers and starts the local ones, waiting a while for them to connect.
+        Only the first call does anything, workers that die are restarted by the checks.
+        '''
+        if self.started:
+            return
+        self.started = True
+        self.loop = asyncio.get_running_loop()
+        set_budget_share(GATEWAY_SHARE)
+        listener = Listener(self.address, authkey=self.authkey)
+        threading.Thread(target=self.accept, args=(listener,),
+                         name='shard-listener', daemon=True).start()
+        log(f'Listening for poller workers on {self.address[0]}:{self.address[1]}',
+            source='main.shard')
+
+        for i in range(local_workers):
+            self.start_worker(f'worker-{i}')
+        metrics.add_collector(self.metrics)
+
+        try:
+            await asyncio.wait_for(self.wait_for_workers(local_workers), CONNECT_TIMEOUT)
+        except asyncio.TimeoutError:
+            log(f'Only {len(self.workers)} of {local_workers} workers connected in time',
+                'WARNING', 'main.shard')
+
+    async def wait_for_workers(self, count: int) -> None:
+        while len(self.workers) < count:
+            self.connected.clear()
+            await self.connected.wait()
+
+    def start_worker(self, name: str) -> None:
+        context = multiprocessing.get_context('spawn')
+        process = context.Process(target=run_worker, args=(self.address, self.authkey, name),
+                                  name=name, daemon=True)
+        process.start()
+        self.processes[name] = process
+
+    def restart_dead_workers(self) -> None:
+        for name, process in list(self.processes.items()):
+            if not process.is_alive() and name not in self.workers:
+                log(f'Worker [{name}] exited ({process.exitcode}), restarting it',
+                    'WARNING', 'main.shard')
+                self.start_worker(name)
+
+    def accept(self, listener: Listener) -> None:
+        '''Runs on the listener thread, handing every new worker to the event loop'''
+        while True:
+            try:
+                conn = listener.accept()
+                hello = conn.recv()
+            except (OSError, EOFError, multiprocessing.AuthenticationError) as e:
+                log(f'Rejected a worker connection: {e}', 'WARNING', 'main.shard')
+                continue
+            if not (isinstance(hello, tuple) and hello[0] == 'hello'):
+                conn.close()
+                continue
+            self.loop.call_soon_threadsafe(self.register, conn, str(hello[1]))
+
+    def register(self, conn: Connection, name: str) -> None:
+        if name in self.workers:
+            log(f'Worker [{name}] reconnected, dropping its old connection',
+                'WARNING', 'main.shard')
+            self.disconnect(self.workers[name])
+
+        worker = WorkerConnection(name, Channel(conn))
+        self.workers[name] = worker
+        self.ring.add(name)
+        # Players are moved to the new worker before the next check
+        self.balanced = False
+        asyncio.create_task(self.read(worker))
+        self.connected.set()
+        log(f'Worker [{name}] joined, {len(self.workers)} connected', source='main.shard')
+
+    def disconnect(self, worker: WorkerConnection) -> None:
+        if self.workers.get(worker.name) is worker:
+            del self.workers[worker.name]
+            self.ring.remove(worker.name)
+            self.balanced = False
+        for future in worker.pending.values():
+            if not future.done():
+                future.set_exception(ShardError(f'Worker [{worker.name}] disconnected'))
+        worker.channel.close()
+
+    async def read(self, worker: WorkerConnection) -> None:
+        while True:
+            try:
+                kind, request_id, payload = await worker.channel.recv()
+            except (EOFError, OSError):
+                log(f'Worker [{worker.name}] left', 'WARNING', 'main.shard')
+                self.disconnect(worker)
+                return
+
+            if request_id == worker.checking:
+                self.finish_check(worker, request_id, kind, payload)
+                continue
+            future = worker.pending.get(request_id)
+            if future is None or future.done():
+                continue
+            if kind == 'reply':
+                future.set_result(payload)
+            else:
+                future.set_exception(ShardError(payload))
+
+    async def request(self, worker: WorkerConnection, method: str, *args: Any, timeout: float = REQUEST_TIMEOUT) -> Any:
+        request_id = next(self.request_ids)
+        future = worker.pending[request_id] = self.loop.create_future()
+        try:
+            await worker.channel.send(('request', request_id, method, args))
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            worker.pending.pop(request_id, None)
+
+    async def rebalance(self) -> None:
+        '''Sends every worker its players, along with the latest memory of them'''
+        assignment = self.ring.assign(self.players)
+        share = (1 - GATEWAY_SHARE) / max(len(assignment), 1)
+        memory = self.events.player_memory
+        for name, assigned in assignment.items():
+            worker = self.workers[name]
+            worker.players = len(assigned)
+            await worker.channel.send(('assign', {p: memory.get(p) for p in assigned}, share))
+        self.balanced = True
+        log(f'Spread {len(self.players)} players over {len(assignment)} workers',
+            source='main.shard')
+
+    def remember(self, update: PlayerUpdate) -> None:
+        self.events.player_memory[update.puuid] = update.memory
+        self.events.leaderboards.update(update.puuid, update.memory.ranks)
+        if update.profile is not None:
+            self.profiles[update.puuid] = update.profile
+        if update.last_game is not None:
+            self.last_games[update.puuid] = update.last_game
+
+    def finish_check(self, worker: WorkerConnection, request_id: int, kind: str, payload: Any) -> None:
+        '''Applies a worker's check, even when it arrives after the gateway stopped waiting for it'''
+        worker.checking = None
+        future = worker.pending.pop(request_id, None)
+        waiting = future is not None and not future.done()
+        if kind != 'reply':
+            if future is not None and waiting:
+                future.set_exception(ShardError(payload))
+            else:
+                log(f'Worker [{worker.name}] failed a check that timed out: {payload}',
+                    'ERROR', 'main.shard')
+            return
+
+        result: CheckResult = payload
+        worker.check_seconds = result.seconds
+        for update in result.updates:
+            self.remember(update)
+        asyncio.create_task(worker.channel.send(('ack', request_id)))
+
+        if future is not None and waiting:
+            future.set_result(result.events)
+        elif result.events:
+            log(f'Worker [{worker.name}] finished a check after it timed out, its '
+                f'{num_of("announcement", len(result.events))} will be sent with the next check',
+                'WARNING', 'main.shard')
+            self.late_events.extend(result.events)
+
+    async def check_worker(self, worker: WorkerConnection, puuids: List[str]) -> List[BaseGameEvent]:
+        if worker.checking is not None:
+            log(f'Worker [{worker.name}] is still running its last check, skipping its players',
+                'WARNING', 'main.shard')
+            return []
+
+        request_id = next(self.request_ids)
+        future = worker.pending[request_id] = self.loop.create_future()
+        worker.checking = request_id
+        try:
+            await worker.channel.send(('request', request_id, 'check', (puuids,)))
+            events = await asyncio.wait_for(asyncio.shield(future), CHECK_TIMEOUT)
+        except asyncio.TimeoutError:
+            if future.done() and not future.exception():
+                return future.result()
+            # The worker carries on, and its result is applied whenever it arrives
+            worker.pending.pop(request_id, None)
+            log(f"Worker [{worker.name}] didn't finish checking in {CHECK_TIMEOUT}s, "
+                'its announcements will be sent with the next check', 'WARNING', 'main.shard')
+            return []
+        except (ShardError, OSError) as e:
+            worker.pending.pop(request_id, None)
+            if worker.checking == request_id:
+                worker.checking = None
+            log(f"Couldn't check the players of worker [{worker.name}]: {e}", 'ERROR', 'main.shard')
+            return []
+
+        if trace := tracing.current():
+            trace.record('worker_check', worker.check_seconds or 0)
+        return events
+
+    async def check(self, guilds: dict[int, List[str]], quiet: bool = False) -> dict[int, List[BaseGameEvent]]:
+        '''
+        Has the workers check every guild's players, each player once however many guilds
+        track them, and returns every guild's announcements including leaderboard overtakes
+        '''
+        self.restart_dead_workers()
+        if not self.workers:
+            log('No poller workers are connected, skipping the check', 'ERROR', 'main.shard')
+            return {}
+
+        puuids = {p for tracked in guilds.values() for p in tracked}
+        if not self.balanced or not puuids <= self.players:
+            self.players |= puuids
+            await self.rebalance()
+
+        late, self.late_events = self.late_events, []
+        with tracing.span('shard_check'):
+            assignment = self.ring.assign(puuids)
+            found = late + flat(await asyncio.gather(*[self.check_worker(self.workers[name], assigned)
+                                                       for name, assigned in assignment.items()
+                                                       if name in self.workers]))
+        # Late announcements for players none of these guilds track wait for a check that does
+        self.late_events += [e for e in late if e.user.puuid not in puuids]
+
+        announcements: dict[int, List[BaseGameEvent]] = {}
+        for guild_id, members in guilds.items():
+            members_set = set(members)
+            self.events.set_guild_players(guild_id, members)
+            guild_events = [e for e in found if e.user.puuid in members_set]
+            snapshot = CycleSnapshot(
+                {p: self.profiles[p] for p in members if p in self.profiles},
+                {g.id: g for p in members if (g := self.last_games.get(p))})
+            for mode in ('Solo/Duo', 'Flex'):
+                guild_events.extend(await self.events.get_leaderboard_events(guild_id, mode, snapshot))
+            announcements[guild_id] = guild_events
+
+        metrics.count_events(flat(announcements.values()))
+        if not quiet:
+            log(f'Workers found {sum(map(len, announcements.values()))} announcements',
+                source='main.shard')
+        return announcements
+
+    async def rollback(self, puuid: str, games: int) -> bool:
+        name = self.ring.node_for(puuid)
+        if name is None or name not in self.workers:
+            return False
+        try:
+            return await self.request(self.workers[name], 'rollback', puuid, games)
+        except (ShardError, asyncio.TimeoutError, OSError):
+            return False
+
+    def metrics(self) -> Iterable[metrics.Metric]:
+        yield metrics.Metric('shard_workers', 'Poller workers connected to the gateway').add(len(self.workers))
+        players = metrics.Metric('shard_players', 'Players assigned to each poller worker')
+        seconds = metrics.Metric('shard_check_seconds', "How long each worker's last check took")
+        for name, worker in self.workers.items():
+            players.add(worker.players, worker=name)
+            if worker.check_seconds is not None:
+                seconds.add(worker.check_seconds, worker=name)
+        yield players
+        yield seconds
+
+
+if __name__ == '__main__':
+    # A worker on another machine, connecting to the gateway with the shared key
+    config = get_config()
+    if config.SHARD_AUTHKEY is None:
+        print('SHARD_AUTHKEY must be set for workers to connect to the gateway')
+        exit(1)
+    run_worker(config.SHARD_ADDRESS, config.SHARD_AUTHKEY.encode(),
+               sys.argv[1] if len(sys.argv) > 1 else f'worker-{secrets.token_hex(3)}')
@@ -1,16 +1,20 @@
 import json
+import sys
 import traceback
 from os import path, remove
-from typing import Any, List, TypedDict
+from typing import Any, List, Literal, TypedDict
 from logs import log
 from config import get_config
-from datetime import datetime, timedelta
-from uuid import uuid4
+from datetime import datetime
+from tracing import span
 
 FILENAME = 'memory.json'
+# Temporary certificate files used to be listed here and in the memory file
+LEGACY_FILES_INDEX_FILENAME = 'allotted_files.json'
 
 FILES_PATH = get_config().FILES_PATH
 memory_path = path.join(FILES_PATH, FILENAME)
+legacy_files_index_path = path.join(FILES_PATH, LEGACY_FILES_INDEX_FILENAME)
 
 
 class MemoryEncoder(json.JSONEncoder):
@@ -30,18 +34,15 @@ class TrackPlayer(TypedDict):
     claimed_users: set[int]
 
 
-class AllottedFile(TypedDict):
-    name: str
-    path: str
-    expiry: datetime
+# How a guild's announcements are grouped into digests, if at all
+type DigestMode = Literal['Off', 'Player', 'Type']
 
 
 write_memory = {}
-allotted_files: List[AllottedFile] = []
+digest_modes: dict[int, DigestMode] = {}
 
 
 def read() -> tuple[dict[int, List[TrackPlayer]], dict[int, int]]:
-    global allotted_files
     try:
         with open(memory_path, 'r') as f:
             try:
@@ -55,7 +56,9 @@ def read() -> tuple[dict[int, List[TrackPlayer]], dict[int, int]]:
                 data = extract_from_data(memory)
                 write_memory['tracked_players'] = data[0]
                 write_memory['output_channels'] = data[1]
-                allotted_files = data[2]
+                digest_modes.update({int(key): val for key, val
+                                     in memory.get('digest_modes', {}).items()})
+                clear_legacy_files(memory.get('allotted_files', []))
                 log('Successfully loaded persistent memory',
                     source='main.storage')
                 return data[:2]
@@ -65,13 +68,13 @@ def read() -> tuple[dict[int, List[TrackPlayer]], dict[int, int]]:
                 log(traceback.format_exc(), 'ERROR', 'main.storage')
                 return ({}, {})
     except FileNotFoundError:
+        clear_legacy_files([])
         return ({}, {})
 
 
-def extract_from_data(memory: Any) -> tuple[dict[int, List[TrackPlayer]], dict[int, int], List[AllottedFile]]:
+def extract_from_data(memory: Any) -> tuple[dict[int, List[TrackPlayer]], dict[int, int]]:
     tracked_players = memory['tracked_players']
     output_channels = memory['output_channels']
-    allotted_files = memory.get('allotted_files', [])
 
     tracked_players = {int(key): val for key,
                        val in tracked_players.items()}
@@ -81,11 +84,13 @@ def extract_from_data(memory: Any) -> tuple[dict[int, List[TrackPlayer]], dict[i
     for tracked in tracked_players.values():
         for user in tracked:
             user['claimed_users'] = set(user['claimed_users'])
+            # The same players are tracked in many guilds and remembered by the
+            # event manager, so share one copy of each of their strings
+            user['puuid'] = sys.intern(user['puuid'])
+            user['name'] = sys.intern(user['name'])
+            user['tag'] = sys.intern(user['tag'])
 
-    for file in allotted_files:
-        file['expiry'] = datetime.fromisoformat(file['expiry'])
-
-    return (tracked_players, output_channels, allotted_files)
+    return (tracked_players, output_channels)
 
 
 def memory_file_name() -> str:
@@ -100,30 +105,38 @@ def write(tracked_players: dict[int, List[TrackPlayer]], output_channels: dict[i
         write_memory['tracked_players'] = tracked_players
         write_memory['output_channels'] = output_channels
 
-    with open(memory_path, 'w') as f:
+    with span('storage'), open(memory_path, 'w') as f:
         data = {'tracked_players': tracked_players,
                 'output_channels': output_channels,
-                'allotted_files': allotted_files}
+                'digest_modes': digest_modes}
         json.dump(data, f, cls=MemoryEncoder)
         log('Updated persistent memory', source='main.storage')
 
 
-def clear_expired_files():
-    for i in reversed(range(len(allotted_files))):
-        file = allotted_files[i]
-        if datetime.now() > file['expiry']:
-            remove(file['path'])
-            allotted_files.pop(i)
-
-
-def allot_file(ext: str, life_span: timedelta = timedelta(hours=24)) -> AllottedFile:
-    clear_expired_files()
-    filename = f'{uuid4()}.{ext}'
-    file = AllottedFile(
-        name=filename,
-        path=path.join(FILES_PATH, filename),
-        expiry=datetime.now() + life_span)
+def clear_legacy_files(listed: List[Any]):
+    '''
+    Deletes the temporary files left by older versions, which listed them in the memory
+    file and later in their own index. Nothing creates them anymore, so once they are
+    gone the index is removed, and the next write drops them from the memory file.
+    '''
+    try:
+        with open(legacy_files_index_path, 'r') as f:
+            listed = listed + json.load(f)
+    except FileNotFoundError:
+        pass
+    except (json.decoder.JSONDecodeError, TypeError, ValueError):
+        log('Failed to decode allotted files index', 'WARNING', 'main.storage')
 
-    allotted_files.append(file)
-    write(None, None)
-    return file
+    cleared = 0
+    for file in listed:
+        try:
+            remove(file['path'])
+            cleared += 1
+        except (FileNotFoundError, KeyError, TypeError):
+            pass
+    try:
+        remove(legacy_files_index_path)
+    except FileNotFoundError:
+        pass
+    if cleared:
+        log(f'Cleared {cleared} leftover temporary files', source='main.storage')
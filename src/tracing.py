@@ -0,0 +1,134 @@
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from time import perf_counter, time
+from typing import Callable, Iterator, List, Optional
+from logs import log
+
+# How many of the latest cycles are kept for inspection
+RECENT_CYCLES = 20
+SLOWEST_PLAYERS = 5
+
+
+@dataclass(frozen=True, slots=True)
+class PhaseStats:
+    phase: str
+    count: int
+    total: float
+    p50: float
+    p95: float
+    max: float
+
+
+def percentile(durations: List[float], q: float) -> float:
+    '''Nearest-rank percentile of already sorted durations'''
+    i = min(max(int(q * len(durations) + 0.5) - 1, 0), len(durations) - 1)
+    return durations[i]
+
+
+@dataclass
+class CycleTrace:
+    '''
+    Timings of one cycle. Every span adds a duration to its phase, and every player's checks
+    add to their total. Phases run concurrently, so their totals can add up to more than
+    the cycle's duration.
+    '''
+    name: str
+    started: float
+    duration: Optional[float] = None
+    phases: dict[str, List[float]] = field(default_factory=dict)
+    players: dict[str, float] = field(default_factory=dict)
+
+    def record(self, phase: str, elapsed: float) -> None:
+        self.phases.setdefault(phase, []).append(elapsed)
+
+    def stats(self) -> List[PhaseStats]:
+        '''Returns every phase's statistics, with the most total time first'''
+        stats = []
+        for phase, durations in self.phases.items():
+            durations = sorted(durations)
+            stats.append(PhaseStats(phase, len(durations), sum(durations),
+                                    percentile(durations, 0.5), percentile(durations, 0.95), durations[-1]))
+        return sorted(stats, key=lambda s: s.total, reverse=True)
+
+    def slowest_players(self, k: int = SLOWEST_PLAYERS) -> List[tuple[str, float]]:
+        return sorted(self.players.items(), key=lambda p: p[1], reverse=True)[:k]
+
+
+current_cycle: ContextVar[Optional[CycleTrace]] = ContextVar(
+    'current_cycle', default=None)
+recent_cycles: deque[CycleTrace] = deque(maxlen=RECENT_CYCLES)
+
+
+def current() -> Optional[CycleTrace]:
+    return current_cycle.get()
+
+
+@contextmanager
+def span(phase: str, trace: Optional[CycleTrace] = None) -> Iterator[None]:
+    '''Times the block as part of a phase of the current cycle (or the given one)'''
+    trace = trace or current_cycle.get()
+    if trace is None:
+        yield
+        return
+
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        trace.record(phase, perf_counter() - start)
+
+
+@contextmanager
+def player(puuid: str) -> Iterator[None]:
+    '''Adds the time spent in the block to the player's total for the current cycle'''
+    trace = current_cycle.get()
+    if trace is None:
+        yield
+        return
+
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        trace.players[puuid] = trace.players.get(puuid, 0) + \
+            perf_counter() - start
+
+
+@contextmanager
+def cycle(name: str, player_name: Callable[[str], str] = str) -> Iterator[CycleTrace]:
+    '''
+    Traces everything run in the block, including tasks it starts, as one cycle. The cycle
+    is kept with the recent ones and its summary is logged when it ends.
+    '''
+    trace = CycleTrace(name, time())
+    token = current_cycle.set(trace)
+    start = perf_counter()
+    try:
+        yield trace
+    finally:
+        trace.duration = perf_counter() - start
+        current_cycle.reset(token)
+        recent_cycles.append(trace)
+        log(summary(trace, player_name), source='main.tracing')
+
+
+def recent() -> List[CycleTrace]:
+    return list(recent_cycles)
+
+
+def fmt_duration(seconds: float) -> str:
+    return f'{seconds * 1000:.1f}ms' if seconds < 1 else f'{seconds:.2f}s'
+
+
+def summary(trace: CycleTrace, player_name: Callable[[str], str] = str) -> str:
+    lines = [f'Cycle [{trace.name}] took {fmt_duration(trace.duration or 0)}']
+    for s in trace.stats():
+        lines.append(f'  {s.phase}: {s.count}x, total {fmt_duration(s.total)}, p50 {
+            fmt_duration(s.p50)}, p95 {fmt_duration(s.p95)}, max {fmt_duration(s.max)}')
+
+    if slowest := trace.slowest_players():
+        lines.append('  slowest players: ' + ', '.join(
+            f'{player_name(puuid)} ({fmt_duration(elapsed)})' for puuid, elapsed in slowest))
+    return '\n'.join(lines)
@@ -154,22 +154,42 @@ def print_header():
 
 def find_all_swaps[T](old: List[T], new: List[T]) -> List[tuple[int, T, T]]:
     """
-    Finds the position changes between two ordered lists of items. The algorithm is not
-    perfect, but it works for cases with small numbers of swaps there is not a lot of mobility.
+    Finds every pair of items whose order differs between two rankings, i.e. each time an
+    item has overtaken one that used to be above it. The pairs are the inversions of the new
+    ranking relative to the old one, which are collected while merge sorting it, so this
+    runs in O(n log n + k) for k overtakes. Items that aren't in both rankings are ignored.
 
-    Returns: [(position, old, new)]
+    Returns: [(position, old, new)], where new has overtaken old and position is where old
+    used to be. Overtakes are ordered by the new position of the overtaking item.
     """
-    swaps = []
-
-    for i, y in enumerate(new):
-        if i >= old.index(y):
-            continue
-
-        subswaps = []
-        for i2, x in zip(range(i, len(old)), old[i:]):
-            if x == y:
-                break
-            subswaps.append((i2, x, y))
-        swaps.extend(reversed(subswaps))
-
-    return swaps
+    old_pos = {x: i for i, x in enumerate(old)}
+    ranking = [(old_pos[y], i) for i, y in enumerate(new) if y in old_pos]
+
+    # Each pair is (new position of overtaking item, negated old position of overtaken item)
+    pairs: List[tuple[int, int]] = []
+
+    def sort(items: List[tuple[int, int]]) -> List[tuple[int, int]]:
+        if len(items) <= 1:
+            return items
+
+        middle = len(items) // 2
+        left, right = sort(items[:middle]), sort(items[middle:])
+
+        merged = []
+        i = j = 0
+        while i < len(left) and j < len(right):
+            if left[i][0] < right[j][0]:
+                merged.append(left[i])
+                i += 1
+            else:
+                # Everything left in the first half was behind this item and is now ahead
+                pairs.extend((l[1], -right[j][0]) for l in left[i:])
+                merged.append(right[j])
+                j += 1
+        merged.extend(left[i:])
+        merged.extend(right[j:])
+        return merged
+
+    sort(ranking)
+    pairs.sort()
+    return [(-pos, old[-pos], new[i]) for i, pos in pairs]
@@ -0,0 +1,102 @@
+import asyncio
+import sys
+import threading
+import traceback
+from time import monotonic
+from typing import Iterable, Optional
+from logs import log
+import metrics
+
+TICK = 0.1
+# The loop counts as blocked once a tick is this late
+LAG_THRESHOLD = 0.25
+# At most one stack is logged per this many seconds, the rest are only counted
+LOG_INTERVAL = 60
+
+
+class LoopWatchdog:
+    '''
+    Measures how late the event loop runs a task that wakes up every tick. A separate thread
+    watches the ticks, and when they stop for longer than the threshold it captures what the
+    loop's thread is running at that moment, which is the call blocking the loop.
+    '''
+
+    def __init__(self, threshold: float = LAG_THRESHOLD, tick: float = TICK) -> None:
+        self.threshold = threshold
+        self.tick = tick
+        self.last_tick = monotonic()
+        self.lag = 0.0
+        self.max_lag = 0.0
+        self.stalls = 0
+        self.blocked_seconds = 0.0
+        self.suppressed = 0
+        self.last_logged: Optional[float] = None
+        self.stalled_since: Optional[float] = None
+        self.loop_thread_id: Optional[int] = None
+        self.task: Optional[asyncio.Task] = None
+        self.thread: Optional[threading.Thread] = None
+        self.stopped = threading.Event()
+
+    def start(self) -> None:
+        if self.task is not None:
+            return
+        self.loop_thread_id = threading.get_ident()
+        self.last_tick = monotonic()
+        self.task = asyncio.create_task(self.ticker())
+        self.thread = threading.Thread(target=self.watch, name='loop-watchdog',
+                                       daemon=True)
+        self.thread.start()
+        metrics.add_collector(self.metrics)
+
+    def stop(self) -> None:
+        self.stopped.set()
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    async def ticker(self) -> None:
+        while True:
+            expected = monotonic() + self.tick
+            await asyncio.sleep(self.tick)
+            now = monotonic()
+            self.lag = max(now - expected, 0)
+            self.max_lag = max(self.max_lag, self.lag)
+            if self.lag > self.threshold:
+                self.blocked_seconds += self.lag
+            self.last_tick = now
+
+    def watch(self) -> None:
+        '''Runs on the watchdog thread'''
+        while not self.stopped.wait(self.tick / 2):
+            late = monotonic() - self.last_tick - self.tick
+            if late <= self.threshold:
+                self.stalled_since = None
+                continue
+            if self.stalled_since is not None:
+                continue
+
+            # Only the first look at each stall is reported, that's where it's blocked
+            self.stalled_since = self.last_tick
+            self.stalls += 1
+            self.report(late)
+
+    def report(self, late: float) -> None:
+        now = monotonic()
+        if self.last_logged is not None and now - self.last_logged < LOG_INTERVAL:
+            self.suppressed += 1
+            return
+
+        frame = sys._current_frames().get(self.loop_thread_id or -1)
+        stack = ''.join(traceback.format_stack(frame)) if frame else 'Unknown\n'
+        skipped = f' ({self.suppressed} more stalls since the last report)' \
+            if self.suppressed else ''
+        log(f'Event loop blocked for over {late * 1000:.0f}ms{skipped}, it is running:\n{stack.rstrip()}',
+            'WARNING', 'main.watchdog')
+        self.last_logged = now
+        self.suppressed = 0
+
+    def metrics(self) -> Iterable[metrics.Metric]:
+        yield metrics.Metric('event_loop_lag_seconds', 'How late the last watchdog tick ran').add(self.lag)
+        yield metrics.Metric('event_loop_max_lag_seconds', 'Longest the event loop has been blocked').add(self.max_lag)
+        yield metrics.Metric('event_loop_stalls_total', 'Times the event loop was blocked past the threshold', 'counter').add(self.stalls)
+        yield metrics.Metric('event_loop_blocked_seconds_total', 'Time spent blocked past the threshold', 'counter').add(self.blocked_seconds)